@@ -1,4 +1,5 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Response, stream_with_context
 import pandas as pd
 from datetime import datetime, timedelta
 import os
@@ -6,33 +7,64 @@ from threading import Thread
 import time
 import logging
 import calendar
+import functools
+import hashlib
+import uuid
 import json  # Add this import
 from flask import send_file
 import xlsxwriter
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 import io
 import pytz
+from config import Config
+from storage import open_storage
+from storage.atomic import atomic_path
+from storage.schema import ID_COLUMNS
+from services import member_status, sale_items, sales_rollups
+from services.exports import XLSX_MIMETYPE, iter_csv, write_xlsx, xlsx_file
+from services.backups import BackupEngine
+from services.bom import BillsOfMaterials
+from services.idempotency import MAX_KEY_LENGTH, IdempotencyKeys, InProgress, KeyReused
+from services.jobs import JobQueue
+from services.reports import SHEETS, ReportCache, sheet_chunks
+from services.scheduler import DailyScheduler
+from services.stock import OutOfStock, StockLedger
 
 
 app = Flask(__name__)
 timezone = pytz.timezone("Asia/Karachi")
 os.environ["TZ"] = "Asia/Karachi"
-app.secret_key = os.urandom(24)  # Changed secret key
+app.secret_key = Config.SECRET_KEY  # Set SECRET_KEY so every worker signs sessions alike
 app.permanent_session_lifetime = timedelta(minutes=30)
 
 logging.basicConfig(level=logging.DEBUG)
 
-# Create data directory and initialize Excel files
+# Create data directory and open the table storage
 if not os.path.exists('data'):
     os.makedirs('data')
 
+store = open_storage(Config.SQLALCHEMY_DATABASE_URI,
+                     cache_max_bytes=Config.TABLE_CACHE_MAX_BYTES,
+                     id_block_size=Config.ID_BLOCK_SIZE)
+
+# Monthly reports; months that have ended are computed once
+report_cache = ReportCache(store, os.path.join('data', '.reports'))
+
+# Report workbooks and receipt PDFs run as background jobs
+jobs = JobQueue(os.path.join('data', 'jobs.db'), os.path.join('data', '.jobs'),
+                workers=Config.JOB_WORKERS, logger=app.logger)
+
 # Add this to your init_excel_files function
 def init_excel_files():
     excel_files = {
-        # In the init_excel_files function, update the members.xlsx structure
-        'members.xlsx': {
+        'admin': {
+            'username': [], 'password': [], 'name': []
+        },
+        # In the init_excel_files function, update the members structure
+        'members': {
             'member_id': [], 
             'name': [], 
             'phone': [], 
@@ -50,7 +82,7 @@ def init_excel_files():
             'weight': [],
             'height': []
         },
-        'packages.xlsx': {
+        'packages': {
             'name': [], 
             'price': [], 
             'duration': [],
@@ -60,14 +92,15 @@ def init_excel_files():
             'steam_room': [],    # New column
             'timings': []
         },
-        'trainers.xlsx': {
+        'trainers': {
             'id': [], 'name': [], 'specialization': [], 'schedule': []
         },
-        'trainer_attendance.xlsx': {
+        'trainer_attendance': {
             'date': [], 'trainer_id': [], 'trainer_name': [], 
             'check_in': [], 'check_out': []
         },
-        'payments.xlsx': {
+        'payments': {
+            'id': [],
             'date': [], 
             'member_id': [], 
             'member_name': [], 
@@ -77,17 +110,17 @@ def init_excel_files():
             'comments': [],         # New column
             'status': []
         },
-        'receptionists.xlsx': {
+        'receptionists': {
             'username': [], 'password': [], 'name': [], 'phone': [], 
             'address': [], 'dob': [], 'age': [], 'gender': [], 
             'salary': [], 'next_of_kin_name': [], 'next_of_kin_phone': [],
             'privileges': []
         },
-        'attendance.xlsx': {
+        'attendance': {
             'date': [], 'member_id': [], 'member_name': [], 
             'check_in': [], 'check_out': []  # Added check_out
         },
-        'custom_products.xlsx': {
+        'custom_products': {
             'product_id': [],
             'product_name': [],
             'ingredients': [],
@@ -98,23 +131,113 @@ def init_excel_files():
             'final_price': [],
             'inventory_status': []
         },
-        'inventory.xlsx': {
+        'inventory': {
             'id': [], 'stock_type': [], 'servings': [], 'cost_per_serving': [],
             'profit_per_serving': [], 'other_charges': [], 'date_added': []
         },
-        'sales.xlsx': {
+        'sales': {
             'id': [], 'date': [], 'member_id': [], 'member_name': [], 'inventory_id': [], 
             'item_name': [], 'quantity': [], 'total_amount': [], 'payment_method': []
         },
         
     }
     
-    for filename, columns in excel_files.items():
-        filepath = f'data/{filename}'
-        if not os.path.exists(filepath):
-            pd.DataFrame(columns).to_excel(filepath, index=False)
+    for table, columns in excel_files.items():
+        store.init_table(table, list(columns))
 
 init_excel_files()
+member_status.ensure(store)
+
+# Sales take stock through the ledger, custom products through their compiled
+# ingredients; finish any sale a dead worker left half-applied
+boms = BillsOfMaterials(store)
+stock = StockLedger(store, boms)
+stock.ensure()
+sale_items.ensure(store)
+sales_rollups.ensure(store)
+
+# Sales and payments run once per client request key, however often it is sent
+idempotency = IdempotencyKeys(store, ttl=Config.IDEMPOTENCY_TTL_HOURS * 3600,
+                              stale=Config.IDEMPOTENCY_STALE_SECONDS)
+idempotency.ensure()
+app.jinja_env.globals['new_idempotency_key'] = lambda: uuid.uuid4().hex
+
+# Roll payment status forward and precompute the renewal lists each day
+scheduler = DailyScheduler(logger=app.logger)
+scheduler.add('member_status', lambda now: member_status.roll_forward(store, now))
+scheduler.add('idempotency_keys', lambda now: idempotency.prune(now))
+scheduler.start()
+
+# Run queued report and receipt jobs in every worker, including ones a dead worker left
+jobs.start()
+
+# Back up the tables that changed, from one worker per host
+backups = BackupEngine(store, os.path.join('data', 'backups'),
+                       tables=['admin', 'members', 'packages', 'trainers', 'trainer_attendance',
+                               'payments', 'receptionists', 'attendance', 'custom_products',
+                               'inventory', 'sales', 'sale_items', 'sales_rollups',
+                               'stock_ledger', 'idempotency_keys'],
+                       interval=Config.BACKUP_INTERVAL_MINUTES * 60,
+                       full_every=Config.BACKUP_FULL_EVERY_HOURS * 3600,
+                       keep_full=Config.BACKUP_KEEP_FULL, logger=app.logger,
+                       id_columns=ID_COLUMNS, on_restore=member_status.rebuild)
+backups.start()
+
+def _saved_response(result):
+    response = app.make_response(result)
+    return {'status': response.status_code, 'mimetype': response.mimetype,
+            'location': response.headers.get('Location'),
+            'body': response.get_data(as_text=True)}
+
+
+def _request_fingerprint():
+    fields = sorted((name, values) for name, values in request.form.to_dict(flat=False).items()
+                    if name != 'idempotency_key')
+    return hashlib.sha256(json.dumps([request.path, fields]).encode()).hexdigest()
+
+
+def idempotent(scope, resolve=None):
+    """Run the view once per ``Idempotency-Key`` header (or ``idempotency_key``
+    form field) and send its saved response again for repeats of the key.
+
+    ``resolve(ref)`` returns the view's response for the work a request
+    marked with ``idempotency.mark(ref)``, or None if it was not done.  A
+    key sent again with different form fields is answered with a 422."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'success': False, 'error': 'Invalid idempotency key'}), 400
+
+            def handler():
+                return _saved_response(view(*args, **kwargs))
+
+            def resolved(ref):
+                result = resolve(ref)
+                return None if result is None else _saved_response(result)
+
+            try:
+                saved, replayed = idempotency.run(f'{scope}:{key}', handler,
+                                                  resolved if resolve else None,
+                                                  _request_fingerprint())
+            except KeyReused:
+                return jsonify({'success': False,
+                                'error': 'This key was already used for a different request'}), 422
+            except InProgress:
+                return jsonify({'success': False,
+                                'error': 'This request is still being processed'}), 409
+            response = Response(saved['body'], status=saved['status'], mimetype=saved['mimetype'])
+            if saved['location']:
+                response.headers['Location'] = saved['location']
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        return wrapper
+    return decorator
+
 
 # Authentication routes
 @app.route('/')
@@ -132,10 +255,10 @@ def login_post():
     
     try:
         # Check admin login
-        admin_df = pd.read_excel('data/admin.xlsx')
+        admin_df = store.read('admin', columns=['username', 'password'])
         admin = admin_df[
-            (admin_df['username'].astype(str).str.lower() == str(username).lower()) & 
-            (admin_df['password'].astype(str) == str(password))
+            (admin_df['username'].str.lower() == str(username).lower()) & 
+            (admin_df['password'] == str(password))
         ]
         
         if not admin.empty:
@@ -145,10 +268,10 @@ def login_post():
             return redirect(url_for('admin_dashboard'))
         
         # Check staff login
-        receptionists = pd.read_excel('data/receptionists.xlsx')
+        receptionists = store.read('receptionists', columns=['username', 'password', 'privileges'])
         receptionist = receptionists[
-            (receptionists['username'].astype(str) == str(username)) & 
-            (receptionists['password'].astype(str) == str(password))
+            (receptionists['username'] == str(username)) & 
+            (receptionists['password'] == str(password))
         ]
         
         if not receptionist.empty:
@@ -177,8 +300,9 @@ def staff_dashboard():
     
     try:
         # Get staff details including privileges
-        staff_df = pd.read_excel('data/receptionists.xlsx')
-        staff = staff_df[staff_df['username'] == session['username']].iloc[0]
+        staff = store.find('receptionists', {'username': session['username']})
+        if staff is None:
+            raise ValueError(f"Staff member {session['username']} not found")
         
         # Convert privileges string to list properly
         privileges = []
@@ -189,7 +313,7 @@ def staff_dashboard():
         session['privileges'] = privileges
         
         return render_template('staff/dashboard.html',
-                             staff=staff.to_dict(),
+                             staff=staff,
                              privileges=privileges)
                              
     except Exception as e:
@@ -209,23 +333,23 @@ def admin_dashboard():
         return redirect(url_for('login'))
     
     try:
-        members_df = pd.read_excel('data/members.xlsx')
-        packages_df = pd.read_excel('data/packages.xlsx')
-        payments_df = pd.read_excel('data/payments.xlsx')
-        receptionists_df = pd.read_excel('data/receptionists.xlsx')
+        members_df = store.read('members', columns=['package'])
+        packages_df = store.read('packages', columns=['name'])
+        payments_df = store.read('payments', columns=['date', 'package', 'amount'])
+        receptionists_df = store.read('receptionists', columns=['username'])
         
         # Calculate statistics
         stats = {
             'total_members': len(members_df),
             'monthly_revenue': payments_df[
-                payments_df['date'].astype(str).str.startswith(datetime.now().strftime('%d-%m-%Y'))
+                payments_df['date'].str.startswith(datetime.now().strftime('%d-%m-%Y'), na=False)
             ]['amount'].sum(),
             'total_packages': len(packages_df),
             'total_receptionists': len(receptionists_df)
         }
         
         # Revenue by package
-        revenue_by_package = payments_df.groupby('package')['amount'].sum().to_dict()
+        revenue_by_package = payments_df.groupby('package', observed=True)['amount'].sum().to_dict()
         package_names = list(packages_df['name'])
         revenue_data = [revenue_by_package.get(pkg, 0) for pkg in package_names]
         
@@ -243,6 +367,26 @@ def admin_dashboard():
         flash('Error loading dashboard data')
         return redirect(url_for('login'))
 
+@app.route('/admin/storage/stats')
+def storage_stats():
+    if 'user_type' not in session or session['user_type'] != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(dict(store.stats(), scheduler=scheduler.stats(), reports=report_cache.stats(),
+                        jobs=jobs.stats(), backups=backups.stats(), stock=stock.stats(),
+                        boms=boms.stats(), idempotency=idempotency.stats()))
+
+@app.route('/api/renewals')
+def api_renewals():
+    if 'user_type' not in session:
+        return jsonify({'error': 'Access denied'}), 403
+    try:
+        days = max(request.args.get('days', 7, type=int), 0)
+        expired_today, expiring = member_status.expiring(store, days)
+        return jsonify({'days': days, 'expired_today': expired_today, 'expiring': expiring})
+    except Exception as e:
+        app.logger.error(f"Error fetching renewals: {e}")
+        return jsonify({'error': 'Could not load renewals'}), 500
+
 @app.route('/receptionist/dashboard')
 def receptionist_dashboard():
     if 'user_type' not in session or session['user_type'] != 'receptionist':
@@ -259,13 +403,13 @@ def view_members():
         return redirect(url_for('staff_dashboard'))
     
     try:
-        members_df = pd.read_excel('data/members.xlsx')
-        packages_df = pd.read_excel('data/packages.xlsx')
+        members_df = store.read('members')
+        packages_df = store.read('packages', columns=['name'])
         
         # Ensure member_id is included in the display
         if 'member_id' not in members_df.columns:
             members_df['member_id'] = range(1001, 1001 + len(members_df))
-            members_df.to_excel('data/members.xlsx', index=False)
+            store.write('members', members_df)
         
         # Convert members DataFrame to list of dictionaries for template
         members = members_df.to_dict('records')
@@ -286,22 +430,14 @@ def edit_member(member_id):
         return redirect(url_for('login'))
     
     try:
-        members_df = pd.read_excel('data/members.xlsx')
-        packages_df = pd.read_excel('data/packages.xlsx')
-        
-        # Convert member_id column to string and clean any NaN values
-        members_df['member_id'] = members_df['member_id'].fillna('').astype(str)
-        member_data = members_df[members_df['member_id'] == str(member_id)]
+        member = store.find('members', {'member_id': member_id})
         
-        if member_data.empty:
+        if member is None:
             flash('Member not found')
             return redirect(url_for('view_members'))
         
         if request.method == 'POST':
-            # Create a mask for the specific member
-            mask = members_df['member_id'] == str(member_id)
-            
-            # Update member information using the mask
+            # Update member information
             update_fields = {
                 'name': request.form.get('name'),
                 'phone': request.form.get('phone'),
@@ -317,15 +453,13 @@ def edit_member(member_id):
             }
             
             # Update all fields at once
-            for field, value in update_fields.items():
-                members_df.loc[mask, field] = value
-            
-            members_df.to_excel('data/members.xlsx', index=False)
+            store.update('members', {'member_id': member_id}, update_fields)
+            member_status.update_member(store, member_id)
             flash('Member updated successfully')
             return redirect(url_for('view_members'))
         
         # GET request - display edit form
-        member = member_data.iloc[0].to_dict()
+        packages_df = store.read('packages', columns=['name'])
         return render_template('edit_member.html', 
                              member=member,
                              packages=packages_df.to_dict('records'))
@@ -342,18 +476,9 @@ def delete_member(member_id):
         return redirect(url_for('login'))
     
     try:
-        members_df = pd.read_excel('data/members.xlsx')
-        
-        # Convert member_id column to string and clean any NaN values
-        members_df['member_id'] = members_df['member_id'].fillna('').astype(str)
-        
-        # Find the member to delete
-        member_mask = members_df['member_id'] == str(member_id)
-        
-        if any(member_mask):
-            # Delete the member
-            members_df = members_df[~member_mask]
-            members_df.to_excel('data/members.xlsx', index=False)
+        # Delete the member
+        if store.delete('members', {'member_id': member_id}):
+            member_status.delete_member(store, member_id)
             flash('Member deleted successfully')
         else:
             flash('Member not found')
@@ -372,14 +497,13 @@ def attendance():
     
     try:
         # Load members and attendance data
-        members_df = pd.read_excel('data/members.xlsx')
-        attendance_df = pd.read_excel('data/attendance.xlsx') if os.path.exists('data/attendance.xlsx') else pd.DataFrame()
+        members_df = store.read('members', columns=['member_id', 'name'])
         
         # Get today's date
         today = datetime.now().strftime('%d-%m-%Y')
         
-        # Filter today's attendance
-        today_attendance = attendance_df[attendance_df['date'] == today] if not attendance_df.empty else pd.DataFrame()
+        # Today's attendance (only this month's partition is read)
+        today_attendance = store.find_all('attendance', {'date': today})
         
         return render_template('attendance.html',
                              members=members_df.to_dict('records'),
@@ -397,22 +521,18 @@ def staff_attendance():
     
     try:
         # Load staff data
-        staff_df = pd.read_excel('data/receptionists.xlsx')
+        staff_df = store.read('receptionists', columns=['username', 'name', 'staff_type'])
         
-        # Initialize attendance file if doesn't exist
-        if not os.path.exists('data/trainer_attendance.xlsx'):
-            pd.DataFrame(columns=[
-                'date', 'trainer_id', 'trainer_name', 'staff_type', 'check_in', 'check_out'
-            ]).to_excel('data/trainer_attendance.xlsx', index=False)
-        
-        # Load attendance data
-        attendance_df = pd.read_excel('data/trainer_attendance.xlsx')
+        # Initialize attendance table if doesn't exist
+        store.init_table('trainer_attendance', [
+            'date', 'trainer_id', 'trainer_name', 'staff_type', 'check_in', 'check_out'
+        ])
         
         # Get today's date
         today = datetime.now(PKT).strftime('%d-%m-%Y')
         
-        # Filter today's attendance
-        today_attendance = attendance_df[attendance_df['date'] == today] if not attendance_df.empty else pd.DataFrame()
+        # Today's attendance (only this month's partition is read)
+        today_attendance = store.find_all('trainer_attendance', {'date': today})
         
         return render_template('staff_attendance.html',
                              staff=staff_df.to_dict('records'),
@@ -433,54 +553,50 @@ def mark_staff_attendance():
         action = request.form.get('staff_attendance_action')  # Changed to match template
         
         # Load necessary data
-        staff_df = pd.read_excel('data/receptionists.xlsx')
-        staff_member = staff_df[staff_df['username'] == staff_id].iloc[0]
-        
-        # Initialize or load attendance file
-        if not os.path.exists('data/trainer_attendance.xlsx'):
-            attendance_df = pd.DataFrame(columns=[
-                'date', 'trainer_id', 'trainer_name', 'staff_type', 'check_in', 'check_out'
-            ])
-        else:
-            attendance_df = pd.read_excel('data/trainer_attendance.xlsx')
+        staff_member = store.find('receptionists', {'username': staff_id})
+        if staff_member is None:
+            raise ValueError(f"Staff member {staff_id} not found")
+        
+        # Initialize attendance table if it doesn't exist
+        store.init_table('trainer_attendance', [
+            'date', 'trainer_id', 'trainer_name', 'staff_type', 'check_in', 'check_out'
+        ])
         
         # Get current time
         current_date = datetime.now(PKT).strftime('%d-%m-%Y')
         current_time = datetime.now(PKT).strftime('%H:%M:%S')
         
         # Check today's attendance
-        today_record = attendance_df[
-            (attendance_df['trainer_id'] == staff_id) & 
-            (attendance_df['date'] == current_date)
-        ]
+        today_key = {'trainer_id': staff_id, 'date': current_date}
+        today_record = store.find('trainer_attendance', today_key)
         
         if action == 'check_in':
-            if not today_record.empty and pd.notna(today_record.iloc[0]['check_in']):
+            if today_record is not None and pd.notna(today_record['check_in']):
                 flash(f'Staff member {staff_member["name"]} has already checked in today')
             else:
                 new_record = {
                     'date': current_date,
                     'trainer_id': staff_id,
                     'trainer_name': staff_member['name'],
-                    'staff_type': staff_member['staff_type'],
+                    'staff_type': staff_member.get('staff_type'),
                     'check_in': current_time,
                     'check_out': None
                 }
-                attendance_df = pd.concat([attendance_df, pd.DataFrame([new_record])], ignore_index=True)
-                flash(f'Check-in recorded for {staff_member["name"]}')
+                if store.append('trainer_attendance', new_record, unique=['trainer_id', 'date']):
+                    flash(f'Check-in recorded for {staff_member["name"]}')
+                else:
+                    flash(f'Staff member {staff_member["name"]} has already checked in today')
         
         elif action == 'check_out':
-            if today_record.empty:
+            if today_record is None:
                 flash(f'Staff member {staff_member["name"]} has not checked in today')
-            elif pd.notna(today_record.iloc[0]['check_out']):
+            elif pd.notna(today_record['check_out']):
                 flash(f'Staff member {staff_member["name"]} has already checked out today')
-            else:
-                mask = (attendance_df['trainer_id'] == staff_id) & (attendance_df['date'] == current_date)
-                attendance_df.loc[mask, 'check_out'] = current_time
+            elif store.update('trainer_attendance', dict(today_key, check_out=None),
+                              {'check_out': current_time}):
                 flash(f'Check-out recorded for {staff_member["name"]}')
-        
-        # Save attendance records
-        attendance_df.to_excel('data/trainer_attendance.xlsx', index=False)
+            else:
+                flash(f'Staff member {staff_member["name"]} has already checked out today')
         
     except Exception as e:
         app.logger.error(f"Error marking staff attendance: {str(e)}")
@@ -497,15 +613,10 @@ def mark_attendance():
         return redirect(url_for('login'))
     
     try:
-        # Initialize attendance file if it doesn't exist
-        if not os.path.exists('data/attendance.xlsx'):
-            pd.DataFrame(columns=[
-                'date', 'member_id', 'member_name', 'check_in', 'check_out'
-            ]).to_excel('data/attendance.xlsx', index=False)
-        
-        # Load data
-        attendance_df = pd.read_excel('data/attendance.xlsx')
-        members_df = pd.read_excel('data/members.xlsx')
+        # Initialize attendance table if it doesn't exist
+        store.init_table('attendance', [
+            'date', 'member_id', 'member_name', 'check_in', 'check_out'
+        ])
         
         # Get form data
         member_id = str(request.form.get('member_id'))
@@ -514,30 +625,21 @@ def mark_attendance():
         current_time = datetime.now(PKT).strftime('%H:%M:%S')
         
         # Find member
-        members_df['member_id'] = members_df['member_id'].astype(str)
-        member = members_df[members_df['member_id'] == member_id]
+        member = store.find('members', {'member_id': member_id})
         
-        if member.empty:
+        if member is None:
             flash('Member not found')
             return redirect(url_for('attendance'))
-            
-        member = member.iloc[0]
-        
-        # Convert attendance member_id to string for comparison
-        attendance_df['member_id'] = attendance_df['member_id'].astype(str)
-        attendance_df['date'] = attendance_df['date'].astype(str)
         
         # Get today's attendance record
-        today_record = attendance_df[
-            (attendance_df['member_id'] == member_id) & 
-            (attendance_df['date'] == current_date)
-        ]
+        today_key = {'member_id': member_id, 'date': current_date}
+        today_record = store.find('attendance', today_key)
         
         if action == 'check_in':
-            if not today_record.empty and pd.notna(today_record.iloc[0]['check_in']):
+            if today_record is not None and pd.notna(today_record['check_in']):
                 flash(f'Member {member["name"]} has already checked in today')
                 return redirect(url_for('attendance'))
-            
+        
             # Create new attendance record
             new_record = {
                 'date': current_date,
@@ -546,25 +648,27 @@ def mark_attendance():
                 'check_in': current_time,
                 'check_out': None
             }
-            attendance_df = pd.concat([attendance_df, pd.DataFrame([new_record])], ignore_index=True)
+            if not store.append('attendance', new_record, unique=['member_id', 'date']):
+                flash(f'Member {member["name"]} has already checked in today')
+                return redirect(url_for('attendance'))
             flash(f'Check-in recorded for {member["name"]}')
-            
+        
         elif action == 'check_out':
-            if today_record.empty:
+            if today_record is None:
                 flash(f'Member {member["name"]} has not checked in today')
                 return redirect(url_for('attendance'))
-                
-            if pd.notna(today_record.iloc[0]['check_out']):
+            
+            if pd.notna(today_record['check_out']):
                 flash(f'Member {member["name"]} has already checked out today')
                 return redirect(url_for('attendance'))
-            
+        
             # Update check-out time
-            mask = (attendance_df['member_id'] == member_id) & (attendance_df['date'] == current_date)
-            attendance_df.loc[mask, 'check_out'] = current_time
+            if not store.update('attendance', dict(today_key, check_out=None),
+                                {'check_out': current_time}):
+                flash(f'Member {member["name"]} has already checked out today')
+                return redirect(url_for('attendance'))
             flash(f'Check-out recorded for {member["name"]}')
         
-        # Save updated attendance records
-        attendance_df.to_excel('data/attendance.xlsx', index=False)
         return redirect(url_for('attendance'))
         
     except Exception as e:
@@ -583,7 +687,7 @@ def packages():
         return redirect(url_for('staff_dashboard'))
     
     try:
-        packages_df = pd.read_excel('data/packages.xlsx')
+        packages_df = store.read('packages')
         return render_template('packages.html', 
                              packages=packages_df.to_dict('records'),
                              is_admin=session['user_type'] == 'admin')
@@ -603,7 +707,6 @@ def add_package():
         return redirect(url_for('staff_dashboard'))
     
     try:
-        packages_df = pd.read_excel('data/packages.xlsx')
         new_package = {
             'name': request.form.get('name'),
             'price': float(request.form.get('price')),
@@ -615,8 +718,8 @@ def add_package():
             'timings': request.form.get('timings')
         }
         
-        packages_df = pd.concat([packages_df, pd.DataFrame([new_package])], ignore_index=True)
-        packages_df.to_excel('data/packages.xlsx', index=False)
+        store.append('packages', new_package)
+        member_status.refresh_package(store, new_package['name'])
         flash('Package added successfully')
     except Exception as e:
         app.logger.error(f"Error adding package: {e}")
@@ -635,9 +738,8 @@ def delete_package(name):
         return redirect(url_for('staff_dashboard'))
     
     try:
-        packages_df = pd.read_excel('data/packages.xlsx')
-        packages_df = packages_df[packages_df['name'] != name]
-        packages_df.to_excel('data/packages.xlsx', index=False)
+        store.delete('packages', {'name': name})
+        member_status.refresh_package(store, name)
         flash('Package deleted successfully')
     except Exception as e:
         app.logger.error(f"Error deleting package: {e}")
@@ -658,27 +760,26 @@ def edit_package(name):
         return redirect(url_for('staff_dashboard'))
     
     try:
-        packages_df = pd.read_excel('data/packages.xlsx')
-        package_row = packages_df[packages_df['name'] == name]
+        package = store.find('packages', {'name': name})
         
-        if package_row.empty:
+        if package is None:
             flash('Package not found')
             return redirect(url_for('packages'))
             
         if request.method == 'POST':
-            packages_df.loc[packages_df['name'] == name, 'price'] = float(request.form.get('price'))
-            packages_df.loc[packages_df['name'] == name, 'duration'] = int(request.form.get('duration'))
-            packages_df.loc[packages_df['name'] == name, 'trainers'] = request.form.get('trainers')
-            packages_df.loc[packages_df['name'] == name, 'cardio_access'] = request.form.get('cardio_access')
-            packages_df.loc[packages_df['name'] == name, 'sauna_access'] = request.form.get('sauna_access')
-            packages_df.loc[packages_df['name'] == name, 'steam_room'] = request.form.get('steam_room')
-            packages_df.loc[packages_df['name'] == name, 'timings'] = request.form.get('timings')
-            
-            packages_df.to_excel('data/packages.xlsx', index=False)
+            store.update('packages', {'name': name}, {
+                'price': float(request.form.get('price')),
+                'duration': int(request.form.get('duration')),
+                'trainers': request.form.get('trainers'),
+                'cardio_access': request.form.get('cardio_access'),
+                'sauna_access': request.form.get('sauna_access'),
+                'steam_room': request.form.get('steam_room'),
+                'timings': request.form.get('timings')
+            })
+            member_status.refresh_package(store, name)
             flash('Package updated successfully')
             return redirect(url_for('packages'))
         
-        package = package_row.iloc[0].to_dict()
         return render_template('edit_package.html', package=package)
         
     except Exception as e:
@@ -694,48 +795,13 @@ def payments():
 
     try:
         # Load all required data
-        payments_df = pd.read_excel('data/payments.xlsx')
-        packages_df = pd.read_excel('data/packages.xlsx')
-        members_df = pd.read_excel('data/members.xlsx')
+        packages_df = store.read('packages', columns=['name', 'price'])
 
         # Create packages dictionary
         packages = dict(zip(packages_df['name'], packages_df['price']))
 
-        # Process payments data
-        payments_list = []
-        
-        # Process each member's payment status
-        for _, member in members_df.iterrows():
-            member_payments = payments_df[payments_df['member_id'].astype(str) == str(member['member_id'])]
-            
-            if not member_payments.empty:
-                latest_payment = member_payments.iloc[-1]
-                payment_dict = latest_payment.to_dict()
-                
-                # Calculate remaining days
-                if pd.notna(payment_dict.get('date')):
-                    payment_date = pd.to_datetime(payment_dict['date'], format='%d-%m-%Y')
-                    package_info = packages_df[packages_df['name'] == payment_dict['package']]
-                    if not package_info.empty:
-                        package_duration = int(package_info.iloc[0]['duration'])
-                        expiry_date = payment_date + pd.DateOffset(months=package_duration)
-                        remaining_days = (expiry_date - datetime.now()).days
-                        
-                        payment_dict['remaining_days'] = max(0, remaining_days)
-                        payment_dict['status'] = 'Pending' if remaining_days <= 0 else 'Paid'
-                        payments_list.append(payment_dict)
-            else:
-                # Add new member with pending status
-                payment_dict = {
-                    'date': datetime.now().strftime('%d-%m-%Y'),
-                    'member_id': str(member['member_id']),
-                    'member_name': member['name'],
-                    'package': member['package'],
-                    'amount': packages.get(member['package'], 0),
-                    'status': 'Pending',
-                    'remaining_days': 0
-                }
-                payments_list.append(payment_dict)
+        # Latest payment and remaining days for every member
+        payments_list = member_status.payment_rows(store)
 
         return render_template('payments.html',
                              payments=payments_list,
@@ -753,16 +819,13 @@ def payment_receipt(member_id, date):
         return redirect(url_for('login'))
         
     try:
-        payments_df = pd.read_excel('data/payments.xlsx')
-        
         # Find the specific payment
-        payment = payments_df[
-            (payments_df['member_id'].astype(str) == str(member_id)) & 
-            (payments_df['date'] == date)
-        ].iloc[0]
+        payment = store.find('payments', {'member_id': member_id, 'date': date})
+        if payment is None:
+            raise ValueError(f"Payment for member {member_id} on {date} not found")
         
         return render_template('payment_receipt.html',
-                             payment=payment.to_dict(),
+                             payment=payment,
                              date=date)
     except Exception as e:
         app.logger.error(f"Error generating receipt: {str(e)}")
@@ -771,50 +834,37 @@ def payment_receipt(member_id, date):
 
 @app.route('/payment/receipt/download/<member_id>/<date>')
 def download_payment_receipt(member_id, date):
-    try:
-        payments_df = pd.read_excel('data/payments.xlsx')
-        members_df = pd.read_excel('data/members.xlsx')
-        
-        # Find the specific payment
-        payment = payments_df[
-            (payments_df['member_id'].astype(str) == str(member_id)) & 
-            (payments_df['date'] == date)
-        ].iloc[0]
-        
-        # Get member details
-        member = members_df[members_df['member_id'].astype(str) == str(member_id)].iloc[0]
-        
-        # Create PDF
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        
-        # Add receipt content
-        p.drawString(100, 800, "Gym Management System - Payment Receipt")
-        p.drawString(100, 780, f"Date: {payment['date']}")
-        p.drawString(100, 760, f"Member ID: {member_id}")
-        p.drawString(100, 740, f"Member Name: {payment['member_name']}")
-        p.drawString(100, 720, f"Package: {payment['package']}")
-        p.drawString(100, 700, f"Package Amount: Rs. {payment['amount']}")
-        p.drawString(100, 680, f"Package Discount: {payment['package_discount']}%")
-        p.drawString(100, 660, f"Additional Cost: Rs. {payment['additional_cost']}")
-        p.drawString(100, 640, f"Additional Discount: {payment['additional_discount']}%")
-        p.drawString(100, 620, f"Total Amount: Rs. {payment['amount']}")
-        p.drawString(100, 600, f"Status: {payment['status']}")
-        p.drawString(100, 580, f"Comments: {payment['comments']}")
-        
-        p.save()
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'payment_receipt_{member_id}_{date}.pdf'
-        )
-    except Exception as e:
-        app.logger.error(f"Error downloading receipt: {str(e)}")
-        flash('Error downloading receipt')
-        return redirect(url_for('payments'))
+    if 'user_type' not in session:
+        return jsonify({'error': 'Access denied'}), 403
+    return submit_job('payment_receipt', {'member_id': member_id, 'date': date})
+
+
+def payment_receipt_job(args, result_path):
+    member_id, date = args['member_id'], args['date']
+    # Find the specific payment
+    payment = store.find('payments', {'member_id': member_id, 'date': date})
+    if payment is None:
+        raise ValueError(f"Payment for member {member_id} on {date} not found")
+    
+    # Create PDF
+    p = canvas.Canvas(result_path)
+    
+    # Add receipt content
+    p.drawString(100, 800, "Gym Management System - Payment Receipt")
+    p.drawString(100, 780, f"Date: {payment['date']}")
+    p.drawString(100, 760, f"Member ID: {member_id}")
+    p.drawString(100, 740, f"Member Name: {payment['member_name']}")
+    p.drawString(100, 720, f"Package: {payment['package']}")
+    p.drawString(100, 700, f"Package Amount: Rs. {payment['amount']}")
+    p.drawString(100, 680, f"Package Discount: {payment.get('package_discount')}%")
+    p.drawString(100, 660, f"Additional Cost: Rs. {payment['additional_cost']}")
+    p.drawString(100, 640, f"Additional Discount: {payment.get('additional_discount')}%")
+    p.drawString(100, 620, f"Total Amount: Rs. {payment['amount']}")
+    p.drawString(100, 600, f"Status: {payment['status']}")
+    p.drawString(100, 580, f"Comments: {payment['comments']}")
+    
+    p.save()
+    return f'payment_receipt_{member_id}_{date}.pdf', 'application/pdf'
 
 
 @app.route('/members/add', methods=['GET'])
@@ -823,7 +873,7 @@ def add_member_page():
         return redirect(url_for('login'))
     
     try:
-        packages_df = pd.read_excel('data/packages.xlsx')
+        packages_df = store.read('packages', columns=['name', 'price', 'duration'])
         return render_template('add_member.html', 
                              packages=packages_df.to_dict('records'),
                              datetime=datetime)  # Pass datetime to the template
@@ -842,14 +892,8 @@ def add_member():
                 flash(f'{field.replace("_", " ").title()} is required')
                 return redirect(url_for('add_member_page'))
 
-        members_df = pd.read_excel('data/members.xlsx')
-        
         # Generate unique member ID
-        if members_df.empty or 'member_id' not in members_df.columns:
-            next_id = 1001
-        else:
-            valid_ids = pd.to_numeric(members_df['member_id'], errors='coerce')
-            next_id = int(valid_ids.max() + 1) if not valid_ids.empty else 1001
+        next_id = store.next_id('members', 'member_id', start=1001)
         
         # Get join date from form or use current date as fallback
         join_date = request.form.get('join_date')
@@ -874,10 +918,8 @@ def add_member():
             'payment_status': 'Pending'
         }
         
-        # Create DataFrame with single row and concat
-        new_member_df = pd.DataFrame([new_member])
-        members_df = pd.concat([members_df, new_member_df], ignore_index=True)
-        members_df.to_excel('data/members.xlsx', index=False)
+        store.append('members', new_member)
+        member_status.add_member(store, new_member)
         flash('Member added successfully')
         
     except Exception as e:
@@ -894,7 +936,7 @@ def custom_product_page():
         return redirect(url_for('login'))
     
     try:
-        inventory_df = pd.read_excel('data/inventory.xlsx')
+        inventory_df = store.read('inventory')
         return render_template('custom_product.html', 
                              inventory=inventory_df.to_dict('records'),
                              staff_name=session.get('username'))
@@ -925,21 +967,8 @@ def add_custom_product():
         total_cost = sum(float(item['price']) * float(item['quantity']) for item in ingredients)
         profit = final_price - total_cost
 
-        # Create or load custom_products.xlsx
-        file_path = 'data/custom_products.xlsx'
-        os.makedirs('data', exist_ok=True)
-        
-        try:
-            custom_products_df = pd.read_excel(file_path)
-        except FileNotFoundError:
-            custom_products_df = pd.DataFrame(columns=[
-                'product_id', 'product_name', 'ingredients', 
-                'total_cost', 'final_price', 'profit',
-                'created_by', 'creation_date'
-            ])
-
         # Generate unique product ID
-        next_id = 1001 if custom_products_df.empty else int(custom_products_df['product_id'].max()) + 1
+        next_id = store.next_id('custom_products', 'product_id', start=1001)
 
         # Create new product entry
         new_product = {
@@ -953,9 +982,8 @@ def add_custom_product():
             'creation_date': datetime.now().strftime('%d-%m-%Y %H:%M:%S')
         }
 
-        # Add to DataFrame and save
-        custom_products_df = pd.concat([custom_products_df, pd.DataFrame([new_product])], ignore_index=True)
-        custom_products_df.to_excel(file_path, index=False)
+        # Save
+        store.append('custom_products', new_product)
         
         flash('Custom product added successfully')
         return redirect(url_for('custom_product_page'))
@@ -966,7 +994,15 @@ def add_custom_product():
         return redirect(url_for('custom_product_page'))
 
 
+def _payment_done(ref):
+    # ref is the payment id
+    if store.find('payments', {'id': int(ref)}) is None:
+        return None
+    return redirect(url_for('payments'))
+
+
 @app.route('/mark_payment_as_paid', methods=['POST'])
+@idempotent('mark_payment_as_paid', resolve=_payment_done)
 def mark_payment_as_paid():
     try:
         # Get form data
@@ -988,16 +1024,14 @@ def mark_payment_as_paid():
         # Total amount is sum of discounted package and discounted additional cost
         total_amount = final_package_amount + final_additional_cost
 
-        # Load payments and members data
-        payments_df = pd.read_excel('data/payments.xlsx')
-        members_df = pd.read_excel('data/members.xlsx')
-        
-        # Convert member_id to string for comparison
-        members_df['member_id'] = members_df['member_id'].astype(str)
-        member_data = members_df[members_df['member_id'] == str(member_id)].iloc[0]
+        # Load member data
+        member_data = store.find('members', {'member_id': member_id})
+        if member_data is None:
+            raise ValueError(f"Member {member_id} not found")
         
         # Create new payment record
         new_payment = {
+            'id': store.next_id('payments', 'id'),
             'member_id': member_id,
             'member_name': member_data['name'],
             'package': member_data['package'],
@@ -1012,8 +1046,9 @@ def mark_payment_as_paid():
         }
         
         # Add new payment record
-        payments_df = pd.concat([payments_df, pd.DataFrame([new_payment])], ignore_index=True)
-        payments_df.to_excel('data/payments.xlsx', index=False)
+        idempotency.mark(new_payment['id'])
+        store.append('payments', new_payment)
+        member_status.record_payment(store, new_payment)
         
         flash('Payment processed successfully')
         return redirect(url_for('payments'))
@@ -1043,16 +1078,14 @@ def manage_receptionists():
             flash('Access denied')
             return redirect(url_for('staff_dashboard'))
         
-        # Create file if it doesn't exist
-        if not os.path.exists('data/receptionists.xlsx'):
-            df = pd.DataFrame(columns=[
-                'username', 'password', 'name', 'phone', 'address', 
-                'dob', 'age', 'gender', 'salary', 'next_of_kin_name',
-                'next_of_kin_phone', 'privileges', 'staff_type'
-            ])
-            df.to_excel('data/receptionists.xlsx', index=False)
+        # Create table if it doesn't exist
+        store.init_table('receptionists', [
+            'username', 'password', 'name', 'phone', 'address', 
+            'dob', 'age', 'gender', 'salary', 'next_of_kin_name',
+            'next_of_kin_phone', 'privileges', 'staff_type'
+        ])
         
-        staff_df = pd.read_excel('data/receptionists.xlsx')
+        staff_df = store.read('receptionists')
         return render_template('admin/staff.html', 
                              staff=staff_df.to_dict('records'),
                              is_admin=session['user_type'] == 'admin',
@@ -1078,16 +1111,12 @@ def add_staff():
             flash('Access denied')
             return redirect(url_for('staff_dashboard'))
             
-        # Create file if it doesn't exist
-        if not os.path.exists('data/receptionists.xlsx'):
-            initial_df = pd.DataFrame(columns=[
-                'username', 'password', 'name', 'phone', 'address', 
-                'dob', 'age', 'gender', 'salary', 'next_of_kin_name',
-                'next_of_kin_phone', 'privileges', 'staff_type'
-            ])
-            initial_df.to_excel('data/receptionists.xlsx', index=False)
-        
-        receptionists_df = pd.read_excel('data/receptionists.xlsx')
+        # Create table if it doesn't exist
+        store.init_table('receptionists', [
+            'username', 'password', 'name', 'phone', 'address', 
+            'dob', 'age', 'gender', 'salary', 'next_of_kin_name',
+            'next_of_kin_phone', 'privileges', 'staff_type'
+        ])
         
         # Get form data
         username = request.form.get('username', '').strip()
@@ -1100,7 +1129,7 @@ def add_staff():
             return redirect(url_for('manage_receptionists'))
         
         # Check for duplicate username
-        if username in receptionists_df['username'].values:
+        if store.find('receptionists', {'username': username}) is not None:
             flash('Username already exists')
             return redirect(url_for('manage_receptionists'))
         
@@ -1130,9 +1159,7 @@ def add_staff():
         }
         
         # Add new staff member
-        receptionists_df = pd.concat([receptionists_df, pd.DataFrame([new_staff])], 
-                                   ignore_index=True)
-        receptionists_df.to_excel('data/receptionists.xlsx', index=False)
+        store.append('receptionists', new_staff)
         flash('Staff member added successfully')
         
     except Exception as e:
@@ -1153,15 +1180,13 @@ def edit_staff(username):
         return redirect(url_for('staff_dashboard'))
     
     try:
-        receptionists_df = pd.read_excel('data/receptionists.xlsx')
-        staff_data = receptionists_df[receptionists_df['username'] == username]
+        staff = store.find('receptionists', {'username': username})
         
-        if staff_data.empty:
+        if staff is None:
             flash('Staff member not found')
             return redirect(url_for('manage_receptionists'))
             
         if request.method == 'GET':
-            staff = staff_data.iloc[0].to_dict()
             # Convert privileges string to list, handling empty or None values
             if pd.isna(staff['privileges']) or staff['privileges'] == '':
                 staff['privileges'] = []
@@ -1182,7 +1207,6 @@ def edit_staff(username):
                 permissions.append(perm.replace('perm_', ''))
         
         # Update staff information
-        mask = receptionists_df['username'] == username
         update_fields = {
             'name': request.form.get('name'),
             'phone': request.form.get('phone'),
@@ -1197,10 +1221,7 @@ def edit_staff(username):
             'privileges': ','.join(permissions)
         }
         
-        for field, value in update_fields.items():
-            receptionists_df.loc[mask, field] = value
-        
-        receptionists_df.to_excel('data/receptionists.xlsx', index=False)
+        store.update('receptionists', {'username': username}, update_fields)
         flash('Staff member updated successfully')
         return redirect(url_for('manage_receptionists'))
         
@@ -1216,20 +1237,15 @@ def delete_receptionist(username):
         return redirect(url_for('login'))
     
     try:
-        if not os.path.exists('data/receptionists.xlsx'):
+        if not store.exists('receptionists'):
             flash('No staff records found')
             return redirect(url_for('manage_receptionists'))
         
-        receptionists_df = pd.read_excel('data/receptionists.xlsx')
-        
-        # Check if staff member exists
-        if username not in receptionists_df['username'].values:
+        # Delete staff member
+        if not store.delete('receptionists', {'username': username}):
             flash('Staff member not found')
             return redirect(url_for('manage_receptionists'))
         
-        # Delete staff member
-        receptionists_df = receptionists_df[receptionists_df['username'] != username]
-        receptionists_df.to_excel('data/receptionists.xlsx', index=False)
         flash('Staff member deleted successfully')
         
     except Exception as e:
@@ -1257,64 +1273,29 @@ def reports():
         if request.args.get('download'):
             return generate_monthly_report(selected_date)
             
-        year, month = map(int, selected_date.split('-'))
-        backup_file = os.path.join('data', 'gym_data_backup.xlsx')
-        
-        # Initialize variables
-        monthly_revenue = 0
-        monthly_sales_revenue = 0
-        staff_attendance_details = []
-        member_attendance_details = []
-        sales_details = []
-        payments_details = []
-        inventory_details = []
-        custom_products_details = []
-        packages_details = []
-        
-        with pd.ExcelFile(backup_file) as xls:
-            # Process each available sheet
-            for sheet_name in xls.sheet_names:
-                try:
-                    df = pd.read_excel(xls, sheet_name)
-                    if 'date' in df.columns:
-                        df['date'] = pd.to_datetime(df['date'])
-                        month_mask = (df['date'].dt.month == month) & (df['date'].dt.year == year)
-                        filtered_df = df[month_mask]
-                        
-                        if sheet_name == 'Member Attendance':
-                            member_attendance_details = filtered_df.to_dict('records')
-                        elif sheet_name == 'Staff Attendance':
-                            staff_attendance_details = filtered_df.to_dict('records')
-                        elif sheet_name == 'Sales':
-                            sales_details = filtered_df.to_dict('records')
-                            monthly_sales_revenue = filtered_df['total_amount'].sum() if not filtered_df.empty else 0
-                        elif sheet_name == 'Payments':
-                            payments_details = filtered_df.to_dict('records')
-                            monthly_revenue = filtered_df['amount'].sum() if not filtered_df.empty else 0
-                    else:
-                        # For sheets without dates, get all records
-                        if sheet_name == 'Inventory':
-                            inventory_details = df.to_dict('records')
-                        elif sheet_name == 'Custom Products':
-                            custom_products_details = df.to_dict('records')
-                        elif sheet_name == 'Packages':
-                            packages_details = df.to_dict('records')
-                            
-                except Exception as e:
-                    app.logger.error(f"Error processing sheet {sheet_name}: {str(e)}")
+        report = report_cache.month(selected_date)
+        page = max(request.args.get('page', 1, type=int), 1)
+        pages = max(report.pages(sheet) for sheet in
+                    ('Staff Attendance', 'Member Attendance', 'Sales'))
+
+        # Sales totals for the month from the daily rollups
+        month_start = datetime.strptime(selected_date, '%Y-%m').date()
+        last_day = calendar.monthrange(month_start.year, month_start.month)[1]
+        month_end = month_start.replace(day=last_day)
+        sales_summary = sales_rollups.summary(store, month_start, month_end)
+        monthly_sales_revenue = sales_summary['totals']['revenue']
 
         return render_template('reports.html',
                              selected_date=selected_date,
-                             monthly_revenue=monthly_revenue,
+                             monthly_revenue=report.totals['monthly_revenue'],
                              monthly_sales_revenue=monthly_sales_revenue,
-                             total_revenue=monthly_revenue + monthly_sales_revenue,
-                             staff_attendance_details=staff_attendance_details,
-                             member_attendance_details=member_attendance_details,
-                             sales_details=sales_details,
-                             payments_details=payments_details,
-                             inventory_details=inventory_details,
-                             custom_products_details=custom_products_details,
-                             packages_details=packages_details)
+                             total_revenue=report.totals['monthly_revenue'] + monthly_sales_revenue,
+                             sales_summary=sales_summary,
+                             page=page,
+                             pages=pages,
+                             staff_attendance_details=report.records('Staff Attendance', page),
+                             member_attendance_details=report.records('Member Attendance', page),
+                             sales_details=report.records('Sales', page))
 
     except Exception as e:
         app.logger.error(f"Error in reports: {str(e)}")
@@ -1325,45 +1306,69 @@ def reports():
 
 def generate_monthly_report(selected_date):
     try:
-        year, month = map(int, selected_date.split('-'))
-        backup_file = os.path.join('data', 'gym_data_backup.xlsx')
-        
-        # Create a new Excel file for the report
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            with pd.ExcelFile(backup_file) as xls:
-                for sheet_name in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet_name)
-                    
-                    if 'date' in df.columns:
-                        # Convert date column to datetime
-                        df['date'] = pd.to_datetime(df['date'])
-                        # Filter data for selected month
-                        month_mask = (df['date'].dt.month == month) & (df['date'].dt.year == year)
-                        filtered_df = df[month_mask]
-                        
-                        # Convert date back to string format before saving
-                        if not filtered_df.empty:
-                            if sheet_name == 'Sales':
-                                filtered_df['date'] = filtered_df['date'].dt.strftime('%d-%m-%Y %H:%M:%S')
-                            else:
-                                filtered_df['date'] = filtered_df['date'].dt.strftime('%d-%m-%Y')
-                        
-                        filtered_df.to_excel(writer, sheet_name=sheet_name, index=False)
-                    else:
-                        # For sheets without dates, include all data
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'gym_report_{selected_date}.xlsx'
-        )
+        datetime.strptime(selected_date, '%Y-%m')
+        return submit_job('monthly_report', {'month': selected_date,
+                                             'download_name': f'gym_report_{selected_date}.xlsx'})
         
     except Exception as e:
         app.logger.error(f"Error generating monthly report: {str(e)}")
+        return jsonify({'error': 'Failed to generate report'}), 400
+
+
+def monthly_report_job(args, result_path):
+    with open(result_path, 'wb') as handle:
+        write_xlsx(sheet_chunks(store, args['month']), handle)
+    return args['download_name'], XLSX_MIMETYPE
+
+
+def send_monthly_report(month, download_name):
+    """Stream ``month``'s report workbook, built in a temporary file."""
+    datetime.strptime(month, '%Y-%m')
+    return send_file(
+        xlsx_file(sheet_chunks(store, month)),
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=download_name
+    )
+
+
+@app.route('/reports/export/<month>.xlsx')
+def export_report_xlsx(month):
+    if 'user_type' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        return send_monthly_report(month, f'gym_report_{month}.xlsx')
+        
+    except Exception as e:
+        app.logger.error(f"Error exporting monthly report: {str(e)}")
+        flash('Error generating report')
+        return redirect(url_for('reports'))
+
+
+@app.route('/reports/export/<month>/<table>.csv')
+def export_report_csv(month, table):
+    if 'user_type' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        datetime.strptime(month, '%Y-%m')
+        dated = {name: is_dated for name, is_dated in SHEETS.values()}
+        if table not in dated:
+            flash('Unknown report table')
+            return redirect(url_for('reports'))
+        if dated[table]:
+            chunks = store.partition_chunks(table, month)
+        else:
+            chunks = store.read_chunks(table)
+        return Response(
+            stream_with_context(iter_csv(chunks)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=gym_{table}_{month}.csv'}
+        )
+        
+    except Exception as e:
+        app.logger.error(f"Error exporting {table} for {month}: {str(e)}")
         flash('Error generating report')
         return redirect(url_for('reports'))
 
@@ -1374,11 +1379,13 @@ def inventory():
         return redirect(url_for('login'))
     
     try:
-        inventory_df = pd.read_excel('data/inventory.xlsx')
-        custom_products_df = pd.read_excel('data/custom_products.xlsx')
+        inventory_df = store.read('inventory')
+        custom_products = store.read('custom_products').to_dict('records')
+        for product in custom_products:
+            product['ingredient_list'] = boms.ingredients(product['product_id'])
         return render_template('inventory.html', 
                              inventory=inventory_df.to_dict('records'),
-                             custom_products=custom_products_df.to_dict('records'))
+                             custom_products=custom_products)
     except Exception as e:
         app.logger.error(f"Error reading inventory file: {e}")
         flash('Error loading inventory data')
@@ -1390,9 +1397,8 @@ def add_inventory():
         return redirect(url_for('login'))
     
     try:
-        inventory_df = pd.read_excel('data/inventory.xlsx')
         new_item = {
-            'id': str(len(inventory_df) + 1),
+            'id': store.next_id('inventory', 'id'),
             'stock_type': request.form.get('stock_type'),
             'servings': int(request.form.get('servings')),
             'cost_per_serving': float(request.form.get('cost_per_serving')),
@@ -1401,8 +1407,7 @@ def add_inventory():
             'date_added': datetime.now().strftime('%d-%m-%Y')
         }
         
-        inventory_df = pd.concat([inventory_df, pd.DataFrame([new_item])], ignore_index=True)
-        inventory_df.to_excel('data/inventory.xlsx', index=False)
+        store.append('inventory', new_item)
         flash('Inventory item added successfully')
     except Exception as e:
         app.logger.error(f"Error adding inventory item: {e}")
@@ -1416,21 +1421,22 @@ def edit_inventory(item_id):
         return redirect(url_for('login'))
     
     try:
-        inventory_df = pd.read_excel('data/inventory.xlsx')
-        
         if request.method == 'POST':
-            inventory_df.loc[inventory_df['id'].astype(str) == str(item_id), 'stock_type'] = request.form.get('stock_type')
-            inventory_df.loc[inventory_df['id'].astype(str) == str(item_id), 'servings'] = int(request.form.get('servings'))
-            inventory_df.loc[inventory_df['id'].astype(str) == str(item_id), 'cost_per_serving'] = float(request.form.get('cost_per_serving'))
-            inventory_df.loc[inventory_df['id'].astype(str) == str(item_id), 'profit_per_serving'] = float(request.form.get('profit_per_serving'))
-            inventory_df.loc[inventory_df['id'].astype(str) == str(item_id), 'other_charges'] = float(request.form.get('other_charges'))
-            
-            inventory_df.to_excel('data/inventory.xlsx', index=False)
+            with stock.editing([item_id]):
+                store.update('inventory', {'id': item_id}, {
+                    'stock_type': request.form.get('stock_type'),
+                    'servings': int(request.form.get('servings')),
+                    'cost_per_serving': float(request.form.get('cost_per_serving')),
+                    'profit_per_serving': float(request.form.get('profit_per_serving')),
+                    'other_charges': float(request.form.get('other_charges'))
+                })
             flash('Inventory item updated successfully')
             return redirect(url_for('inventory'))
         
-        item = inventory_df[inventory_df['id'].astype(str) == str(item_id)].iloc[0]
-        return render_template('edit_inventory.html', item=item.to_dict())
+        item = store.find('inventory', {'id': item_id})
+        if item is None:
+            raise ValueError(f"Inventory item {item_id} not found")
+        return render_template('edit_inventory.html', item=item)
     except Exception as e:
         app.logger.error(f"Error editing inventory item: {e}")
         flash('Error updating inventory item')
@@ -1442,9 +1448,8 @@ def delete_inventory(item_id):
         return redirect(url_for('login'))
     
     try:
-        inventory_df = pd.read_excel('data/inventory.xlsx')
-        inventory_df = inventory_df[inventory_df['id'].astype(str) != str(item_id)]
-        inventory_df.to_excel('data/inventory.xlsx', index=False)
+        with stock.editing([item_id]):
+            store.delete('inventory', {'id': item_id})
         flash('Inventory item deleted successfully')
     except Exception as e:
         app.logger.error(f"Error deleting inventory item: {e}")
@@ -1468,13 +1473,15 @@ def sales():
             session['item_count'] = 1
 
         # Load data
-        inventory_df = pd.read_excel('data/inventory.xlsx')
-        sales_df = pd.read_excel('data/sales.xlsx')
+        inventory_df = store.read('inventory')
+        # Only the newest month partitions hold the last ten sales
+        recent_sales = store.tail('sales', 10)
         
         # Load custom products with explicit error handling
         custom_products = []
         try:
-            custom_products_df = pd.read_excel('data/custom_products.xlsx')
+            custom_products_df = store.read('custom_products',
+                                            ['product_id', 'product_name', 'final_price'])
             # Convert DataFrame to records and ensure all products are included
             custom_products = custom_products_df.fillna('').to_dict('records')
             print(f"Loaded {len(custom_products)} custom products")  # Debug print
@@ -1486,7 +1493,7 @@ def sales():
         return render_template('sales.html',
                              inventory=inventory_df.to_dict('records'),
                              custom_products=custom_products,
-                             recent_sales=sales_df.tail(10).to_dict('records'),
+                             recent_sales=recent_sales.to_dict('records'),
                              item_count=session.get('item_count', 1))
 
     except Exception as e:
@@ -1495,93 +1502,45 @@ def sales():
         return redirect(url_for('staff_dashboard'))
 
 
-@app.template_filter('from_json')
-def from_json(value):
-    return json.loads(value)
+def _sale_done(ref):
+    # ref is the sale id
+    if not stock.committed(int(ref)):
+        return None
+    return jsonify({'success': True, 'redirect': url_for('sales')})
 
 
 @app.route('/sales/add', methods=['POST'])
+@idempotent('add_sale', resolve=_sale_done)
 def add_sale():
     try:
-        # Load necessary data
-        sales_df = pd.read_excel('data/sales.xlsx') if os.path.exists('data/sales.xlsx') else pd.DataFrame()
-        inventory_df = pd.read_excel('data/inventory.xlsx')
-        custom_products_df = pd.read_excel('data/custom_products.xlsx')
-        
-        # Generate new sale ID
-        new_id = 1 if len(sales_df) == 0 else int(sales_df['id'].max()) + 1
-        
         # Get form data
         payment_method = request.form.get('payment_method')
         total_amount = float(request.form.get('total_amount').replace('Rs. ', ''))
         items_data = json.loads(request.form.get('items'))
         
-        # Process each item and update inventory
-        for item_id, item_details in items_data:
-            quantity = int(item_details['quantity'])
-            
-            if item_id.startswith('R_'):  # Regular inventory item
-                inventory_id = int(item_id.split('_')[1])
-                # Update inventory servings
-                mask = inventory_df['id'].astype(str) == str(inventory_id)
-                if not mask.any():
-                    raise Exception(f"Inventory item {inventory_id} not found")
-                
-                current_servings = inventory_df.loc[mask, 'servings'].iloc[0]
-                if current_servings < quantity:
-                    raise Exception(f"Insufficient stock for {item_details['name']}")
-                
-                inventory_df.loc[mask, 'servings'] = current_servings - quantity
-                
-            elif item_id.startswith('C_'):  # Custom product
-                product_id = int(item_id.split('_')[1])
-                custom_product = custom_products_df[custom_products_df['product_id'] == product_id].iloc[0]
-                ingredients = json.loads(custom_product['ingredients'])
-                
-                # Update inventory for each ingredient
-                for ingredient in ingredients:
-                    inv_id = ingredient['id']
-                    ing_quantity = float(ingredient['quantity']) * quantity
-                    
-                    mask = inventory_df['id'].astype(str) == str(inv_id)
-                    if not mask.any():
-                        raise Exception(f"Ingredient {inv_id} not found")
-                    
-                    current_servings = inventory_df.loc[mask, 'servings'].iloc[0]
-                    if current_servings < ing_quantity:
-                        raise Exception(f"Insufficient stock for ingredient in {item_details['name']}")
-                    
-                    inventory_df.loc[mask, 'servings'] = current_servings - ing_quantity
-        
-        # Save updated inventory
-        inventory_df.to_excel('data/inventory.xlsx', index=False)
-        
         # Create sale record
         new_sale = {
-            'id': new_id,
+            'id': store.next_id('sales', 'id'),
             'date': datetime.now(PKT).strftime('%d-%m-%Y %H:%M:%S'),
             'staff_name': session.get('username'),
             'total_amount': total_amount,
-            'payment_method': payment_method,
-            'items_details': json.dumps([{
-                'name': item[1]['name'],
-                'quantity': item[1]['quantity'],
-                'price': item[1]['price'],
-                'total': item[1]['subtotal']
-            } for item in items_data])
+            'payment_method': payment_method
         }
         
-        # Save sale record
-        if len(sales_df) == 0:
-            sales_df = pd.DataFrame(columns=['id', 'date', 'staff_name', 'total_amount', 'payment_method', 'items_details'])
-        sales_df = pd.concat([sales_df, pd.DataFrame([new_sale])], ignore_index=True)
-        sales_df.to_excel('data/sales.xlsx', index=False)
+        # Take the stock and save the sale record and its line items in one commit
+        idempotency.mark(new_sale['id'])
+        stock.sell(new_sale, items_data, sale_items.line_items(new_sale, items_data))
         
         return jsonify({
             'success': True,
             'redirect': url_for('sales')
         })
         
+    except OutOfStock as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         app.logger.error(f"Error in add_sale: {str(e)}")
         return jsonify({
@@ -1597,41 +1556,20 @@ def sales_report():
         return redirect(url_for('login'))
     
     try:
-        sales_df = pd.read_excel('data/sales.xlsx')
-        
-        # Convert date strings to datetime objects
-        sales_df['date'] = pd.to_datetime(sales_df['date'], format='%d-%m-%Y %H:%M:%S')
-        
         # Get date range from query parameters or use current date
         start_date = pd.to_datetime(request.args.get('start_date', datetime.now().strftime('%d-%m-%Y')), format='%d-%m-%Y')
         end_date = pd.to_datetime(request.args.get('end_date', datetime.now().strftime('%d-%m-%Y')), format='%d-%m-%Y')
         
-        # Filter sales by date range
-        filtered_sales = sales_df[
-            (sales_df['date'].dt.date >= start_date.date()) & 
-            (sales_df['date'].dt.date <= end_date.date())
-        ]
-        
-        # Process sales data for report
-        report_data = []
-        total_amount = 0
-        
-        for _, sale in filtered_sales.iterrows():
-            if sale['items_details']:
-                items = json.loads(sale['items_details'])
-                for item in items:
-                    report_data.append({
-                        'date': sale['date'],
-                        'product': item['name'],
-                        'quantity': item['quantity'],
-                        'price': item['price'],
-                        'total': item['total']
-                    })
-                    total_amount += item['total']
+        # Totals from the daily rollups, line items from their month partitions only
+        summary = sales_rollups.summary(store, start_date.date(), end_date.date())
+        lines = sale_items.items_between(store, start_date.date(), end_date.date())
+        report_data = lines.rename(columns={'name': 'product', 'unit_price': 'price',
+                                            'subtotal': 'total'}).to_dict('records')
         
         return render_template('sales_report.html',
                              report_data=report_data,
-                             total_amount=total_amount,
+                             summary=summary,
+                             total_amount=summary['totals']['revenue'],
                              start_date=start_date,
                              end_date=end_date)
     except Exception as e:
@@ -1640,55 +1578,75 @@ def sales_report():
         return redirect(url_for('sales'))
 
 
+@app.route('/sales/rollups')
+def sales_rollups_json():
+    if 'user_type' not in session:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        today = datetime.now(PKT).strftime('%d-%m-%Y')
+        start_date = datetime.strptime(request.args.get('start_date', today), '%d-%m-%Y')
+        end_date = datetime.strptime(request.args.get('end_date', start_date.strftime('%d-%m-%Y')),
+                                     '%d-%m-%Y')
+    except ValueError:
+        return jsonify({'error': 'Dates must be dd-mm-yyyy'}), 400
+    try:
+        return jsonify(sales_rollups.summary(store, start_date.date(), end_date.date()))
+    except Exception as e:
+        app.logger.error(f"Error loading sales rollups: {str(e)}")
+        return jsonify({'error': 'Failed to load sales totals'}), 500
+
+
 @app.route('/receipt/download', methods=['POST'])
 def download_receipt():
+    if 'user_type' not in session:
+        return jsonify({'error': 'Access denied'}), 403
     try:
-        receipt_id = request.form.get('receipt_id')
-        sales_df = pd.read_excel('data/sales.xlsx')
-        sale = sales_df[sales_df['id'] == int(receipt_id)].iloc[0]
-        items = json.loads(sale['items_details'])
-        
-        # Create PDF using reportlab
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        
-        # Add receipt content
-        p.drawString(100, 800, "Gym Management System")
-        p.drawString(100, 780, f"Receipt #{receipt_id}")
-        p.drawString(100, 760, f"Date: {sale['date']}")
-        p.drawString(100, 740, f"Staff: {sale['staff_name']}")
-        
-        y = 700
-        for item in items:
-            p.drawString(100, y, f"{item['name']} x{item['quantity']} - Rs. {item['total']}")
-            y -= 20
-            
-        p.drawString(100, y-20, f"Total Amount: Rs. {sale['total_amount']}")
-        p.drawString(100, y-40, f"Payment Method: {sale['payment_method']}")
-        
-        p.save()
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'receipt_{receipt_id}.pdf'
-        )
+        receipt_id = int(request.form.get('receipt_id') or request.args.get('receipt_id'))
+        return submit_job('sale_receipt', {'receipt_id': receipt_id})
     except Exception as e:
         app.logger.error(f"Error generating receipt PDF: {str(e)}")
         return jsonify({'error': 'Failed to generate receipt'}), 500
 
+
+def sale_receipt_job(args, result_path):
+    receipt_id = args['receipt_id']
+    sale = store.find('sales', {'id': receipt_id})
+    if sale is None:
+        raise ValueError(f"Sale {receipt_id} not found")
+    items = sale_items.receipt_items(store, sale)
+    
+    # Create PDF using reportlab
+    p = canvas.Canvas(result_path)
+    
+    # Add receipt content
+    p.drawString(100, 800, "Gym Management System")
+    p.drawString(100, 780, f"Receipt #{receipt_id}")
+    p.drawString(100, 760, f"Date: {sale['date']}")
+    p.drawString(100, 740, f"Staff: {sale['staff_name']}")
+    
+    y = 700
+    for item in items:
+        p.drawString(100, y, f"{item['name']} x{item['quantity']} - Rs. {item['total']}")
+        y -= 20
+        
+    p.drawString(100, y-20, f"Total Amount: Rs. {sale['total_amount']}")
+    p.drawString(100, y-40, f"Payment Method: {sale['payment_method']}")
+    
+    p.save()
+    return f'receipt_{receipt_id}.pdf', 'application/pdf'
+
 @app.route('/receipt/print', methods=['POST'])
 def print_receipt():
     try:
         receipt_id = request.form.get('receipt_id')
-        sales_df = pd.read_excel('data/sales.xlsx')
-        sale = sales_df[sales_df['id'] == int(receipt_id)].iloc[0]
-        items = json.loads(sale['items_details'])
+        sale = store.find('sales', {'id': int(receipt_id)})
+        if sale is None:
+            raise ValueError(f"Sale {receipt_id} not found")
+        items = sale_items.receipt_items(store, sale)
         
         return render_template('print_receipt.html', 
-                             sale=sale.to_dict(),
+                             sale=sale,
                              items=items)
     except Exception as e:
         app.logger.error(f"Error generating printable receipt: {str(e)}")
@@ -1698,15 +1656,16 @@ def print_receipt():
 @app.route('/receipt/<int:sale_id>')
 def view_receipt(sale_id):
     try:
-        # Load sales data
-        sales_df = pd.read_excel('data/sales.xlsx')
-        sale = sales_df[sales_df['id'] == sale_id].iloc[0]
+        # Load sale
+        sale = store.find('sales', {'id': sale_id})
+        if sale is None:
+            raise ValueError(f"Sale {sale_id} not found")
         
-        # Parse items from JSON string
-        items = json.loads(sale['items_details'])
+        # Line items of the sale
+        items = sale_items.receipt_items(store, sale)
         
         return render_template('receipt.html', 
-                             sale=sale.to_dict(),
+                             sale=sale,
                              items=items)
     except Exception as e:
         app.logger.error(f"Error viewing receipt: {str(e)}")
@@ -1729,19 +1688,17 @@ def change_password():
                 flash('New passwords do not match')
                 return redirect(url_for('change_password'))
             
-            # Load appropriate Excel file based on user type
-            file_path = 'data/admin.xlsx' if session['user_type'] == 'admin' else 'data/receptionists.xlsx'
-            df = pd.read_excel(file_path)
+            # Load appropriate table based on user type
+            table = 'admin' if session['user_type'] == 'admin' else 'receptionists'
             
             # Verify current password
-            user_row = df[df['username'] == session['username']]
-            if user_row.empty or user_row.iloc[0]['password'] != current_password:
+            user = store.find(table, {'username': session['username']})
+            if user is None or user['password'] != current_password:
                 flash('Current password is incorrect')
                 return redirect(url_for('change_password'))
             
             # Update password
-            df.loc[df['username'] == session['username'], 'password'] = new_password
-            df.to_excel(file_path, index=False)
+            store.update(table, {'username': session['username']}, {'password': new_password})
             
             flash('Password changed successfully')
             return redirect(url_for('admin_dashboard' if session['user_type'] == 'admin' else 'staff_dashboard'))
@@ -1758,138 +1715,41 @@ def change_password():
 # Define timezone
 PKT = pytz.timezone('Asia/Karachi')  # UTC+05:00
 
-# Update the create_backup function
-def create_backup():
-    try:
-        data_path = 'data'
-        backup_dir = os.path.join(data_path, 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        timestamp = datetime.now(PKT).strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(backup_dir, f'gym_data_backup_{timestamp}.xlsx')
-        latest_backup = os.path.join(data_path, 'gym_data_backup.xlsx')
-        
-        with pd.ExcelWriter(backup_file, engine='openpyxl') as writer:
-            # Members
-            try:
-                members_df = pd.read_excel(os.path.join(data_path, 'members.xlsx'))
-                members_df.to_excel(writer, sheet_name='Members', index=False)
-                app.logger.info("Successfully backed up members data")
-            except Exception as e:
-                app.logger.error(f"Error backing up members: {e}")
-                pd.DataFrame().to_excel(writer, sheet_name='Members', index=False)
-
-            # Member Attendance
-            try:
-                attendance_df = pd.read_excel(os.path.join(data_path, 'attendance.xlsx'))
-                if 'date' in attendance_df.columns:
-                    attendance_df['date'] = pd.to_datetime(attendance_df['date']).dt.strftime('%d-%m-%Y')
-                attendance_df.to_excel(writer, sheet_name='Member Attendance', index=False)
-                app.logger.info("Successfully backed up member attendance data")
-            except Exception as e:
-                app.logger.error(f"Error backing up member attendance: {e}")
-                pd.DataFrame(columns=['member_id', 'date', 'check_in', 'check_out']).to_excel(
-                    writer, sheet_name='Member Attendance', index=False)
-
-            # Staff Attendance
-            try:
-                trainer_attendance_df = pd.read_excel(os.path.join(data_path, 'trainer_attendance.xlsx'))
-                if 'date' in trainer_attendance_df.columns:
-                    trainer_attendance_df['date'] = pd.to_datetime(trainer_attendance_df['date']).dt.strftime('%d-%m-%Y')
-                trainer_attendance_df.to_excel(writer, sheet_name='Staff Attendance', index=False)
-                app.logger.info("Successfully backed up staff attendance data")
-            except Exception as e:
-                app.logger.error(f"Error backing up staff attendance: {e}")
-                pd.DataFrame(columns=['trainer_id', 'date', 'check_in', 'check_out']).to_excel(
-                    writer, sheet_name='Staff Attendance', index=False)
-
-            # Sales
-            try:
-                sales_df = pd.read_excel(os.path.join(data_path, 'sales.xlsx'))
-                if 'date' in sales_df.columns:
-                    sales_df['date'] = pd.to_datetime(sales_df['date']).dt.strftime('%d-%m-%Y %H:%M:%S')
-                sales_df.to_excel(writer, sheet_name='Sales', index=False)
-                app.logger.info("Successfully backed up sales data")
-            except Exception as e:
-                app.logger.error(f"Error backing up sales: {e}")
-                pd.DataFrame(columns=['id', 'date', 'staff_name', 'total_amount', 'payment_method', 'items_details']).to_excel(
-                    writer, sheet_name='Sales', index=False)
-
-            # Payments
-            try:
-                payments_df = pd.read_excel(os.path.join(data_path, 'payments.xlsx'))
-                if 'date' in payments_df.columns:
-                    payments_df['date'] = pd.to_datetime(payments_df['date']).dt.strftime('%d-%m-%Y')
-                payments_df.to_excel(writer, sheet_name='Payments', index=False)
-                app.logger.info("Successfully backed up payments data")
-            except Exception as e:
-                app.logger.error(f"Error backing up payments: {e}")
-                pd.DataFrame(columns=['member_id', 'member_name', 'package', 'amount', 'date', 'status']).to_excel(
-                    writer, sheet_name='Payments', index=False)
-
-            # Inventory
-            try:
-                inventory_df = pd.read_excel(os.path.join(data_path, 'inventory.xlsx'))
-                inventory_df.to_excel(writer, sheet_name='Inventory', index=False)
-                app.logger.info("Successfully backed up inventory data")
-            except Exception as e:
-                app.logger.error(f"Error backing up inventory: {e}")
-                pd.DataFrame().to_excel(writer, sheet_name='Inventory', index=False)
-
-            # Custom Products
-            try:
-                custom_products_df = pd.read_excel(os.path.join(data_path, 'custom_products.xlsx'))
-                custom_products_df.to_excel(writer, sheet_name='Custom Products', index=False)
-                app.logger.info("Successfully backed up custom products data")
-            except Exception as e:
-                app.logger.error(f"Error backing up custom products: {e}")
-                pd.DataFrame().to_excel(writer, sheet_name='Custom Products', index=False)
-
-            # Packages
-            try:
-                packages_df = pd.read_excel(os.path.join(data_path, 'packages.xlsx'))
-                packages_df.to_excel(writer, sheet_name='Packages', index=False)
-                app.logger.info("Successfully backed up packages data")
-            except Exception as e:
-                app.logger.error(f"Error backing up packages: {e}")
-                pd.DataFrame().to_excel(writer, sheet_name='Packages', index=False)
-
-            # Staff/Receptionists
-            try:
-                staff_df = pd.read_excel(os.path.join(data_path, 'receptionists.xlsx'))
-                staff_df.to_excel(writer, sheet_name='Staff', index=False)
-                app.logger.info("Successfully backed up staff data")
-            except Exception as e:
-                app.logger.error(f"Error backing up staff: {e}")
-                pd.DataFrame().to_excel(writer, sheet_name='Staff', index=False)
+jobs.register('monthly_report', monthly_report_job)
+jobs.register('payment_receipt', payment_receipt_job)
+jobs.register('sale_receipt', sale_receipt_job)
 
-        # Copy the backup file to latest_backup
-        import shutil
-        shutil.copy2(backup_file, latest_backup)
-        
-        app.logger.info(f"Backup created successfully at {datetime.now(PKT).strftime('%d-%m-%Y %H:%M:%S %Z')}")
-        
-    except Exception as e:
-        app.logger.error(f"Error creating backup: {str(e)}")
 
-def cleanup_old_backups(backup_dir):
-    try:
-        # Keep backups from last 7 days
-        cutoff_date = datetime.now() - timedelta(days=7)
-        
-        for backup_file in os.listdir(backup_dir):
-            if backup_file.startswith('gym_data_backup_'):
-                file_path = os.path.join(backup_dir, backup_file)
-                file_date = datetime.strptime(backup_file.split('_')[3].split('.')[0], '%Y%m%d')
-                
-                if file_date < cutoff_date:
-                    os.remove(file_path)
-                    
-    except Exception as e:
-        app.logger.error(f"Error cleaning up old backups: {str(e)}")
+def submit_job(kind, args):
+    """Queue a job and answer 202 with the URLs to poll it and fetch its file."""
+    job_id = jobs.submit(kind, args)
+    return jsonify({'job_id': job_id,
+                    'status_url': url_for('job_status', job_id=job_id),
+                    'result_url': url_for('job_result', job_id=job_id)}), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'user_type' not in session:
+        return jsonify({'error': 'Access denied'}), 403
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    if 'user_type' not in session:
+        return redirect(url_for('login'))
+    result = jobs.result(job_id)
+    if result is None:
+        flash('The file is not ready or has expired')
+        return redirect(url_for('reports'))
+    path, download_name, mimetype = result
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                     download_name=download_name)
 
-# Create backup immediately when server starts
-create_backup()
 
 
 @app.route('/download_report/<type>/<date>')
@@ -1898,36 +1758,8 @@ def download_report(type, date):
         return redirect(url_for('login'))
     
     try:
-        # Load data from backup file
-        backup_file = os.path.join('data', 'gym_data_backup.xlsx')
-        if not os.path.exists(backup_file):
-            flash('No backup data available')
-            return redirect(url_for('reports'))
-
-        # Create Excel file in memory
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            with pd.ExcelFile(backup_file) as xls:
-                # Process each sheet from backup
-                for sheet_name in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet_name)
-                    
-                    # Filter by date if the sheet has a date column
-                    if 'date' in df.columns:
-                        df['date'] = pd.to_datetime(df['date'])
-                        month_mask = df['date'].dt.strftime('%m-%Y') == date
-                        df = df[month_mask]
-                    
-                    # Write to new Excel file
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-        
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'gym_report_{date}.xlsx'
-        )
+        month = datetime.strptime(date, '%m-%Y').strftime('%Y-%m')
+        return send_monthly_report(month, f'gym_report_{date}.xlsx')
             
     except Exception as e:
         app.logger.error(f"Error generating report: {str(e)}")
@@ -1944,7 +1776,7 @@ if __name__ == '__main__':
 @app.route('/api/inventory')
 def api_inventory():
     try:
-        inventory_df = pd.read_excel('data/inventory.xlsx')
+        inventory_df = store.read('inventory')
         inventory_data = inventory_df.to_dict('records')
         return json.dumps(inventory_data)
     except Exception as e:
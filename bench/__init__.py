@@ -0,0 +1,6 @@
+"""Benchmarks behind the numbers quoted in the commit log.
+
+Each module builds synthetic data in a temporary directory and prints its
+timings; run them from the repository root, e.g.
+``python -m bench.index_lookups``.  They are not part of the test suite.
+"""
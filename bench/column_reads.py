@@ -0,0 +1,77 @@
+"""Full and projected reads of a large members workbook.
+
+    python -m bench.column_reads [--members 100000] [--cache-mb 50] [--snapshots]
+
+Writes a ``members.xlsx`` with every column of the schema, then times with
+a fresh Excel store each: a cold read of the whole table and of a
+projection (openpyxl parses every cell either way), warm reads of the
+whole table and of narrow projections, and reads of a projection when the
+cache is capped below the size of the full frame.  Arrow snapshots are off
+unless ``--snapshots`` is given, so cold reads parse the workbook.
+"""
+import argparse
+import tempfile
+import time
+
+import pandas as pd
+
+from storage.cache import frame_bytes
+from storage.excel import ExcelStorage
+from storage.schema import SCHEMAS
+
+
+PROJECTIONS = [['member_id', 'name'], ['package']]
+
+
+def members(count):
+    values = {column.name: [f'{column.name} {number % 1000}' for number in range(count)]
+              for column in SCHEMAS['members']}
+    values.update(member_id=range(1001, 1001 + count),
+                  gender=['Male', 'Female'] * (count // 2) + ['Male'] * (count % 2),
+                  package=[f'Package {number % 5}' for number in range(count)],
+                  status='Active', payment_status='Paid')
+    return pd.DataFrame(values)
+
+
+def timed(function, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--cache-mb', type=int, default=50,
+                        help='cache cap for the capped reads')
+    parser.add_argument('--snapshots', action='store_true')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        ExcelStorage(data_dir, snapshots=False).write('members', members(args.members))
+        store = lambda **kwargs: ExcelStorage(data_dir, snapshots=args.snapshots, **kwargs)
+
+        seconds, frame = timed(lambda: store().read('members'))
+        print(f'cold full read: {seconds:.2f} s, {frame_bytes(frame) / 2 ** 20:.1f} MB')
+        seconds, _ = timed(lambda: store().read('members', PROJECTIONS[0]))
+        print(f'cold read of {PROJECTIONS[0]}: {seconds:.2f} s')
+
+        warm = store()
+        warm.read('members')
+        seconds, _ = timed(lambda: warm.read('members'), repeat=20)
+        print(f'warm full read: {seconds * 1000:.1f} ms')
+        for columns in PROJECTIONS:
+            seconds, _ = timed(lambda: warm.read('members', columns), repeat=20)
+            print(f'warm read of {columns}: {seconds * 1000:.2f} ms')
+
+        capped = store(cache_max_bytes=args.cache_mb * 2 ** 20)
+        seconds, frame = timed(lambda: capped.read('members', PROJECTIONS[0]))
+        print(f'capped at {args.cache_mb} MB, first read of {PROJECTIONS[0]}: {seconds:.2f} s')
+        seconds, _ = timed(lambda: capped.read('members', PROJECTIONS[0]), repeat=20)
+        print(f'capped, next reads of {PROJECTIONS[0]}: {seconds * 1000:.2f} ms '
+              f'({frame_bytes(frame) / 2 ** 20:.1f} MB cached)')
+
+
+if __name__ == '__main__':
+    main()
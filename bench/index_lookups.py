@@ -0,0 +1,74 @@
+"""Indexed ``find`` against a scan, by table size.
+
+    python -m bench.index_lookups [--rows 1000,10000,100000] [--lookups 200]
+
+For each size an attendance table (30 members a day) is written to a
+temporary Excel store, then the same ``find`` calls on ``(date, member_id)``
+are made through the store's hash index and through a store without
+indexes, which scans the table.  The first indexed lookup, which builds the
+index, is timed on its own.
+"""
+import argparse
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from storage.excel import ExcelStorage
+
+
+MEMBERS_PER_DAY = 30
+
+
+def attendance(rows):
+    first = date(2020, 1, 1)
+    days = [(first + timedelta(days=number // MEMBERS_PER_DAY)).strftime('%d-%m-%Y')
+            for number in range(rows)]
+    members = [1001 + number % MEMBERS_PER_DAY for number in range(rows)]
+    return pd.DataFrame({'date': days, 'member_id': members, 'member_name': 'Member',
+                         'check_in': '08:00:00', 'check_out': '09:00:00'})
+
+
+def run(rows, lookups):
+    frame = attendance(rows)
+    wheres = [{'date': frame['date'].iloc[number], 'member_id': frame['member_id'].iloc[number]}
+              for number in random.Random(rows).choices(range(rows), k=lookups)]
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = ExcelStorage(data_dir, snapshots=False)
+        store.write('attendance', frame)
+        store.read('attendance')
+        scanning = ExcelStorage(data_dir, snapshots=False, indexes={})
+        scanning.read('attendance')
+
+        started = time.perf_counter()
+        store.find('attendance', wheres[0])
+        first = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for where in wheres:
+            assert store.find('attendance', where) is not None
+        indexed = (time.perf_counter() - started) / lookups
+
+        started = time.perf_counter()
+        for where in wheres:
+            assert scanning.find('attendance', where) is not None
+        scanned = (time.perf_counter() - started) / lookups
+    return first, indexed, scanned
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000,10000,100000',
+                        help='comma-separated table sizes')
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args(argv)
+    print(f"{'rows':>8} {'index build ms':>15} {'indexed ms':>11} {'scan ms':>8}")
+    for rows in (int(size) for size in args.rows.split(',')):
+        first, indexed, scanned = run(rows, args.lookups)
+        print(f'{rows:>8} {first * 1000:>15.1f} {indexed * 1000:>11.2f} {scanned * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""The /payments list: the old per-member loop against ``build_status``.
+
+    python -m bench.payments_list [--members 10000] [--payments 100000] [--skip-loop]
+
+Builds synthetic members, packages and payments (some payments without a
+date or on a package that no longer exists), times the loop the route ran
+before (one filter of the payments table per member) and
+:func:`services.member_status.build_status`, and checks that both give
+every member the same status and remaining days.  The loop takes minutes
+at the default sizes; ``--skip-loop`` times ``build_status`` alone.
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from services.member_status import build_status
+
+
+DURATIONS = {'Monthly': 1, 'Quarterly': 3, 'Yearly': 12}
+
+
+def synthetic(members, payments, seed=0):
+    rng = random.Random(seed)
+    packages = pd.DataFrame({'name': list(DURATIONS), 'price': [3000.0, 8000.0, 30000.0],
+                             'duration': list(DURATIONS.values())})
+    names = list(DURATIONS) + ['Retired']
+    member_ids = list(range(1001, 1001 + members))
+    members_df = pd.DataFrame({'member_id': member_ids,
+                               'name': [f'Member {number}' for number in member_ids],
+                               'package': [rng.choice(names) for _ in member_ids]})
+    payments_df = pd.DataFrame({
+        'member_id': [rng.choice(member_ids) for _ in range(payments)],
+        'member_name': 'Member',
+        'package': [rng.choice(names) for _ in range(payments)],
+        'amount': 3000.0,
+        'date': [None if rng.random() < 0.01 else
+                 f'{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.choice([2025, 2026])}'
+                 for _ in range(payments)],
+    })
+    return members_df, payments_df, packages
+
+
+def old_loop(members_df, payments_df, packages_df, now):
+    """The /payments route before the vectorized version, with ``now`` fixed."""
+    packages = dict(zip(packages_df['name'], packages_df['price']))
+    payments_list = []
+    for _, member in members_df.iterrows():
+        member_payments = payments_df[
+            payments_df['member_id'].astype(str) == str(member['member_id'])]
+        if not member_payments.empty:
+            payment_dict = member_payments.iloc[-1].to_dict()
+            if pd.notna(payment_dict.get('date')):
+                payment_date = pd.to_datetime(payment_dict['date'], format='%d-%m-%Y')
+                package_info = packages_df[packages_df['name'] == payment_dict['package']]
+                if not package_info.empty:
+                    expiry_date = payment_date + pd.DateOffset(
+                        months=int(package_info.iloc[0]['duration']))
+                    remaining_days = (expiry_date - now).days
+                    payment_dict['remaining_days'] = max(0, remaining_days)
+                    payment_dict['status'] = 'Pending' if remaining_days <= 0 else 'Paid'
+                    payments_list.append(payment_dict)
+        else:
+            payments_list.append({'member_id': str(member['member_id']),
+                                  'amount': packages.get(member['package'], 0),
+                                  'status': 'Pending', 'remaining_days': 0})
+    return payments_list
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--payments', type=int, default=100000)
+    parser.add_argument('--skip-loop', action='store_true')
+    args = parser.parse_args(argv)
+    members_df, payments_df, packages_df = synthetic(args.members, args.payments)
+    now = datetime.now()
+
+    started = time.perf_counter()
+    status = build_status(members_df, payments_df, packages_df, now)
+    print(f'build_status: {time.perf_counter() - started:.2f} s')
+    if args.skip_loop:
+        return
+
+    started = time.perf_counter()
+    rows = old_loop(members_df, payments_df, packages_df, now)
+    print(f'old loop: {time.perf_counter() - started:.2f} s')
+
+    expected = {str(row['member_id']): (row['status'], int(row['remaining_days'])) for row in rows}
+    shown = status[status['status'].notna()]
+    actual = {str(member_id): (state, int(days)) for member_id, state, days in
+              zip(shown['member_id'], shown['status'], shown['remaining_days'])}
+    print('same status and remaining days for every member:', expected == actual)
+
+
+if __name__ == '__main__':
+    main()
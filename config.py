@@ -7,9 +7,29 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=30)
     
     # Database settings
+    # excel:///data keeps one workbook per table in data/ (the default);
+    # sqlite:///data/gym.db switches to the SQLite (WAL) storage backend.
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///gym.db'
+        'excel:///data'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Upper bound for the per-process cache of parsed tables
+    TABLE_CACHE_MAX_BYTES = int(os.environ.get('TABLE_CACHE_MAX_MB') or 128) * 1024 * 1024
+    # IDs each worker reserves at a time; above 1, IDs from different
+    # workers interleave and a restart skips the unused rest of a block
+    ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE') or 1)
+    # Background jobs (reports, receipt PDFs) run at once across all
+    # workers; the rest wait in the queue
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    # Backups: the changed tables every interval, all of them every
+    # BACKUP_FULL_EVERY_HOURS; the last BACKUP_KEEP_FULL full ones are kept
+    BACKUP_INTERVAL_MINUTES = int(os.environ.get('BACKUP_INTERVAL_MINUTES') or 60)
+    BACKUP_FULL_EVERY_HOURS = int(os.environ.get('BACKUP_FULL_EVERY_HOURS') or 24)
+    BACKUP_KEEP_FULL = int(os.environ.get('BACKUP_KEEP_FULL') or 7)
+    # How long a sale or payment's idempotency key is remembered
+    IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS') or 24)
+    # After how long an unanswered sale or payment is taken over by a retry
+    # (longer than gunicorn's 30 second worker timeout)
+    IDEMPOTENCY_STALE_SECONDS = int(os.environ.get('IDEMPOTENCY_STALE_SECONDS') or 60)
     
     # Password hashing settings
     BCRYPT_LOG_ROUNDS = 12
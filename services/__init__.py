@@ -0,0 +1,7 @@
+"""Business logic the routes share, kept out of app.py so it can be reused
+and timed on its own: the materialized payment status and renewal lists,
+the monthly report cache and exports, the stock ledger for sales, their
+line items and running totals, the idempotency keys for the POS
+submissions, the background job queue, the incremental backups and the
+daily background jobs.
+"""
@@ -0,0 +1,306 @@
+"""Incremental backups of the data tables.
+
+A backup is a directory under ``backup_dir`` holding one gzipped JSON-lines
+file per stored table (each month partition is its own table, see
+:mod:`storage.partitions`) and a ``manifest.json``.  A *full* backup saves
+every table; a *delta* saves only the tables whose
+:meth:`~storage.base.Storage.version` changed since the previous backup.
+Every manifest lists all the tables as of that backup and the directory
+each one's file is in, so any backup restores on its own: the tables a
+delta did not save are read from the full backup, or the earlier delta,
+that did.
+
+Backups are taken by one process per host: the worker holding the lock on
+``backup_dir/.leader.lock``.  Every worker's thread tries for it on each
+wake-up and the lock dies with its holder, so another worker takes over if
+the leader exits.  The leader saves a delta every ``interval`` seconds when
+anything changed, a full backup every ``full_every`` seconds, and keeps the
+last ``keep_full`` full backups with their deltas.
+
+Tables derived from the others (``member_status`` and ``renewals``) are
+not saved: :meth:`BackupEngine.restore` rebuilds them with ``on_restore``
+once the tables are written back, and moves the ID sequences of
+``id_columns`` past the restored IDs.
+
+``python -m services.backups list`` lists the backups and
+``python -m services.backups restore <name> [uri]`` writes one back.
+"""
+import errno
+import fcntl
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from storage.journal import jsonable
+
+
+MANIFEST = 'manifest.json'
+
+
+def _file_name(name):
+    return f'{name}.jsonl.gz'
+
+
+def write_rows(chunks, path):
+    """Write ``chunks`` to ``path``: the column names, then one JSON list per row."""
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as handle:
+        header = False
+        for chunk in chunks:
+            if not header:
+                handle.write(json.dumps([str(column) for column in chunk.columns]) + '\n')
+                header = True
+            for values in chunk.itertuples(index=False, name=None):
+                handle.write(json.dumps([jsonable(value) for value in values]) + '\n')
+                rows += 1
+    return rows
+
+
+def read_rows(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        lines = iter(handle)
+        columns = json.loads(next(lines, '[]'))
+        return pd.DataFrame([json.loads(line) for line in lines], columns=columns)
+
+
+class BackupEngine:
+    def __init__(self, store, backup_dir, tables, interval=3600, full_every=24 * 3600,
+                 keep_full=7, logger=None, id_columns=None, on_restore=None):
+        self.store = store
+        self.backup_dir = backup_dir
+        self.tables = list(tables)
+        self.id_columns = id_columns or {}
+        self.on_restore = on_restore
+        self.interval = interval
+        self.full_every = full_every
+        self.keep_full = keep_full
+        self.logger = logger
+        self.leader = False
+        self.runs = 0
+        self.unchanged = 0
+        self.failures = 0
+        self.last = None
+        self._checked_at = 0
+        self._lock_fd = None
+        self._pid = None
+        self._guard = threading.Lock()
+        os.makedirs(backup_dir, exist_ok=True)
+
+    # Backups on disk -------------------------------------------------------
+
+    def backups(self):
+        """Manifests of the finished backups, oldest first."""
+        manifests = []
+        for name in sorted(os.listdir(self.backup_dir)):
+            try:
+                path = os.path.join(self.backup_dir, name, MANIFEST)
+                with open(path, encoding='utf-8') as handle:
+                    manifests.append(json.load(handle))
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                continue
+        manifests.sort(key=lambda manifest: manifest['created_at'])
+        return manifests
+
+    def _new_name(self, kind, now):
+        stamp = now.strftime('%Y%m%d_%H%M%S')
+        name, number = f'{stamp}_{kind}', 1
+        while os.path.exists(os.path.join(self.backup_dir, name)):
+            name, number = f'{stamp}_{kind}_{number}', number + 1
+        return name
+
+    # Taking a backup -------------------------------------------------------
+
+    def backup(self, full=False, now=None):
+        """Save the tables that changed since the last backup, or all of them.
+
+        Returns the new backup's manifest, or None when nothing changed.
+        """
+        now = datetime.now() if now is None else now
+        started = time.monotonic()
+        previous = self.backups()
+        latest = previous[-1] if previous else None
+        full = full or latest is None
+        saved = {} if full else latest['tables']
+
+        current = {}
+        for table in self.tables:
+            for name in self.store.stored_tables(table):
+                current[name] = (table, self.store.version(name))
+        changed = [name for name, (table, version) in current.items()
+                   if version is None or name not in saved or saved[name]['version'] != version]
+        if not full and not changed and set(current) == set(saved):
+            self.unchanged += 1
+            return None
+
+        kind = 'full' if full else 'delta'
+        name = self._new_name(kind, now)
+        tmp_dir = os.path.join(self.backup_dir, f'.{name}.tmp')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tables, size = {}, 0
+        try:
+            for stored, (table, version) in current.items():
+                if stored not in changed:
+                    tables[stored] = saved[stored]
+                    continue
+                path = os.path.join(tmp_dir, _file_name(stored))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # The version is taken before the rows, so a write made in
+                # between is saved again next time rather than missed.
+                rows = write_rows(self.store.read_chunks(stored), path)
+                size += os.path.getsize(path)
+                tables[stored] = {'table': table, 'version': version, 'rows': rows,
+                                  'backup': name}
+            manifest = {
+                'name': name,
+                'kind': kind,
+                'base': name if full else latest['base'],
+                'created_at': now.isoformat(sep=' ', timespec='seconds'),
+                'saved': len(changed),
+                'bytes': size,
+                'seconds': round(time.monotonic() - started, 3),
+                'tables': tables,
+            }
+            with open(os.path.join(tmp_dir, MANIFEST), 'w', encoding='utf-8') as handle:
+                json.dump(manifest, handle, indent=1)
+            os.rename(tmp_dir, os.path.join(self.backup_dir, name))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.runs += 1
+        self.last = {key: manifest[key]
+                     for key in ('name', 'kind', 'created_at', 'saved', 'bytes', 'seconds')}
+        if full:
+            self.prune()
+        return manifest
+
+    def prune(self):
+        """Remove all but the last ``keep_full`` full backups and their deltas."""
+        manifests = self.backups()
+        fulls = [manifest['name'] for manifest in manifests if manifest['kind'] == 'full']
+        keep = set(fulls[-self.keep_full:])
+        removed = 0
+        for manifest in manifests:
+            if manifest['base'] not in keep:
+                shutil.rmtree(os.path.join(self.backup_dir, manifest['name']), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def restore(self, name):
+        """Write the tables as of backup ``name`` back to the store.
+
+        Then moves the ID sequences past the restored IDs and calls
+        ``on_restore(store)`` to rebuild the tables derived from them.
+        """
+        manifest = next((m for m in self.backups() if m['name'] == name), None)
+        if manifest is None:
+            raise ValueError(f"No backup named {name}")
+        frames = {}
+        for stored, entry in manifest['tables'].items():
+            path = os.path.join(self.backup_dir, entry['backup'], _file_name(stored))
+            frames.setdefault(entry['table'], []).append(read_rows(path))
+        for table, parts in frames.items():
+            parts = [part for part in parts if len(part)] or parts[:1]
+            self.store.write(table, parts[0] if len(parts) == 1 else
+                             pd.concat(parts, ignore_index=True))
+        for table, (column, start) in self.id_columns.items():
+            if table in frames:
+                self.store.advance_id(table, column, start)
+        if self.on_restore is not None:
+            self.on_restore(self.store)
+        return {table: sum(len(part) for part in parts) for table, parts in frames.items()}
+
+    # Scheduling ------------------------------------------------------------
+
+    def run_due(self, now=None):
+        """Take the backup that is due, if any; full when the last one is too old."""
+        now = datetime.now() if now is None else now
+        if time.time() - self._checked_at < self.interval:
+            return None
+        fulls = [manifest for manifest in self.backups() if manifest['kind'] == 'full']
+        last_full = datetime.fromisoformat(fulls[-1]['created_at']) if fulls else None
+        full = last_full is None or (now - last_full).total_seconds() >= self.full_every
+        manifest = self.backup(full=full, now=now)
+        self._checked_at = time.time()
+        return manifest
+
+    def _lead(self):
+        """Whether this process is the leader, taking the lock if it is free."""
+        if self.leader:
+            return True
+        fd = os.open(os.path.join(self.backup_dir, '.leader.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+        # Held, with the descriptor left open, for as long as the process lives.
+        self._lock_fd = fd
+        self.leader = True
+        if self.logger:
+            self.logger.info(f"Backups are taken by process {os.getpid()}")
+        return True
+
+    def start(self, poll_interval=60):
+        """Start the thread, once per process (gunicorn forks workers after import)."""
+        with self._guard:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # A lock inherited across fork is the parent's, not ours.
+            self.leader, self._lock_fd, self._checked_at = False, None, 0
+        threading.Thread(target=self._loop, args=(poll_interval,), name='backups',
+                         daemon=True).start()
+
+    def _loop(self, poll_interval):
+        while True:
+            try:
+                if self._lead():
+                    manifest = self.run_due()
+                    if manifest and self.logger:
+                        self.logger.info(f"Backup {manifest['name']}: saved {manifest['saved']} "
+                                         f"tables, {manifest['bytes']} bytes")
+            except Exception as e:
+                self.failures += 1
+                self._checked_at = time.time()
+                if self.logger:
+                    self.logger.error(f"Error creating backup: {e}")
+            time.sleep(poll_interval)
+
+    def stats(self):
+        return {
+            'leader': self.leader,
+            'interval': self.interval,
+            'full_every': self.full_every,
+            'runs': self.runs,
+            'unchanged': self.unchanged,
+            'failures': self.failures,
+            'last': self.last,
+        }
+
+
+if __name__ == '__main__':
+    from services import member_status
+    from storage import open_storage
+    from storage.schema import ID_COLUMNS
+
+    engine = BackupEngine(None, os.path.join('data', 'backups'), [], id_columns=ID_COLUMNS,
+                          on_restore=member_status.rebuild)
+    if len(sys.argv) > 1 and sys.argv[1] == 'restore':
+        uri = sys.argv[3] if len(sys.argv) > 3 else \
+            os.environ.get('DATABASE_URL') or 'excel:///data'
+        engine.store = open_storage(uri)
+        for table, rows in engine.restore(sys.argv[2]).items():
+            print(f"{table}: {rows} rows")
+    else:
+        for manifest in engine.backups():
+            print(f"{manifest['name']}: {manifest['kind']}, {manifest['saved']} of "
+                  f"{len(manifest['tables'])} tables saved, {manifest['bytes']} bytes")
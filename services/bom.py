@@ -0,0 +1,109 @@
+"""Compiled bills of materials for the custom products.
+
+A custom product's ingredients are stored as the JSON string the custom
+product page posts (``[{"id": ..., "name": ..., "quantity": ...,
+"price": ...}, ...]``).  :class:`BillsOfMaterials` parses every product's
+string once into a :class:`Bom`: the inventory ids and the servings of each
+per unit sold, as arrays, plus the parsed list for the pages to show.  The
+compiled set is rebuilt when the ``custom_products`` table's version
+changes, so a product added or edited by any worker is picked up on the
+next lookup and an unchanged table is never parsed again.
+
+:meth:`BillsOfMaterials.expand` turns a cart into the servings it takes
+from each inventory item with one concatenation and one grouped sum,
+whatever mix of regular items and custom products the cart holds.
+"""
+import json
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from storage.base import key_text
+
+
+Bom = namedtuple('Bom', 'item_ids quantities ingredients')
+Bom.__doc__ = """Inventory ids (as key text), servings per unit sold, and the parsed ingredients."""
+
+
+def compile_bom(ingredients_json):
+    """The :class:`Bom` for one product's ingredients JSON string."""
+    try:
+        ingredients = json.loads(ingredients_json) if ingredients_json else []
+    except (TypeError, ValueError):
+        ingredients = []
+    if not isinstance(ingredients, list):
+        ingredients = []
+    item_ids = np.array([key_text(ingredient['id']) for ingredient in ingredients], dtype=object)
+    quantities = np.array([float(ingredient['quantity']) for ingredient in ingredients],
+                          dtype=float)
+    return Bom(item_ids, quantities, ingredients)
+
+
+class BillsOfMaterials:
+    def __init__(self, store):
+        self.store = store
+        self._boms = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self.compiles = 0
+
+    def _current(self):
+        version = self.store.version('custom_products')
+        if version is not None and version == self._version:
+            return self._boms
+        with self._lock:
+            if version is None or version != self._version:
+                products = self.store.read('custom_products', ['product_id', 'ingredients'])
+                self._boms = {key_text(product_id): compile_bom(ingredients)
+                              for product_id, ingredients in zip(products['product_id'],
+                                                                 products['ingredients'])}
+                self._version = version
+                self.compiles += 1
+            return self._boms
+
+    def get(self, product_id):
+        """The :class:`Bom` of ``product_id``, or None for an unknown product."""
+        return self._current().get(key_text(product_id))
+
+    def ingredients(self, product_id):
+        bom = self.get(product_id)
+        return [] if bom is None else bom.ingredients
+
+    def expand(self, items):
+        """Servings the cart ``items`` takes from each inventory item.
+
+        ``items`` is the cart the sales page posts: ``[item id, details]``
+        pairs, the id being ``R_<inventory id>`` or ``C_<product id>``.
+        Returns ``{inventory id: (servings, name shown when short)}``; a
+        missing product raises ``KeyError``.
+        """
+        boms = self._current()
+        item_ids, quantities, labels = [], [], []
+        for item_id, details in items:
+            quantity = int(details['quantity'])
+            if item_id.startswith('R_'):  # Regular inventory item
+                item_ids.append(np.array([key_text(item_id.split('_')[1])], dtype=object))
+                quantities.append(np.array([float(quantity)]))
+                labels.append([details['name']])
+            elif item_id.startswith('C_'):  # Custom product
+                product_id = key_text(item_id.split('_')[1])
+                if product_id not in boms:
+                    raise KeyError(f"Custom product {product_id} not found")
+                bom = boms[product_id]
+                item_ids.append(bom.item_ids)
+                quantities.append(bom.quantities * quantity)
+                labels.append([f"ingredient in {details['name']}"] * len(bom.item_ids))
+        if not item_ids:
+            return {}
+        item_ids = np.concatenate(item_ids)
+        if not len(item_ids):
+            return {}
+        keys, first, inverse = np.unique(item_ids, return_index=True, return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(quantities))
+        labels = [label for group in labels for label in group]
+        return {key: (float(total), labels[index])
+                for key, total, index in zip(keys, totals, first)}
+
+    def stats(self):
+        return {'products': len(self._boms), 'compiles': self.compiles}
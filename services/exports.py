@@ -0,0 +1,72 @@
+"""Streaming XLSX and CSV exports.
+
+The writers take the rows as an iterable of DataFrame chunks (see
+``Storage.read_chunks`` and ``PartitionedStorage.partition_chunks``) and
+never hold more than one chunk.  XLSX is written by xlsxwriter in
+``constant_memory`` mode, which flushes each row to disk as it goes, into
+a temporary file that is sent once the workbook is closed (the format is a
+zip, so nothing can be sent before that).  CSV needs no assembling and is
+yielded chunk by chunk, ready for a streamed response.
+"""
+import csv
+import io
+import tempfile
+
+import xlsxwriter
+
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Exports below this size stay in memory; larger ones go to a temp file.
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def _rows(chunk):
+    return chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def write_xlsx(sheets, handle):
+    """Write ``(sheet name, chunks)`` pairs to ``handle`` as one workbook."""
+    workbook = xlsxwriter.Workbook(handle, {
+        'constant_memory': True,
+        # Cell text such as '=1+1' or '0300' is data, not a formula or a number.
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'default_date_format': 'dd-mm-yyyy hh:mm:ss',
+    })
+    for name, chunks in sheets:
+        worksheet = workbook.add_worksheet(name[:31])
+        row_number = 0
+        for chunk in chunks:
+            if row_number == 0:
+                worksheet.write_row(0, 0, [str(column) for column in chunk.columns])
+                row_number = 1
+            for values in _rows(chunk):
+                worksheet.write_row(row_number, 0, values)
+                row_number += 1
+    workbook.close()
+
+
+def xlsx_file(sheets):
+    """The workbook for ``sheets`` in a spooled temporary file, rewound."""
+    handle = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        write_xlsx(sheets, handle)
+    except Exception:
+        handle.close()
+        raise
+    handle.seek(0)
+    return handle
+
+
+def iter_csv(chunks):
+    """Yield ``chunks`` as CSV text, header first, one piece per chunk."""
+    header = True
+    for chunk in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow([str(column) for column in chunk.columns])
+            header = False
+        writer.writerows(_rows(chunk))
+        yield buffer.getvalue()
@@ -0,0 +1,282 @@
+"""Idempotency keys for the POS submissions.
+
+A client that may send the same request twice (a double click, a retry
+after a timeout) sends a key with it.  The first request with a key claims
+it in the ``idempotency_keys`` table and runs; its response is saved
+against the key.  Any other request with the same key, from any worker,
+gets that saved response back instead of running again, waiting for it if
+the first request is still running.
+
+The claim is an ``append(..., unique=['key'])``, so exactly one request
+wins it whichever worker it lands on.  A handler calls :meth:`mark` with a
+reference to its work (a sale id) just before committing it, and
+``resolve(ref)`` returns the response for committed work, or None.  With a
+``resolve``, a response is only kept once ``resolve`` confirms the work was
+committed: a request that failed before its commit, by raising or by
+answering with an error, gives its key up so a retry runs it again.  A
+request that failed after its commit keeps the key, answered with the
+committed work's response.  Without a ``resolve`` every response is kept,
+errors included.
+
+Each key also records a fingerprint of its request (a hash of the form
+fields); the same key sent with a different request is
+:class:`KeyReused`, so a changed cart cannot be answered with the response
+of the earlier one.
+
+A claim records the pid of its worker and when it was made.  A claim with
+no response whose worker is gone, or older than ``stale`` seconds (longer
+than any request may run), is taken over by the next request with its
+key, which asks ``resolve`` about the dead request's marked work before
+running the handler again.
+
+Keys are kept for ``ttl`` seconds: :meth:`IdempotencyKeys.prune` removes
+the older ones and is run daily by the scheduler.  The finished responses
+are also kept in memory, up to ``max_entries`` per process, so a retry
+storm is answered without touching the table.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+
+TABLE = 'idempotency_keys'
+COLUMNS = ['key', 'created_at', 'status', 'response', 'pid', 'claimed_at', 'ref',
+           'fingerprint']
+DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+# Longest key accepted from a client
+MAX_KEY_LENGTH = 100
+
+
+class InProgress(Exception):
+    """The request holding the key has not finished."""
+
+
+class KeyReused(Exception):
+    """The key was sent before with a different request."""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IdempotencyKeys:
+    def __init__(self, store, ttl=24 * 3600, max_entries=1024, wait=10.0, stale=60.0):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait = wait
+        self.stale = stale
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.claims = 0
+        self.takeovers = 0
+        self.replays = 0
+        self.cache_hits = 0
+        self.conflicts = 0
+        self.released = 0
+
+    def ensure(self):
+        self.store.init_table(TABLE, COLUMNS)
+
+    # Cache -----------------------------------------------------------------
+
+    def _remember(self, key, response, created_at, fingerprint=None):
+        with self._lock:
+            self._responses[key] = (response, created_at, fingerprint)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def _cached(self, key, fingerprint=None):
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is None:
+                return None
+            response, created_at, saved = entry
+            if time.time() - created_at > self.ttl:
+                del self._responses[key]
+                return None
+            self._responses.move_to_end(key)
+        _check(key, saved, fingerprint)
+        return response
+
+    # Keys ------------------------------------------------------------------
+
+    def run(self, key, handler, resolve=None, fingerprint=None):
+        """The response for ``key``: ``handler()``'s, run once per key.
+
+        ``handler`` returns a response dict (``status``, plus whatever the
+        caller needs to rebuild it) that must be JSON serialisable.
+        ``resolve(ref)`` gives the response of the work a request marked,
+        or None if it was not committed.  Raises :class:`InProgress` when
+        another request holds the key for longer than ``wait`` seconds, and
+        :class:`KeyReused` when the key was claimed with another
+        ``fingerprint``.
+        """
+        response = self._cached(key, fingerprint)
+        if response is not None:
+            self.cache_hits += 1
+            self.replays += 1
+            return response, True
+
+        while True:
+            row = {'key': key, 'created_at': datetime.now().strftime(DATE_FORMAT),
+                   'status': None, 'response': None, 'fingerprint': fingerprint,
+                   **self._claim()}
+            if self.store.append(TABLE, row, unique=['key']):
+                break
+            row = self._wait(key)
+            if row is None:
+                continue
+            saved = row.get('fingerprint')
+            _check(key, saved if _present(saved) else None, fingerprint)
+            if _finished(row):
+                response = json.loads(row['response'])
+                self._remember(key, response, time.time(), fingerprint)
+                self.replays += 1
+                return response, True
+            # Taken over from a dead request: its work may be done already
+            self.takeovers += 1
+            ref = row.get('ref')
+            response = resolve(ref) if resolve is not None and _present(ref) else None
+            if response is not None:
+                self._save(key, response, fingerprint)
+                self.replays += 1
+                return response, True
+            break
+
+        self.claims += 1
+        self._local.key = key
+        self._local.ref = None
+        try:
+            response = handler()
+        except BaseException:
+            done = self._committed(resolve)
+            if done is None:
+                self._release(key)
+            else:
+                self._save(key, done, fingerprint)
+            raise
+        finally:
+            self._local.key = None
+        if resolve is not None:
+            done = self._committed(resolve)
+            if done is None:
+                # Failed before its commit: a retry runs it again
+                self._release(key)
+                return response, False
+            if response['status'] >= 500:
+                response = done
+        self._save(key, response, fingerprint)
+        return response, False
+
+    def mark(self, ref):
+        """Record ``ref`` (a sale id) as the work of the key being run."""
+        key = getattr(self._local, 'key', None)
+        if key is not None:
+            self._local.ref = str(ref)
+            self.store.update(TABLE, {'key': key}, {'ref': str(ref)})
+
+    def _committed(self, resolve):
+        """``resolve``'s response for the work marked by the running key, or None."""
+        ref = getattr(self._local, 'ref', None)
+        if resolve is None or ref is None:
+            return None
+        return resolve(ref)
+
+    def _claim(self):
+        return {'pid': os.getpid(), 'claimed_at': time.time()}
+
+    def _save(self, key, response, fingerprint=None):
+        self.store.update(TABLE, {'key': key},
+                          {'status': response['status'], 'response': json.dumps(response)})
+        self._remember(key, response, time.time(), fingerprint)
+
+    def _release(self, key):
+        self.store.delete(TABLE, {'key': key})
+        self.released += 1
+
+    def _stale(self, row):
+        try:
+            pid = int(row.get('pid'))
+            age = time.time() - float(row.get('claimed_at'))
+        except (TypeError, ValueError):
+            return True
+        return age != age or age > self.stale or not _pid_alive(pid)
+
+    def _take_over(self, key):
+        """The claim of ``key`` made ours if it is stale, else None."""
+        with self.store.locked(TABLE):
+            row = self.store.find(TABLE, {'key': key})
+            if row is None or _finished(row) or not self._stale(row):
+                return None
+            claim = self._claim()
+            self.store.update(TABLE, {'key': key}, claim)
+            return dict(row, **claim)
+
+    def _wait(self, key):
+        """The row of ``key`` once it has a response or is taken over by us,
+        or None once the key is given up."""
+        deadline = time.monotonic() + self.wait
+        delay = 0.02
+        while True:
+            row = self.store.find(TABLE, {'key': key})
+            if row is None:
+                # Given up by a handler that raised
+                return None
+            if _finished(row):
+                return row
+            if self._stale(row):
+                taken = self._take_over(key)
+                if taken is not None:
+                    return taken
+                continue
+            if time.monotonic() >= deadline:
+                self.conflicts += 1
+                raise InProgress(key)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def prune(self, now=None):
+        """Remove the keys older than ``ttl``."""
+        now = datetime.now() if now is None else now
+        with self.store.locked(TABLE):
+            rows = self.store.read(TABLE)
+            if not len(rows):
+                return 0
+            created = pd.to_datetime(rows['created_at'].astype(str), format=DATE_FORMAT,
+                                     errors='coerce')
+            expired = (created < now - pd.Timedelta(seconds=self.ttl)).to_numpy()
+            if expired.any():
+                self.store.write(TABLE, rows[~expired])
+            return int(expired.sum())
+
+    def stats(self):
+        return {'claims': self.claims, 'replays': self.replays, 'cache_hits': self.cache_hits,
+                'conflicts': self.conflicts, 'released': self.released,
+                'takeovers': self.takeovers, 'cached': len(self._responses)}
+
+
+def _check(key, saved, fingerprint):
+    if saved is not None and fingerprint is not None and saved != fingerprint:
+        raise KeyReused(key)
+
+
+def _present(value):
+    return value is not None and value == value and value != ''
+
+
+def _finished(row):
+    return isinstance(row.get('response'), str) and bool(row['response'])
@@ -0,0 +1,263 @@
+"""Background jobs: report workbooks and receipt PDFs.
+
+Work that takes seconds (building a month's workbook, rendering a PDF)
+used to run inside the request, holding a gunicorn worker for as long as
+it took.  Routes now :meth:`~JobQueue.submit` it and answer at once with
+the job id; the browser polls the job's status and fetches the file once
+it is done.
+
+Jobs live in a small SQLite database (``data/jobs.db``) shared by every
+worker process, so any worker can run a job and any worker can answer for
+it.  Each process starts a pool of threads that claim queued jobs when
+the app is imported; at most ``workers`` jobs run at a time across all
+processes.  A job left running by a process that died is queued again,
+including one whose process id has since been reused by a new worker.
+Result files are written to ``results_dir`` and removed, with their job,
+after ``result_max_age`` seconds.
+
+A job function takes the job's arguments (a dict) and the path to write
+its result to, and returns ``(download name, mimetype)``, or None when the
+job has no file to hand back.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    def __init__(self, path, results_dir, workers=2, poll_interval=2.0,
+                 result_max_age=24 * 3600, logger=None):
+        self.path = path
+        self.results_dir = results_dir
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.result_max_age = result_max_age
+        self.logger = logger
+        self.functions = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pruned_at = 0
+        os.makedirs(results_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id TEXT PRIMARY KEY, kind TEXT NOT NULL, args TEXT NOT NULL, '
+                         'status TEXT NOT NULL, submitted_at REAL NOT NULL, started_at REAL, '
+                         'finished_at REAL, pid INTEGER, result_path TEXT, download_name TEXT, '
+                         'mimetype TEXT, error TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def register(self, kind, function):
+        self.functions[kind] = function
+
+    # Submitting and polling ------------------------------------------------
+
+    def submit(self, kind, args=None, unique=False):
+        """Queue ``kind`` with ``args``; returns the job id.
+
+        With ``unique``, a job of the same kind and arguments that is still
+        queued or running is returned instead of queueing another.
+        """
+        if kind not in self.functions:
+            raise ValueError(f"Unknown job kind: {kind}")
+        args = json.dumps(args or {}, sort_keys=True)
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if unique:
+                row = conn.execute("SELECT id FROM jobs WHERE kind = ? AND args = ? "
+                                   "AND status IN ('queued', 'running')", (kind, args)).fetchone()
+                if row is not None:
+                    conn.execute('COMMIT')
+                    return row['id']
+            job_id = uuid.uuid4().hex
+            conn.execute('INSERT INTO jobs (id, kind, args, status, submitted_at) '
+                         "VALUES (?, ?, ?, 'queued', ?)", (job_id, kind, args, time.time()))
+            conn.execute('COMMIT')
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        """The job as a dict with its timings, or None if there is no such job."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        started, finished = row['started_at'], row['finished_at']
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'error': row['error'],
+            'has_result': row['result_path'] is not None,
+            'wait_seconds': round((started or now) - row['submitted_at'], 3),
+            'run_seconds': None if started is None else round((finished or now) - started, 3),
+        }
+
+    def result(self, job_id):
+        """``(path, download name, mimetype)`` of a finished job's file, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ? AND status = 'done'",
+                               (job_id,)).fetchone()
+        if row is None or row['result_path'] is None or not os.path.exists(row['result_path']):
+            return None
+        return row['result_path'], row['download_name'], row['mimetype']
+
+    # Running ----------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads, once per process (gunicorn forks after import)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Nothing runs here yet, so a job running under this pid was left
+            # by an earlier process that had it.
+            self._requeue_dead(conn, own=True)
+            conn.execute('COMMIT')
+        self._wake.set()
+        for number in range(self.workers):
+            threading.Thread(target=self._loop, name=f'job-worker-{number}', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                job = None
+                if self.logger:
+                    self.logger.error(f"Error claiming a job: {e}")
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                if time.time() - self._pruned_at > 60:
+                    self._pruned_at = time.time()
+                    self.prune()
+                continue
+            self._run(job)
+
+    def _claim(self):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._requeue_dead(conn)
+            alive = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            kinds = sorted(self.functions)
+            row = None
+            if alive < self.workers and kinds:
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE status = 'queued' "
+                    f"AND kind IN ({', '.join('?' for _ in kinds)}) "
+                    'ORDER BY submitted_at LIMIT 1', kinds).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ?, pid = ? "
+                             'WHERE id = ?', (time.time(), os.getpid(), row['id']))
+            conn.execute('COMMIT')
+        return row
+
+    def _requeue_dead(self, conn, own=False):
+        """Queue again the running jobs whose worker process died."""
+        running = conn.execute("SELECT id, pid FROM jobs WHERE status = 'running'").fetchall()
+        requeued = 0
+        for row in running:
+            if row['pid'] == os.getpid() and not own:
+                continue
+            if row['pid'] is None or row['pid'] == os.getpid() or not _pid_alive(row['pid']):
+                conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL, pid = NULL "
+                             'WHERE id = ?', (row['id'],))
+                requeued += 1
+        if requeued and self.logger:
+            self.logger.info(f"Queued {requeued} jobs left running by a dead worker again")
+        return requeued
+
+    def _run(self, job):
+        result_path = os.path.join(self.results_dir, job['id'])
+        try:
+            result = self.functions[job['kind']](json.loads(job['args']), result_path)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error running {job['kind']} job {job['id']}: {e}")
+            self._finish(job['id'], 'failed', error=str(e))
+            return
+        if result is None:
+            self._finish(job['id'], 'done')
+        else:
+            download_name, mimetype = result
+            self._finish(job['id'], 'done', result_path, download_name, mimetype)
+
+    def _finish(self, job_id, status, result_path=None, download_name=None, mimetype=None,
+                error=None):
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, result_path = ?, '
+                         'download_name = ?, mimetype = ?, error = ? WHERE id = ?',
+                         (status, time.time(), result_path, download_name, mimetype, error,
+                          job_id))
+
+    def prune(self):
+        """Forget finished jobs older than ``result_max_age`` and remove their files."""
+        cutoff = time.time() - self.result_max_age
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, result_path FROM jobs WHERE status IN ('done', 'failed') "
+                'AND finished_at < ?', (cutoff,)).fetchall()
+            for row in rows:
+                if row['result_path']:
+                    try:
+                        os.remove(row['result_path'])
+                    except FileNotFoundError:
+                        pass
+                conn.execute('DELETE FROM jobs WHERE id = ?', (row['id'],))
+        return len(rows)
+
+    def stats(self):
+        """Jobs by status, and wait and run times of the finished ones, per kind."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT kind, status, COUNT(*) AS jobs, '
+                'AVG(started_at - submitted_at) AS avg_wait, '
+                'MAX(started_at - submitted_at) AS max_wait, '
+                'AVG(finished_at - started_at) AS avg_run, '
+                'MAX(finished_at - started_at) AS max_run '
+                'FROM jobs GROUP BY kind, status').fetchall()
+        kinds = {}
+        for row in rows:
+            kind = kinds.setdefault(row['kind'], {status: 0 for status in STATUSES})
+            kind[row['status']] = row['jobs']
+            if row['status'] == 'done':
+                kind.update({name: None if row[name] is None else round(row[name], 3)
+                             for name in ('avg_wait', 'max_wait', 'avg_run', 'max_run')})
+        return {'workers': self.workers, 'kinds': kinds}
+
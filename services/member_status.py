@@ -0,0 +1,398 @@
+"""Materialized payment status of every member.
+
+The ``member_status`` table holds one row per member with what the
+/payments page shows: the member's latest payment (or a pending row for a
+member who never paid), when it expires, the days remaining and whether
+the member is 'Paid' or 'Pending'.  It is built once from the payment
+history and then kept current by the routes that change its inputs:
+
+* a payment (``record_payment``) replaces the member's row
+* adding, editing or deleting a member touches that member's row
+* adding, editing or deleting a package re-prices the rows on it
+
+Remaining days only change with the calendar, so ``roll_forward`` recomputes
+them once a day (the ``as_of`` column says for which day) and flips members
+whose payment has run out to 'Pending'.  ``expiry_date`` and
+``payment_status`` on ``members`` are kept in step with the table.
+
+For the front desk, ``renewals`` holds the members whose membership
+expires between today and ``RENEWAL_DAYS`` days ahead, indexed by expiry
+date.  It is recomputed with each roll-forward and follows every payment,
+so :func:`expiring` answers "expired today" and "expiring in the next N
+days" with one index lookup per day instead of a pass over every member.
+The day it was recomputed for is kept in ``renewals_as_of``, so a day with
+nobody due does not look like one that has not been rolled forward.
+
+Run ``python -m services.member_status [uri]`` to rebuild it from history.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from storage.base import key_text
+
+
+TABLE = 'member_status'
+COLUMNS = ['member_id', 'member_name', 'package', 'date', 'amount', 'additional_cost',
+           'comments', 'expiry_date', 'remaining_days', 'status', 'as_of']
+DATE_FORMAT = '%d-%m-%Y'
+
+RENEWALS = 'renewals'
+RENEWAL_COLUMNS = ['member_id', 'member_name', 'package', 'expiry_date', 'as_of']
+# One row: the day ``renewals`` was last recomputed for, even when it is empty
+RENEWALS_AS_OF = 'renewals_as_of'
+# How far ahead the renewals table looks
+RENEWAL_DAYS = 31
+# Share of members changed above which sync_members rewrites the table
+SYNC_REWRITE_SHARE = 0.1
+
+
+def _expiry(dates, months, now):
+    """Expiry dates, remaining days and status for payment ``dates``.
+
+    ``months`` is the package duration of each payment.  A payment runs out
+    ``months`` calendar months after its date; with less than a day left it
+    is 'Pending' again.
+    """
+    expiry = pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns]')
+    for duration in months.unique():
+        mask = months == duration
+        expiry[mask] = dates[mask] + pd.DateOffset(months=int(duration))
+    remaining = (expiry - now).dt.days
+    status = pd.Series(np.where(remaining <= 0, 'Pending', 'Paid'), index=dates.index)
+    return expiry.dt.strftime(DATE_FORMAT), remaining.clip(lower=0), status
+
+
+def build_status(members, payments, packages, now=None):
+    """The ``member_status`` table computed from scratch, in ``members`` order.
+
+    Each table is scanned once, and expiry dates are computed once per
+    distinct package duration rather than once per member.  A payment with
+    no date or an unknown package gets a row without a status, which the
+    payments page leaves out.
+    """
+    now = datetime.now() if now is None else now
+    prices = packages.drop_duplicates('name').set_index('name')['price']
+    durations = packages.drop_duplicates('name').set_index('name')['duration']
+
+    payment_keys = payments['member_id'].map(key_text)
+    latest = payments[~payment_keys.duplicated(keep='last')]
+    latest.index = payment_keys[latest.index]
+    member_keys = members['member_id'].map(key_text)
+    has_payment = member_keys.isin(latest.index).to_numpy()
+    order = np.arange(len(members))
+
+    paid = latest.loc[member_keys[has_payment]]
+    column = lambda name: paid[name].astype(object).to_numpy() if name in paid else None
+    paid = pd.DataFrame({
+        'member_id': paid['member_id'].to_numpy(),
+        'member_name': column('member_name'),
+        'package': column('package'),
+        'date': column('date'),
+        'amount': column('amount'),
+        'additional_cost': column('additional_cost'),
+        'comments': column('comments'),
+        'expiry_date': None,
+        'remaining_days': None,
+        'status': None,
+    }, index=order[has_payment])
+    known = paid['date'].notna() & paid['package'].isin(durations.index)
+    if known.any():
+        dates = pd.to_datetime(paid.loc[known, 'date'], format=DATE_FORMAT)
+        months = paid.loc[known, 'package'].map(durations).astype(int)
+        expiry, remaining, status = _expiry(dates, months, now)
+        paid.loc[known, 'expiry_date'] = expiry
+        paid.loc[known, 'remaining_days'] = remaining
+        paid.loc[known, 'status'] = status
+
+    unpaid = members[~has_payment]
+    unpaid = pd.DataFrame({
+        'member_id': unpaid['member_id'].to_numpy(),
+        'member_name': unpaid['name'].to_numpy(),
+        'package': unpaid['package'].astype(object).to_numpy(),
+        'date': None,
+        'amount': unpaid['package'].astype(object).map(prices).fillna(0).to_numpy(),
+        'additional_cost': None,
+        'comments': None,
+        'expiry_date': None,
+        'remaining_days': 0,
+        'status': 'Pending',
+    }, index=order[~has_payment])
+
+    frames = [frame for frame in (paid, unpaid) if len(frame)] or [paid]
+    status = pd.concat(frames).sort_index().reset_index(drop=True)
+    status['as_of'] = now.strftime(DATE_FORMAT)
+    return status[COLUMNS]
+
+
+def rebuild(store, now=None):
+    """Recompute ``member_status`` from the members, payments and packages tables."""
+    with store.locked(TABLE):
+        status = build_status(store.read('members', columns=['member_id', 'name', 'package']),
+                              store.read('payments'),
+                              store.read('packages', columns=['name', 'price', 'duration']),
+                              now)
+        store.write(TABLE, status)
+        precompute_renewals(store, status, now)
+    sync_members(store, status)
+    return len(status)
+
+
+def ensure(store):
+    """Build ``member_status`` and ``renewals`` if they do not exist yet."""
+    if store.exists(TABLE) and store.exists(RENEWALS):
+        return
+    with store.locked(TABLE):
+        if not store.exists(TABLE):
+            rebuild(store)
+        elif not store.exists(RENEWALS):
+            precompute_renewals(store, store.read(TABLE))
+
+
+def payment_rows(store, now=None):
+    """Rows for the /payments page, rolled forward to today if needed."""
+    now = datetime.now() if now is None else now
+    status = store.read(TABLE)
+    if (status['as_of'] != now.strftime(DATE_FORMAT)).any():
+        roll_forward(store, now)
+        status = store.read(TABLE)
+    status = status[status['status'].notna()].drop(columns=['expiry_date', 'as_of'])
+    # Members who never paid show today's date, as a payment due today.
+    status['date'] = status['date'].astype(object).fillna(now.strftime(DATE_FORMAT))
+    status = status.astype(object).where(status.notna(), None)
+    return status.to_dict('records')
+
+
+def roll_forward(store, now=None):
+    """Recompute remaining days for today; returns how many members fell due."""
+    now = datetime.now() if now is None else now
+    today = now.strftime(DATE_FORMAT)
+    with store.locked(TABLE):
+        status = store.read(TABLE)
+        stale = status['as_of'] != today
+        if not stale.any():
+            return 0
+        status = status.astype({'status': object, 'remaining_days': object})
+        dated = status['expiry_date'].notna()
+        was_paid = status['status'] == 'Paid'
+        if dated.any():
+            expiry = pd.to_datetime(status.loc[dated, 'expiry_date'], format=DATE_FORMAT)
+            remaining = (expiry - now).dt.days
+            status.loc[dated, 'remaining_days'] = remaining.clip(lower=0)
+            status.loc[dated, 'status'] = np.where(remaining <= 0, 'Pending', 'Paid')
+        status['as_of'] = today
+        store.write(TABLE, status)
+        precompute_renewals(store, status, now)
+    sync_members(store, status)
+    return int((was_paid & (status['status'] == 'Pending')).sum())
+
+
+def sync_members(store, status):
+    """Copy expiry dates and payment status from ``status`` onto ``members``.
+
+    Only the members whose values changed are updated, a journal record
+    each; the table is rewritten when more than ``SYNC_REWRITE_SHARE`` of
+    it changed.
+    """
+    status = status[status['expiry_date'].notna()]
+    keys = status['member_id'].map(key_text)
+    expiry = dict(zip(keys, status['expiry_date']))
+    payment_status = dict(zip(keys, status['status']))
+    with store.locked('members'):
+        members = store.read('members')
+        if members.empty:
+            return
+        member_keys = members['member_id'].map(key_text)
+        paid = member_keys.isin(expiry)
+        new_expiry = member_keys.map(expiry)
+        new_status = member_keys.map(payment_status)
+        changed = paid & ((members['expiry_date'].astype(object) != new_expiry.astype(object)) |
+                          (members['payment_status'].astype(object) !=
+                           new_status.astype(object)))
+        if not changed.any():
+            return
+        if changed.sum() > len(members) * SYNC_REWRITE_SHARE:
+            members = members.astype({'expiry_date': object, 'payment_status': object})
+            members.loc[paid, 'expiry_date'] = new_expiry[paid]
+            members.loc[paid, 'payment_status'] = new_status[paid]
+            store.write('members', members)
+            return
+        for member_id, expiry_date, state in zip(members.loc[changed, 'member_id'],
+                                                 new_expiry[changed], new_status[changed]):
+            store.update('members', {'member_id': member_id},
+                         {'expiry_date': expiry_date, 'payment_status': state})
+
+
+# Incremental updates ------------------------------------------------------
+
+def _upsert(store, member_id, fields):
+    if not store.update(TABLE, {'member_id': member_id}, fields):
+        store.append(TABLE, dict(fields, member_id=member_id), unique=['member_id'])
+
+
+def record_payment(store, payment, now=None):
+    """Make ``payment`` (a new row of ``payments``) the member's latest."""
+    now = datetime.now() if now is None else now
+    package = store.find('packages', {'name': payment.get('package')})
+    fields = {
+        'member_name': payment.get('member_name'),
+        'package': payment.get('package'),
+        'date': payment.get('date'),
+        'amount': payment.get('amount'),
+        'additional_cost': payment.get('additional_cost'),
+        'comments': payment.get('comments'),
+        'expiry_date': None,
+        'remaining_days': None,
+        'status': None,
+        'as_of': now.strftime(DATE_FORMAT),
+    }
+    if payment.get('date') and package is not None:
+        index = pd.RangeIndex(1)
+        expiry, remaining, status = _expiry(
+            pd.Series(pd.to_datetime([payment['date']], format=DATE_FORMAT), index=index),
+            pd.Series([int(package['duration'])], index=index), now)
+        fields.update(expiry_date=expiry[0], remaining_days=int(remaining[0]), status=status[0])
+    _upsert(store, payment['member_id'], fields)
+    track_renewal(store, dict(fields, member_id=payment['member_id']), now)
+    if fields['status'] is not None:
+        store.update('members', {'member_id': payment['member_id']},
+                     {'expiry_date': fields['expiry_date'], 'payment_status': fields['status']})
+
+
+def _unpaid_fields(store, name, package_name):
+    package = store.find('packages', {'name': package_name})
+    return {'member_name': name, 'package': package_name,
+            'amount': 0 if package is None else package['price']}
+
+
+def add_member(store, member, now=None):
+    """Add a pending row for a member who has not paid yet."""
+    now = datetime.now() if now is None else now
+    fields = dict(_unpaid_fields(store, member.get('name'), member.get('package')),
+                  date=None, additional_cost=None, comments=None, expiry_date=None,
+                  remaining_days=0, status='Pending', as_of=now.strftime(DATE_FORMAT))
+    _upsert(store, member['member_id'], fields)
+
+
+def update_member(store, member_id):
+    """Follow a name or package change on a member who has not paid yet.
+
+    A member who has paid keeps the name and package of the payment.
+    """
+    member = store.find('members', {'member_id': member_id})
+    if member is None:
+        return
+    store.update(TABLE, {'member_id': member_id, 'date': None, 'status': 'Pending'},
+                 _unpaid_fields(store, member.get('name'), member.get('package')))
+
+
+def delete_member(store, member_id):
+    store.delete(TABLE, {'member_id': member_id})
+    store.delete(RENEWALS, {'member_id': member_id})
+
+
+def refresh_package(store, name, now=None):
+    """Re-price and re-date the rows on package ``name`` after it changed."""
+    now = datetime.now() if now is None else now
+    package = store.find('packages', {'name': name})
+    with store.locked(TABLE):
+        status = store.read(TABLE)
+        on_package = status['package'].astype(object) == name
+        if not on_package.any():
+            return 0
+        status = status.astype({'amount': object, 'expiry_date': object,
+                                'remaining_days': object, 'status': object})
+        dated = on_package & status['date'].notna()
+        unpaid = on_package & status['date'].isna() & (status['status'] == 'Pending')
+        status.loc[unpaid, 'amount'] = 0 if package is None else package['price']
+        status.loc[dated, ['expiry_date', 'remaining_days', 'status']] = None
+        if package is not None and dated.any():
+            dates = pd.to_datetime(status.loc[dated, 'date'].astype(object), format=DATE_FORMAT)
+            months = pd.Series(int(package['duration']), index=dates.index)
+            expiry, remaining, state = _expiry(dates, months, now)
+            status.loc[dated, 'expiry_date'] = expiry
+            status.loc[dated, 'remaining_days'] = remaining
+            status.loc[dated, 'status'] = state
+        store.write(TABLE, status)
+        precompute_renewals(store, status, now)
+    sync_members(store, status)
+    return int(on_package.sum())
+
+
+# Renewals ----------------------------------------------------------------
+
+def _in_window(expiry, now):
+    today = pd.Timestamp(now.date())
+    return (expiry >= today) & (expiry <= today + pd.Timedelta(days=RENEWAL_DAYS))
+
+
+def precompute_renewals(store, status, now=None):
+    """Rewrite ``renewals`` from the ``member_status`` frame ``status``."""
+    now = datetime.now() if now is None else now
+    expiry = pd.to_datetime(status['expiry_date'].astype(object), format=DATE_FORMAT,
+                            errors='coerce')
+    window = _in_window(expiry, now)
+    renewals = status.loc[window, RENEWAL_COLUMNS[:-1]].iloc[np.argsort(
+        expiry[window].to_numpy(), kind='stable')]
+    renewals['as_of'] = now.strftime(DATE_FORMAT)
+    store.write(RENEWALS, renewals.reset_index(drop=True))
+    store.write(RENEWALS_AS_OF, pd.DataFrame({'as_of': [now.strftime(DATE_FORMAT)]}))
+    return len(renewals)
+
+
+def _renewals_as_of(store):
+    if not store.exists(RENEWALS_AS_OF):
+        return None
+    as_of = store.read(RENEWALS_AS_OF)['as_of']
+    return as_of.iloc[-1] if len(as_of) else None
+
+
+def track_renewal(store, row, now=None):
+    """Move the member of ``row`` (a ``member_status`` row) in ``renewals``."""
+    now = datetime.now() if now is None else now
+    store.delete(RENEWALS, {'member_id': row['member_id']})
+    if row.get('expiry_date') is None:
+        return
+    expiry = pd.to_datetime(row['expiry_date'], format=DATE_FORMAT)
+    if _in_window(expiry, now):
+        store.append(RENEWALS, dict({column: row.get(column) for column in RENEWAL_COLUMNS},
+                                    as_of=now.strftime(DATE_FORMAT)))
+
+
+def expiring(store, days=7, now=None):
+    """Members whose membership expires today, and in each of the next ``days`` days.
+
+    Returns ``(expired_today, expiring)``, two lists of row dicts; the second
+    is ordered by expiry date.  Each day is one lookup on the expiry date
+    index of ``renewals``, so the cost follows the size of the answer.
+    Beyond ``RENEWAL_DAYS`` the ``member_status`` table is scanned instead.
+    """
+    now = datetime.now() if now is None else now
+    today = now.strftime(DATE_FORMAT)
+    if _renewals_as_of(store) != today:
+        # Not rolled forward yet today: make sure.
+        roll_forward(store, now)
+        if _renewals_as_of(store) != today:
+            with store.locked(TABLE):
+                precompute_renewals(store, store.read(TABLE), now)
+    days_ahead = [(now + timedelta(days=offset)).strftime(DATE_FORMAT)
+                  for offset in range(days + 1)]
+    if days > RENEWAL_DAYS:
+        status = store.read(TABLE, columns=RENEWAL_COLUMNS[:-1])
+        by_day = {day: status[status['expiry_date'] == day] for day in days_ahead}
+    else:
+        by_day = {day: store.find_all(RENEWALS, {'expiry_date': day}) for day in days_ahead}
+    rows = lambda frame: frame[RENEWAL_COLUMNS[:-1]].astype(object).where(
+        frame[RENEWAL_COLUMNS[:-1]].notna(), None).to_dict('records')
+    expired_today = rows(by_day.pop(today))
+    return expired_today, [row for day in days_ahead[1:] for row in rows(by_day[day])]
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_URL') or 'excel:///data'
+    print(f"{TABLE}: rebuilt {rebuild(open_storage(uri))} rows")
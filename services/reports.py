@@ -0,0 +1,224 @@
+"""Monthly reports over the live tables.
+
+/reports shows one month of the dated tables (member and staff attendance,
+sales, payments), the tables without a date (members, inventory, packages,
+...) and the month's revenue; the downloads stream the same sheets with
+:func:`sheet_chunks`.  The dated tables are split into month partitions
+(see :mod:`storage.partitions`), so a month is read from its own partition
+and costs what that month holds, not the whole history.
+
+Only a month's totals and row counts are kept; its rows are read a page
+(:data:`PAGE_ROWS` rows) at a time from the partitions when shown.  A month
+that has ended is closed: its totals and counts are saved once as
+``data/.reports/<YYYY-MM>.json`` with the versions of the partitions they
+were computed from, and served from there, or from the few months kept in
+memory, by every worker.  A closed month is computed again only when one of
+those partitions has been rewritten since, as :meth:`BackupEngine.restore
+<services.backups.BackupEngine.restore>` does.  The current month is
+counted from its partitions on each request, so it always shows the rows
+written so far.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+from storage.atomic import atomic_path
+
+
+# Sheet -> (table, split by month), in the order the report lists them
+SHEETS = {
+    'Members': ('members', False),
+    'Member Attendance': ('attendance', True),
+    'Staff Attendance': ('trainer_attendance', True),
+    'Sales': ('sales', True),
+    'Sale Items': ('sale_items', True),
+    'Payments': ('payments', True),
+    'Inventory': ('inventory', False),
+    'Custom Products': ('custom_products', False),
+    'Packages': ('packages', False),
+    'Staff': ('receptionists', False),
+}
+
+# Total -> (sheet, column summed)
+TOTALS = {
+    'monthly_revenue': ('Payments', 'amount'),
+    'monthly_sales_revenue': ('Sales', 'total_amount'),
+}
+
+# Rows of each table shown per page of /reports
+PAGE_ROWS = 500
+# Closed months whose totals are kept in memory
+MAX_MONTHS = 24
+
+
+def _number(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def sheet_chunks(store, month, chunk_rows=10000):
+    """``(sheet, chunks)`` for each sheet of ``month``, read as the chunks are used.
+
+    For the streamed exports: rows come straight from the month partitions,
+    so a large month is never held in memory.
+    """
+    for sheet, (table, dated) in SHEETS.items():
+        if dated:
+            yield sheet, store.partition_chunks(table, month, chunk_rows=chunk_rows)
+        else:
+            yield sheet, store.read_chunks(table, chunk_rows=chunk_rows)
+
+
+def _count(store, month, sheet):
+    """Rows of a dated ``sheet`` in ``month`` and the sum of its total column."""
+    table, _ = SHEETS[sheet]
+    column = next((column for name, column in TOTALS.values() if name == sheet), None)
+    rows, total = 0, 0
+    for chunk in store.partition_chunks(table, month, None if column is None else [column]):
+        rows += len(chunk)
+        if column is not None and column in chunk:
+            total += _number(pd.to_numeric(chunk[column], errors='coerce').sum())
+    return rows, total
+
+
+class MonthlyReport:
+    """Totals and row counts of ``month``; its rows are read from ``store``."""
+
+    def __init__(self, store, month, closed=False, totals=None, counts=None, versions=None):
+        self.store = store
+        self.month = month
+        self.closed = closed
+        self.versions = versions or {}
+        if totals is None or counts is None:
+            totals, counts = self._count()
+        self.totals = totals
+        self.counts = counts
+
+    def _count(self):
+        counts, sums = {}, {}
+        for sheet, (table, dated) in SHEETS.items():
+            if dated:
+                counts[sheet], sums[sheet] = _count(self.store, self.month, sheet)
+        totals = {total: sums[sheet] for total, (sheet, column) in TOTALS.items()}
+        return totals, counts
+
+    def count(self, sheet):
+        if sheet in self.counts:
+            return self.counts[sheet]
+        table, _ = SHEETS[sheet]
+        return sum(len(chunk) for chunk in self.store.read_chunks(table, chunk_rows=PAGE_ROWS))
+
+    def pages(self, sheet):
+        return max(1, -(-self.count(sheet) // PAGE_ROWS))
+
+    def records(self, sheet, page=1):
+        """Rows ``page`` (from 1) of ``sheet``, :data:`PAGE_ROWS` at a time."""
+        table, dated = SHEETS[sheet]
+        chunks = self.store.partition_chunks(table, self.month, chunk_rows=PAGE_ROWS) if dated \
+            else self.store.read_chunks(table, chunk_rows=PAGE_ROWS)
+        skip, rows = (max(page, 1) - 1) * PAGE_ROWS, []
+        for chunk in chunks:
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            rows.extend(chunk.iloc[skip:skip + PAGE_ROWS - len(rows)].to_dict('records'))
+            skip = 0
+            if len(rows) == PAGE_ROWS:
+                break
+        return rows
+
+    def to_json(self):
+        return {'month': self.month, 'closed': self.closed, 'totals': self.totals,
+                'counts': self.counts, 'versions': self.versions}
+
+    @classmethod
+    def from_json(cls, store, data):
+        return cls(store, data['month'], data['closed'], data['totals'], data['counts'],
+                   data['versions'])
+
+
+class ReportCache:
+    """Monthly reports of ``store``, closed months cached in ``cache_dir``."""
+
+    def __init__(self, store, cache_dir, max_months=MAX_MONTHS):
+        self.store = store
+        self.cache_dir = cache_dir
+        self.max_months = max_months
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.builds = 0
+        self.stale = 0
+        self.live = 0
+
+    def path(self, month):
+        return os.path.join(self.cache_dir, f'{month}.json')
+
+    def month(self, month, now=None):
+        """The report for ``month`` (``'YYYY-MM'``)."""
+        datetime.strptime(month, '%Y-%m')
+        now = datetime.now() if now is None else now
+        if month >= now.strftime('%Y-%m'):
+            self.live += 1
+            return MonthlyReport(self.store, month)
+        with self._lock:
+            versions = self._versions(month)
+            report = self._cached(month, versions)
+            if report is None:
+                self.builds += 1
+                report = self._save(MonthlyReport(self.store, month, closed=True,
+                                                  versions=versions))
+            return report
+
+    def _versions(self, month):
+        return {table: self.store.partition_version(table, month)
+                for table, dated in SHEETS.values() if dated}
+
+    def _current(self, report, versions):
+        # A backend that cannot tell versions apart is never trusted.
+        return report.closed and None not in versions.values() and report.versions == versions \
+            and all(sheet in report.counts for sheet, (_, dated) in SHEETS.items() if dated)
+
+    def _remember(self, report):
+        self._reports[report.month] = report
+        self._reports.move_to_end(report.month)
+        while len(self._reports) > self.max_months:
+            self._reports.popitem(last=False)
+
+    def _cached(self, month, versions):
+        report = self._reports.get(month)
+        if report is not None:
+            if self._current(report, versions):
+                self.hits += 1
+                self._reports.move_to_end(month)
+                return report
+            self.stale += 1
+            del self._reports[month]
+            return None
+        try:
+            with open(self.path(month), encoding='utf-8') as handle:
+                report = MonthlyReport.from_json(self.store, json.load(handle))
+        except (FileNotFoundError, ValueError, KeyError):
+            # Missing, or saved before the cache held versions: build it again.
+            return None
+        if not self._current(report, versions):
+            self.stale += 1
+            return None
+        self.loads += 1
+        self._remember(report)
+        return report
+
+    def _save(self, report):
+        with atomic_path(self.path(report.month)) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(report.to_json(), handle, default=str)
+        self._remember(report)
+        return report
+
+    def stats(self):
+        return {'hits': self.hits, 'loads': self.loads, 'builds': self.builds,
+                'stale': self.stale, 'live': self.live, 'months': list(self._reports)}
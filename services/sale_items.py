@@ -0,0 +1,151 @@
+"""Sale line items.
+
+``sales`` holds one header row per sale (date, staff, total, payment
+method).  What was sold is in ``sale_items``, one row per cart line:
+
+* ``sale_id`` and the sale's ``date`` (the table is split by month like
+  ``sales``, see :mod:`storage.partitions`)
+* ``item_kind`` - ``'R'`` for an inventory item, ``'C'`` for a custom
+  product - and ``item_id``, the inventory id or product id
+* ``name``, ``quantity``, ``unit_price`` and ``subtotal``
+
+so what was sold is read from typed columns instead of a ``json.loads``
+of every sale.  Sales written before the table existed kept their lines
+as JSON in ``sales.items_details``; :func:`backfill` copies them over,
+resolving each line's item from its name.
+
+Run ``python -m services.sale_items [uri]`` to backfill by hand; it only adds
+the sales that have no lines yet.
+"""
+import json
+import os
+import sys
+
+import pandas as pd
+
+from storage.base import key_text
+
+
+TABLE = 'sale_items'
+COLUMNS = ['sale_id', 'date', 'item_kind', 'item_id', 'name', 'quantity', 'unit_price',
+           'subtotal']
+DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+
+
+def line_items(sale, items):
+    """``sale_items`` rows for ``sale`` and the cart ``items`` it was made from.
+
+    ``items`` is the cart the sales page posts: ``[item id, details]``
+    pairs, the id being ``R_<inventory id>`` or ``C_<product id>``.
+    """
+    lines = []
+    for item_id, details in items:
+        kind, _, number = item_id.partition('_')
+        lines.append({
+            'sale_id': sale['id'],
+            'date': sale['date'],
+            'item_kind': kind,
+            'item_id': int(number),
+            'name': details['name'],
+            'quantity': float(details['quantity']),
+            'unit_price': float(details['price']),
+            'subtotal': float(details['subtotal']),
+        })
+    return lines
+
+
+def receipt_items(store, sale):
+    """The lines of ``sale`` (a ``sales`` row) as the receipt pages show them."""
+    lines = store.find_all(TABLE, {'sale_id': sale['id'], 'date': sale['date']})
+    if not len(lines) and sale.get('items_details'):
+        # Not backfilled yet.
+        return json.loads(sale['items_details'])
+    return [{'name': line['name'], 'quantity': line['quantity'],
+             'price': line['unit_price'], 'total': line['subtotal']}
+            for line in lines.to_dict('records')]
+
+
+def _item_names(store):
+    """Item name -> (kind, id), for lines saved with only a name."""
+    names = {}
+    if store.exists('custom_products'):
+        products = store.read('custom_products', ['product_id', 'product_name'])
+        for product_id, name in zip(products['product_id'], products['product_name']):
+            names.setdefault(key_text(name), ('C', product_id))
+    if store.exists('inventory'):
+        inventory = store.read('inventory', ['id', 'stock_type'])
+        for item_id, name in zip(inventory['id'], inventory['stock_type']):
+            names.setdefault(key_text(name), ('R', item_id))
+    return names
+
+
+def backfill(store):
+    """Add ``sale_items`` rows for the sales that only have ``items_details``."""
+    store.init_table(TABLE, COLUMNS)
+    with store.locked(TABLE):
+        sales = store.read('sales', ['id', 'date', 'items_details'])
+        if 'items_details' not in sales or not len(sales):
+            return 0
+        done = set(store.read(TABLE, ['sale_id'])['sale_id'].map(key_text))
+        todo = sales[sales['items_details'].notna() & ~sales['id'].map(key_text).isin(done)]
+        names = _item_names(store)
+        lines = []
+        for sale_id, date, details in zip(todo['id'], todo['date'], todo['items_details']):
+            try:
+                items = json.loads(details) if details else []
+            except ValueError:
+                continue
+            for item in items:
+                kind, item_id = names.get(key_text(item.get('name')), (None, None))
+                lines.append({
+                    'sale_id': sale_id,
+                    'date': date,
+                    'item_kind': kind,
+                    'item_id': item_id,
+                    'name': item.get('name'),
+                    'quantity': item.get('quantity'),
+                    'unit_price': item.get('price'),
+                    'subtotal': item.get('total'),
+                })
+        if lines:
+            store.append_many(TABLE, lines)
+        return len(lines)
+
+
+def ensure(store):
+    """Create ``sale_items`` and backfill it the first time."""
+    if store.stored_tables(TABLE) and store.exists(TABLE):
+        store.init_table(TABLE, COLUMNS)
+        return 0
+    return backfill(store)
+
+
+def months(start, end):
+    """``'YYYY-MM'`` of every month from ``start`` to ``end``, for :meth:`read_partition`."""
+    month = pd.Timestamp(start).to_period('M')
+    while month <= pd.Timestamp(end).to_period('M'):
+        yield month.strftime('%Y-%m')
+        month += 1
+
+
+def items_between(store, start, end):
+    """Lines of the sales made from ``start`` to ``end`` (dates, both included).
+
+    Only the month partitions in the range are read; ``date`` comes back
+    parsed.
+    """
+    frames = [store.read_partition(TABLE, month) for month in months(start, end)]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS).assign(date=pd.Series(dtype='datetime64[ns]'))
+    lines = pd.concat(frames, ignore_index=True)
+    lines['date'] = pd.to_datetime(lines['date'].astype(str), format=DATE_FORMAT, errors='coerce')
+    days = lines['date'].dt.date
+    return lines[(days >= start) & (days <= end)].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_URL') or 'excel:///data'
+    print(f"{TABLE}: backfilled {backfill(open_storage(uri))} lines")
@@ -0,0 +1,214 @@
+"""Running sales totals per day.
+
+``sales_rollups`` holds, for every day with sales, one row per
+``(dimension, key)``:
+
+* ``day`` / ``all`` - the day's totals
+* ``product`` / product name - from the sale line items
+* ``staff`` / staff name
+* ``payment_method`` / payment method
+
+each with the number of ``sales``, the ``quantity`` of items and the
+``revenue``.  A sale adds its amounts to its day's rows as part of being
+applied by the stock ledger (:mod:`services.stock`), so a summary for any
+date range reads a few rows per day instead of every sale and line item.
+The table is split by month like ``sales``.
+
+A day's rows are only changed under that day's lock
+(:func:`day_locked`).  A sale that is applied again after a crash rebuilds
+its day from ``sales`` and ``sale_items`` instead, which gives the same
+rows however far the first attempt got.  The rebuild leaves out the sales
+still in the stock ledger: they add themselves, or rebuild the day again,
+when they are applied.
+
+Run ``python -m services.sales_rollups [uri]`` to rebuild it from history.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+import pandas as pd
+
+from services.sale_items import COLUMNS as SALE_ITEM_COLUMNS, TABLE as SALE_ITEMS, months
+from storage.base import key_text
+
+
+TABLE = 'sales_rollups'
+COLUMNS = ['day', 'dimension', 'key', 'sales', 'quantity', 'revenue']
+DAY_FORMAT = '%d-%m-%Y'
+SALE_DATE_FORMAT = '%d-%m-%Y %H:%M:%S'
+# Dimension -> sales column its keys come from (the product comes from the lines)
+DIMENSIONS = {'day': None, 'product': 'name', 'staff': 'staff_name',
+              'payment_method': 'payment_method'}
+TOTAL_KEY = 'all'
+# Key for a sale with no staff name or payment method
+UNKNOWN_KEY = '-'
+AMOUNTS = ['sales', 'quantity', 'revenue']
+
+
+def _days(dates):
+    parsed = pd.to_datetime(dates.astype(str), format=SALE_DATE_FORMAT, errors='coerce')
+    return parsed.dt.strftime(DAY_FORMAT)
+
+
+def rollup_rows(sales, lines):
+    """Rollup rows for the ``sales`` frame and its ``lines`` (``sale_items`` rows)."""
+    sales = sales.assign(day=_days(sales['date']))
+    lines = lines.assign(day=_days(lines['date']),
+                         quantity=pd.to_numeric(lines['quantity'], errors='coerce').fillna(0),
+                         subtotal=pd.to_numeric(lines['subtotal'], errors='coerce').fillna(0))
+    quantities = lines.groupby(lines['sale_id'].map(key_text))['quantity'].sum()
+    sales = sales.assign(
+        quantity=sales['id'].map(key_text).map(quantities).fillna(0),
+        revenue=pd.to_numeric(sales['total_amount'], errors='coerce').fillna(0))
+    frames = []
+    for dimension, column in DIMENSIONS.items():
+        if dimension == 'product':
+            source, sale_id, revenue = lines, 'sale_id', 'subtotal'
+        else:
+            source, sale_id, revenue = sales, 'id', 'revenue'
+        keys = (pd.Series(TOTAL_KEY, index=source.index) if column is None else
+                source[column].map(key_text).replace('', UNKNOWN_KEY) if column in source else
+                pd.Series(UNKNOWN_KEY, index=source.index))
+        grouped = (source.assign(dimension=dimension, key=keys)
+                   .groupby(['day', 'dimension', 'key'], observed=True, sort=True)
+                   .agg(sales=(sale_id, 'nunique'), quantity=('quantity', 'sum'),
+                        revenue=(revenue, 'sum'))
+                   .reset_index())
+        frames.append(grouped)
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
+
+
+def _day(date):
+    """``'DD-MM-YYYY'`` of a sale date, or None if it is not a date."""
+    day = _days(pd.Series([date])).iloc[0]
+    return None if pd.isna(day) else day
+
+
+@contextmanager
+def day_locked(store, date):
+    """Hold the lock of the rows of the day of ``date`` (a sale date)."""
+    with store.locked(f'rollups/{_day(date)}'):
+        yield
+
+
+def _sale_frames(sale, lines):
+    return (pd.DataFrame([sale]),
+            pd.DataFrame(lines, columns=['sale_id', 'date', 'name', 'quantity', 'subtotal']))
+
+
+def add(store, sale, lines):
+    """Add one sale (a ``sales`` row) and its ``sale_items`` rows to the totals.
+
+    The caller makes sure this happens once per sale; see :func:`rebuild_day`.
+    """
+    rows = rollup_rows(*_sale_frames(sale, lines))
+    if not len(rows):
+        return 0
+    day = rows['day'].iloc[0]
+    with day_locked(store, sale['date']):
+        current = {(row['dimension'], key_text(row['key'])): row
+                   for row in store.find_all(TABLE, {'day': day}).to_dict('records')}
+        new = []
+        for row in rows.to_dict('records'):
+            old = current.get((row['dimension'], row['key']))
+            if old is None:
+                new.append(row)
+                continue
+            store.update(TABLE, {'day': day, 'dimension': row['dimension'], 'key': row['key']},
+                         {amount: float(old[amount]) + float(row[amount]) for amount in AMOUNTS})
+        if new:
+            store.append_many(TABLE, new)
+    return len(rows)
+
+
+def rebuild_day(store, date, pending=None):
+    """Recompute the rows of the day of ``date`` (a sale date) from history.
+
+    ``pending()`` returns the ids of the sales not to count yet, those still
+    in the stock ledger.  It is called after the sales are read: a sale is
+    recorded after its ledger row, so every sale read and no longer pending
+    has been added already.
+    """
+    day = _day(date)
+    if day is None:
+        return 0
+    month = pd.to_datetime(day, format=DAY_FORMAT).strftime('%Y-%m')
+    with day_locked(store, date):
+        sales = store.read_partition('sales', month)
+        lines = store.read_partition(SALE_ITEMS, month)
+        if not len(lines):
+            lines = pd.DataFrame(columns=SALE_ITEM_COLUMNS)
+        sales = sales[(_days(sales['date']) == day).to_numpy()] if len(sales) else sales
+        lines = lines[(_days(lines['date']) == day).to_numpy()] if len(lines) else lines
+        skip = pending() if pending is not None else set()
+        if skip and len(sales):
+            sales = sales[~sales['id'].map(key_text).isin(skip).to_numpy()]
+            lines = lines[~lines['sale_id'].map(key_text).isin(skip).to_numpy()]
+        store.delete(TABLE, {'day': day})
+        if not len(sales):
+            return 0
+        rows = rollup_rows(sales, lines)
+        store.append_many(TABLE, rows.to_dict('records'))
+        return len(rows)
+
+
+def rebuild(store):
+    """Recompute every row from ``sales`` and ``sale_items``."""
+    with store.locked(TABLE):
+        sales = store.read('sales', ['id', 'date', 'staff_name', 'payment_method', 'total_amount'])
+        lines = store.read(SALE_ITEMS, ['sale_id', 'date', 'name', 'quantity', 'subtotal'])
+        if not len(sales):
+            rows = pd.DataFrame(columns=COLUMNS)
+        else:
+            rows = rollup_rows(sales, lines)
+            rows = rows[rows['day'].notna()]
+        store.write(TABLE, rows)
+        return len(rows)
+
+
+def ensure(store):
+    """Create ``sales_rollups`` and build it from history the first time."""
+    store.init_table(TABLE, COLUMNS)
+    if store.stored_tables(TABLE) or not store.exists('sales'):
+        return 0
+    return rebuild(store)
+
+
+def summary(store, start, end):
+    """Sales totals from ``start`` to ``end`` (dates, both included).
+
+    Returns the range's totals, one row per day, and the rows per product,
+    staff member and payment method, biggest revenue first.
+    """
+    frames = [store.read_partition(TABLE, month) for month in months(start, end)]
+    rows = pd.concat([frame for frame in frames if len(frame)] or [pd.DataFrame(columns=COLUMNS)],
+                     ignore_index=True)
+    days = pd.to_datetime(rows['day'].astype(str), format=DAY_FORMAT, errors='coerce')
+    rows = rows[((days.dt.date >= start) & (days.dt.date <= end)).to_numpy()]
+    rows = rows.assign(key=rows['key'].map(key_text),
+                       **{amount: pd.to_numeric(rows[amount], errors='coerce').fillna(0)
+                          for amount in AMOUNTS})
+
+    totals = rows[rows['dimension'] == 'day']
+    by_day = (totals.assign(order=pd.to_datetime(totals['day'], format=DAY_FORMAT))
+              .sort_values('order')[['day'] + AMOUNTS])
+    result = {
+        'start': start.strftime(DAY_FORMAT),
+        'end': end.strftime(DAY_FORMAT),
+        'totals': {'sales': int(totals['sales'].sum()), 'quantity': float(totals['quantity'].sum()),
+                   'revenue': float(totals['revenue'].sum())},
+        'days': by_day.to_dict('records'),
+    }
+    for dimension in ('product', 'staff', 'payment_method'):
+        grouped = (rows[rows['dimension'] == dimension].groupby('key')[AMOUNTS].sum()
+                   .sort_values('revenue', ascending=False).reset_index())
+        result[dimension] = grouped.to_dict('records')
+    return result
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_URL') or 'excel:///data'
+    print(f"{TABLE}: {rebuild(open_storage(uri))} rows")
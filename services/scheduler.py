@@ -0,0 +1,68 @@
+"""Jobs that run in the background once a day.
+
+Every worker process starts its own scheduler thread, so a job may run
+once per worker each day: jobs must be safe to repeat, which the member
+status roll-forward is (it takes the table lock and returns early once the
+table is current).  The thread wakes every ``interval`` seconds and runs
+the jobs that have not run yet today; a job that fails is retried on the
+next wake-up.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class DailyScheduler:
+    def __init__(self, interval=300, logger=None):
+        self.interval = interval
+        self.logger = logger
+        self.jobs = []
+        self.last_run = {}
+        self.runs = 0
+        self.failures = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def add(self, name, job):
+        """Run ``job(now)`` once a day."""
+        self.jobs.append((name, job))
+
+    def start(self):
+        """Start the thread, once per process (gunicorn forks workers after import)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.last_run = {}
+        threading.Thread(target=self._loop, name='daily-scheduler', daemon=True).start()
+
+    def run_due(self, now=None):
+        now = datetime.now() if now is None else now
+        for name, job in self.jobs:
+            if self.last_run.get(name) == now.date():
+                continue
+            try:
+                result = job(now)
+            except Exception as e:
+                self.failures += 1
+                if self.logger:
+                    self.logger.error(f"Error running daily job {name}: {e}")
+                continue
+            self.last_run[name] = now.date()
+            self.runs += 1
+            if self.logger:
+                self.logger.info(f"Daily job {name}: {result}")
+
+    def _loop(self):
+        while True:
+            self.run_due()
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            'jobs': [name for name, _ in self.jobs],
+            'last_run': {name: day.isoformat() for name, day in self.last_run.items()},
+            'runs': self.runs,
+            'failures': self.failures,
+        }
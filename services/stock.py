@@ -0,0 +1,200 @@
+"""Stock ledger for sales.
+
+A sale takes servings from one or more inventory items (a custom product
+takes them from each of its ingredients).  :meth:`StockLedger.sell` does
+that all or nothing:
+
+1. it expands the cart into servings per item with the custom products'
+   compiled bills of materials (:mod:`services.bom`);
+2. it takes the lock of every item the sale touches, in id order, so sales
+   of different items run side by side and sales of the same item queue;
+3. it checks the whole sale against the current stock, which is kept in
+   memory and reloaded only when the inventory table's version changes;
+4. it appends one row to ``stock_ledger`` holding the sale record, its
+   line items and the items' new servings.  That single append is the
+   commit: once it is on disk the sale happens, and if the process dies
+   before it the sale never did;
+5. it applies the row (sets the servings, adds the sale and its lines
+   unless they are there already, adds the sale to the running totals of
+   :mod:`services.sales_rollups`) and deletes it.
+
+A ledger row left behind by a process that died between 4 and 5 is
+applied again, under the same item locks, by the next sale of any of its
+items, by the next edit of any of its items (:meth:`StockLedger.editing`)
+or by :meth:`StockLedger.recover` at startup.  Applying is idempotent:
+servings are set, not decremented, the sale and its lines are added once
+and the sale's day of totals is rebuilt rather than added to.  Because the
+servings are set, nothing else may write an item's servings while a row
+for it is pending: an edit or restock made first would be overwritten.
+
+Sales of different items only meet on the lock of their day's totals,
+held just to update the totals and delete the ledger row.
+"""
+import json
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from services import sales_rollups
+from services.sale_items import TABLE as SALE_ITEMS
+from storage.base import key_text
+
+
+LEDGER = 'stock_ledger'
+LEDGER_COLUMNS = ['sale_id', 'created_at', 'levels', 'sale', 'lines']
+
+
+class OutOfStock(ValueError):
+    """A sale asks for more servings than an item has, or for an unknown item."""
+
+
+class StockLedger:
+    def __init__(self, store, boms):
+        self.store = store
+        self.boms = boms
+        self._stock = {}
+        self._version = None
+        self.sales = 0
+        self.reloads = 0
+        self.recovered = 0
+
+    def ensure(self):
+        self.store.init_table(LEDGER, LEDGER_COLUMNS)
+        return self.recover()
+
+    @contextmanager
+    def locked(self, item_ids):
+        """Hold the stock locks of ``item_ids``, taken in a fixed order."""
+        with ExitStack() as stack:
+            for key in sorted({key_text(item_id) for item_id in item_ids}, key=_sort_key):
+                stack.enter_context(self.store.locked(f'stock/{key}'))
+            yield
+
+    @contextmanager
+    def editing(self, item_ids):
+        """Hold the stock locks of ``item_ids`` for a write outside a sale.
+
+        Pending sales of the items are applied first, so the write is not
+        overwritten by their recovery later.
+        """
+        keys = [key_text(item_id) for item_id in item_ids]
+        while True:
+            with self.locked(keys):
+                pending = self._pending(keys)
+                if not pending:
+                    yield
+                    return
+            for entry in pending:
+                self._recover(entry)
+
+    # Stock -----------------------------------------------------------------
+
+    def servings(self, item_id):
+        """Current servings of ``item_id``, or None for an unknown item."""
+        version = self.store.version('inventory')
+        if version is None or version != self._version:
+            inventory = self.store.read('inventory', ['id', 'servings'])
+            self._stock = dict(zip(inventory['id'].map(key_text), inventory['servings']))
+            self._version = version
+            self.reloads += 1
+        return self._stock.get(key_text(item_id))
+
+    def movements(self, items):
+        """Servings the cart ``items`` takes, see :meth:`BillsOfMaterials.expand`."""
+        try:
+            return self.boms.expand(items)
+        except KeyError as e:
+            raise OutOfStock(e.args[0]) from None
+
+    # Selling ---------------------------------------------------------------
+
+    def sell(self, sale, items, lines):
+        """Take the stock for cart ``items`` and record ``sale`` and its ``lines``.
+
+        All or nothing; ``lines`` are the sale's ``sale_items`` rows.
+        """
+        taken = self.movements(items)
+        while True:
+            with self.locked(taken):
+                pending = self._pending(taken)
+                if not pending:
+                    levels = {}
+                    for key, (servings, label) in taken.items():
+                        current = self.servings(key)
+                        if current is None:
+                            raise OutOfStock(f"Inventory item {key} not found")
+                        if current < servings:
+                            raise OutOfStock(f"Insufficient stock for {label}")
+                        levels[key] = current - servings
+                    entry = {
+                        'sale_id': sale['id'],
+                        'created_at': datetime.now().strftime('%d-%m-%Y %H:%M:%S'),
+                        'levels': json.dumps(levels),
+                        'sale': json.dumps(sale),
+                        'lines': json.dumps(lines),
+                    }
+                    self.store.append(LEDGER, entry)
+                    self._apply(entry, fresh=True)
+                    self.sales += 1
+                    return levels
+            # A sale of these items was committed by a process that died
+            # before applying it: apply it under its own locks, then retry.
+            for entry in pending:
+                self._recover(entry)
+
+    def committed(self, sale_id):
+        """Whether the sale ``sale_id`` happened (it may not be applied yet)."""
+        return (self.store.find(LEDGER, {'sale_id': sale_id}) is not None
+                or self.store.find('sales', {'id': sale_id}) is not None)
+
+    def _pending(self, item_ids=None):
+        rows = self.store.read(LEDGER).to_dict('records') if self.store.exists(LEDGER) else []
+        if item_ids is None:
+            return rows
+        keys = set(item_ids)
+        return [row for row in rows if keys & set(json.loads(row['levels']))]
+
+    def _apply(self, entry, fresh=False):
+        for key, servings in json.loads(entry['levels']).items():
+            self.store.update('inventory', {'id': key}, {'servings': servings})
+        sale = json.loads(entry['sale'])
+        lines = entry.get('lines')
+        lines = json.loads(lines) if isinstance(lines, str) and lines else []
+        self.store.append('sales', sale, unique=['id'])
+        # A sale being recovered may have got its lines before the crash.
+        if lines and (fresh or self.store.find(
+                SALE_ITEMS, {'date': sale['date'], 'sale_id': sale['id']}) is None):
+            self.store.append_many(SALE_ITEMS, lines)
+        # The ledger row goes under the day's lock too: a rebuild of the day
+        # counts exactly the sales whose row is gone (see rebuild_day).
+        with sales_rollups.day_locked(self.store, sale['date']):
+            if fresh:
+                sales_rollups.add(self.store, sale, lines)
+            else:
+                sales_rollups.rebuild_day(self.store, sale['date'],
+                                          pending=lambda: self._pending_sales(sale['id']))
+            self.store.delete(LEDGER, {'sale_id': entry['sale_id']})
+
+    def _pending_sales(self, sale_id):
+        """Ids of the sales with a ledger row, other than ``sale_id``."""
+        return {key_text(row['sale_id']) for row in self._pending()} - {key_text(sale_id)}
+
+    def _recover(self, entry):
+        with self.locked(json.loads(entry['levels'])):
+            if self.store.find(LEDGER, {'sale_id': entry['sale_id']}) is not None:
+                self._apply(entry)
+                self.recovered += 1
+
+    def recover(self):
+        """Apply the sales committed but not applied by a process that died."""
+        pending = self._pending()
+        for entry in pending:
+            self._recover(entry)
+        return len(pending)
+
+    def stats(self):
+        return {'sales': self.sales, 'reloads': self.reloads, 'recovered': self.recovered,
+                'items': len(self._stock)}
+
+
+def _sort_key(key):
+    return (0, int(key), key) if key.isdigit() else (1, 0, key)
@@ -0,0 +1,52 @@
+// Background jobs: reports and receipt PDFs are built on the server while
+// the page polls; the file is downloaded once the job is done.
+function runJob(url, options = {}, button = null) {
+    const label = button ? button.innerHTML : null;
+    if (button) {
+        button.disabled = true;
+        button.innerHTML = 'Preparing...';
+    }
+    const done = () => {
+        if (button) {
+            button.disabled = false;
+            button.innerHTML = label;
+        }
+    };
+
+    return fetch(url, options)
+        .then(response => response.json().then(job => {
+            if (!response.ok) {
+                throw new Error(job.error || 'Failed to start the download');
+            }
+            return pollJob(job);
+        }))
+        .then(job => {
+            window.location.href = job.result_url;
+            done();
+        })
+        .catch(error => {
+            alert(error.message);
+            done();
+        });
+}
+
+function pollJob(job, delay = 500) {
+    return new Promise(resolve => setTimeout(resolve, delay))
+        .then(() => fetch(job.status_url))
+        .then(response => response.json())
+        .then(status => {
+            if (status.status === 'done') {
+                return job;
+            }
+            if (status.status === 'failed' || status.error) {
+                throw new Error(status.error || 'The download failed');
+            }
+            return pollJob(job, Math.min(delay * 2, 5000));
+        });
+}
+
+function submitJobForm(form) {
+    runJob(form.action, {method: 'POST', body: new FormData(form)},
+           form.querySelector('button[type="submit"]'));
+    return false;
+}
@@ -0,0 +1,40 @@
+"""Storage backends for the gym data tables.
+
+Routes go through the :class:`Storage` table API instead of calling
+``pd.read_excel``/``to_excel`` directly.  The backend is chosen from a
+database URI (``Config.SQLALCHEMY_DATABASE_URI``):
+
+* ``excel:///data`` - one workbook per table in ``data/`` (default), with
+  parsed workbooks cached per process and revalidated by ``stat()``, and
+  memory-mapped Arrow snapshots of them when pyarrow is installed
+* ``sqlite:///data/gym.db`` - a SQLite database in WAL mode, seeded from the
+  workbooks in ``data/`` the first time each table is opened
+
+Either way the history tables (attendance, sales, payments) are split into
+one table per month by :class:`~storage.partitions.PartitionedStorage`.
+"""
+import os
+
+from storage.base import Storage
+from storage.excel import ExcelStorage
+from storage.partitions import PartitionedStorage
+from storage.sqlite import SQLiteStorage
+
+
+def open_storage(uri, data_dir='data', cache_max_bytes=None, id_block_size=1, seed=True):
+    """Backend for ``uri``; ``seed=False`` stops SQLite seeding from ``data_dir``."""
+    scheme, sep, location = uri.partition(':///')
+    if not sep:
+        raise ValueError(f"Unsupported database URI: {uri}")
+    if scheme == 'excel':
+        store = ExcelStorage(location or data_dir, cache_max_bytes=cache_max_bytes,
+                             id_block_size=id_block_size)
+    elif scheme == 'sqlite':
+        store = SQLiteStorage(location or os.path.join(data_dir, 'gym.db'),
+                              seed_dir=data_dir if seed else None, id_block_size=id_block_size)
+    else:
+        raise ValueError(f"Unsupported database URI: {uri}")
+    return PartitionedStorage(store)
+
+
+__all__ = ['Storage', 'ExcelStorage', 'SQLiteStorage', 'PartitionedStorage', 'open_storage']
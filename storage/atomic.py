@@ -0,0 +1,50 @@
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+from storage.locks import retry
+
+
+def fsync_dir(directory):
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path that replaces ``path`` once the block succeeds.
+
+    The temporary file lives next to ``path`` so the final ``os.replace`` is
+    an atomic rename: readers see either the old file or the complete new
+    one, never a half-written workbook.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    base, ext = os.path.splitext(os.path.basename(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{base}.tmp-', suffix=ext, dir=directory)
+    os.close(fd)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    os.chmod(tmp_path, mode)
+    try:
+        yield tmp_path
+        with open(tmp_path, 'rb+') as handle:
+            os.fsync(handle.fileno())
+        retry(lambda: os.replace(tmp_path, path))
+        fsync_dir(directory)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_excel(df, path, **kwargs):
+    """``df.to_excel(path)`` via a temporary file and an atomic rename."""
+    kwargs.setdefault('index', False)
+    with atomic_path(path) as tmp_path:
+        df.to_excel(tmp_path, **kwargs)
@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class Storage:
+    """Table API shared by every storage backend.
+
+    Tables are addressed by name (``'members'``, ``'payments'``, ...) and rows
+    are matched with a ``where`` dict of column -> value.  Values are compared
+    the way the routes always have: ``1001`` and ``'1001'`` are the same key,
+    and ``None`` matches empty cells.
+    """
+
+    def init_table(self, table, columns):
+        """Create ``table`` with ``columns`` if it does not exist yet."""
+        raise NotImplementedError
+
+    def exists(self, table):
+        raise NotImplementedError
+
+    def seed_file(self, table):
+        """Workbook ``init_table`` would load ``table`` from, if the backend seeds."""
+        return None
+
+    def stored_tables(self, table):
+        """Tables the rows of ``table`` are stored in; just ``table`` itself here."""
+        return [table]
+
+    def version(self, table):
+        """A string that changes whenever ``table`` is written to.
+
+        Two equal versions mean the rows have not changed in between, so a
+        copy taken at the first one is still current.  None when the backend
+        cannot tell.
+        """
+        return None
+
+    def read(self, table, columns=None):
+        """Return the whole table as a DataFrame.
+
+        With ``columns`` only those columns are returned (the ones the table
+        has, in the order asked for), and backends avoid loading the rest.
+        """
+        raise NotImplementedError
+
+    def write(self, table, df):
+        """Replace the contents of ``table`` with ``df``."""
+        raise NotImplementedError
+
+    def append(self, table, row, unique=None):
+        """Add a single row (a dict) to ``table``.
+
+        With ``unique`` (a list of columns) the row is only added when no
+        existing row has the same values in those columns.  Returns whether
+        the row was added.
+        """
+        raise NotImplementedError
+
+    def append_many(self, table, rows):
+        """Add ``rows`` (dicts) to ``table`` in as few writes as the backend can.
+
+        Returns the number of rows added.
+        """
+        rows = list(rows)
+        for row in rows:
+            self.append(table, row)
+        return len(rows)
+
+    def read_chunks(self, table, columns=None, chunk_rows=10000):
+        """Yield the rows of ``table`` as DataFrames of up to ``chunk_rows`` rows.
+
+        Backends that can stream do so without loading the whole table.
+        """
+        df = self.read(table, columns)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+
+    def find(self, table, where):
+        """Return the first row matching ``where`` as a dict, or None."""
+        raise NotImplementedError
+
+    def find_all(self, table, where):
+        """Return every row matching ``where`` as a DataFrame."""
+        raise NotImplementedError
+
+    def update(self, table, where, fields):
+        """Set ``fields`` on every row matching ``where``; return the count."""
+        raise NotImplementedError
+
+    def delete(self, table, where):
+        """Remove every row matching ``where``; return the count."""
+        raise NotImplementedError
+
+    def drop(self, table):
+        """Remove ``table`` and everything stored for it."""
+        raise NotImplementedError
+
+    def next_id(self, table, column, start=1):
+        """Allocate a new ID for ``table`` without reading it.
+
+        IDs come from a persistent sequence named after the table, shared by
+        every worker.  The first call seeds it from ``max(column) + 1`` (or
+        ``start`` for an empty table); after that the table is never read.
+        """
+        return self.sequences.next(table, lambda: self.seed_id(table, column, start))
+
+    def advance_id(self, table, column, start=1):
+        """Move ``table``'s ID sequence past the highest ``column`` it holds.
+
+        For after the table was written back wholesale (a restore), so new
+        IDs do not collide with the rows written back.
+        """
+        seed = lambda: self.seed_id(table, column, start)
+        self.sequences.advance(table, seed(), seed)
+
+    def seed_id(self, table, column, start=1):
+        if not self.exists(table):
+            return start
+        df = self.read(table)
+        if column not in df.columns:
+            return start
+        highest = pd.to_numeric(df[column], errors='coerce').max()
+        return start if pd.isna(highest) else max(start, int(highest) + 1)
+
+    @contextmanager
+    def locked(self, table):
+        """Hold ``table``'s write lock across a read-check-write sequence.
+
+        Backends that coordinate writers across processes set ``self.locks``
+        to a :class:`~storage.locks.TableLocks`; the lock is re-entrant, so
+        storage calls made inside the block can take it again.
+        """
+        locks = getattr(self, 'locks', None)
+        if locks is None:
+            yield
+            return
+        with locks.locked(table):
+            yield
+
+    def stats(self):
+        """Backend counters for the storage stats endpoint."""
+        return {}
+
+
+def project(df, columns):
+    """The ``columns`` of ``df`` that exist, as a new frame."""
+    return df[[column for column in columns if column in df.columns]]
+
+
+def base_table(table):
+    """``'attendance'`` for a partition table such as ``'attendance/2026-10'``."""
+    return table.split('/', 1)[0]
+
+
+def key_text(value):
+    """Normalise a key value so ``1001``, ``1001.0`` and ``'1001'`` agree."""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ''
+    if isinstance(value, float):
+        if value != value:
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    if hasattr(value, 'item') and not isinstance(value, str):
+        return key_text(value.item())
+    return str(value)
+
+
+def match_mask(df, where):
+    """Boolean mask of the rows in ``df`` matching every ``where`` entry."""
+    mask = pd.Series(True, index=df.index)
+    for column, value in where.items():
+        if column not in df.columns:
+            return pd.Series(False, index=df.index)
+        series = df[column]
+        if value is None:
+            mask &= series.isna()
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            try:
+                mask &= (series == float(value)).fillna(False).astype(bool)
+            except (TypeError, ValueError):
+                return pd.Series(False, index=df.index)
+        else:
+            if isinstance(series.dtype, pd.CategoricalDtype) and \
+                    len(series) < len(series.cat.categories):
+                # A categorical maps every category; for a few rows (an
+                # index's shortlist) mapping the rows is cheaper.
+                series = series.astype(object)
+            mask &= series.map(key_text) == key_text(value)
+    return mask
@@ -0,0 +1,117 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_stamp(path):
+    """``(mtime_ns, size, inode)`` of ``path``, or None when it is missing.
+
+    The inode is included so a file replaced by rename within the same clock
+    tick still looks changed.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class TableCache:
+    """Process-wide cache of parsed DataFrames keyed by file path.
+
+    Entries are validated against the file's :func:`file_stamp` on every
+    lookup, so a worker only pays for a ``stat()`` when another process has
+    not touched the file, and re-parses it when it has.  Writers in this
+    process call :meth:`invalidate` right after replacing a file.  The cache
+    is an LRU bounded by the deep memory size of the cached frames.
+
+    A file can have several entries: the full frame under ``key=path`` and
+    narrow projections under other keys (see ``ExcelStorage.read``).  All of
+    them are validated against, and invalidated with, the same file.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, loader, key=None):
+        """Return the cached frame for ``path`` (not a copy), loading on miss."""
+        key = path if key is None else key
+        stamp = file_stamp(path)
+        df = self._lookup(key, stamp)
+        if df is not None:
+            return df
+        with self._lock:
+            self.misses += 1
+        df = loader(path)
+        self.put(path, stamp, df, key)
+        return df
+
+    def peek(self, path, key=None):
+        """The frame cached under ``key`` if ``path`` has not changed, else None."""
+        return self._lookup(path if key is None else key, file_stamp(path))
+
+    def _lookup(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and stamp is not None and entry[1] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+        return None
+
+    def put(self, path, stamp, df, key=None):
+        if stamp is None:
+            return
+        key = path if key is None else key
+        size = frame_bytes(df)
+        with self._lock:
+            if key == path:
+                # The full frame makes any projection of the file redundant.
+                self._discard_file(path)
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (path, stamp, df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._discard_file(path)
+
+    def _discard_file(self, path):
+        for key in [key for key, entry in self._entries.items() if entry[0] == path]:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,565 @@
+import os
+import threading
+import time
+import zipfile
+from contextlib import ExitStack
+from itertools import chain
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.worksheet._reader import ROW_TAG, WorkSheetParser
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import iterparse
+
+from storage.atomic import write_excel
+from storage.base import Storage, base_table, match_mask, project
+from storage.cache import TableCache, file_stamp
+from storage.indexes import INDEXES, HashIndex
+from storage.journal import Journal, apply_records
+from storage.locks import TableLocks, retry
+from storage.schema import apply_schema, coerce_row
+from storage.sequences import Sequences, reserve_file
+from storage.snapshots import available as snapshots_available
+from storage.snapshots import (open_snapshot, read_snapshot, remove_snapshot, snapshot_path,
+                               write_snapshot)
+from storage.writer import GroupCommitWriter
+
+
+def prepare_record(frame, operation, rows=None):
+    """Turn a queued mutation into a journal record and the caller's result.
+
+    ``rows(where)`` returns the matching rows of ``frame``; it defaults to a
+    scan and is replaced by an index lookup where one applies.
+    """
+    if rows is None:
+        rows = lambda where: frame[match_mask(frame, where)]
+    kind = operation[0]
+    if kind == 'append':
+        _, row, unique = operation
+        if unique and not rows({column: row.get(column) for column in unique}).empty:
+            return None, False
+        return {'op': 'append', 'row': row}, True
+    count = len(rows(operation[1]))
+    if not count:
+        return None, 0
+    if kind == 'update':
+        return {'op': 'update', 'where': operation[1], 'fields': operation[2]}, count
+    return {'op': 'delete', 'where': operation[1]}, count
+
+
+def read_workbook(path):
+    # A workbook saved by hand in Excel can be caught mid-write; retry that.
+    return retry(lambda: pd.read_excel(path), exceptions=(OSError, zipfile.BadZipFile))
+
+
+SHEET_DATA_TAG = '{%s}sheetData' % SHEET_MAIN_NS
+
+
+class RowParser(WorkSheetParser):
+    """openpyxl's sheet parser, cut down to the rows.
+
+    openpyxl empties each ``<row>`` element once parsed but leaves it under
+    ``<sheetData>``, so read-only mode still grows with the sheet; this
+    drops them as it goes and streams in constant memory.
+    """
+
+    def rows(self):
+        sheet_data = None
+        for event, element in iterparse(self.source, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == SHEET_DATA_TAG:
+                    sheet_data = element
+            elif element.tag == ROW_TAG:
+                number, cells = self.parse_row(element)
+                sheet_data.clear()
+                self.row_dimensions.clear()
+                values = [None] * (cells[-1]['column'] if cells else 0)
+                for cell in cells:
+                    values[cell['column'] - 1] = cell['value']
+                yield number, tuple(values)
+
+
+def iter_workbook(path):
+    """Yield the header, then ``(row number, values)`` for every non-empty row.
+
+    The first sheet is streamed row by row (see ``RowParser``) and the
+    workbook stays open (so a rename over ``path`` does not affect it) until
+    the generator is closed.
+    """
+    workbook = retry(lambda: load_workbook(path, read_only=True, data_only=True),
+                     exceptions=(OSError, zipfile.BadZipFile))
+    try:
+        sheet = workbook.worksheets[0]
+        with sheet._get_source() as source:
+            rows = RowParser(source, sheet._shared_strings, data_only=True,
+                             epoch=workbook.epoch, date_formats=workbook._date_formats).rows()
+            number, header = next(rows, (1, ()))
+            if number != 1:
+                rows, header = chain([(number, header)], rows), ()
+            yield [None if name is None else str(name) for name in header]
+            for number, values in rows:
+                if any(value is not None and value != '' for value in values):
+                    yield number, values
+    finally:
+        workbook.close()
+
+
+# History tables that only ever grow by a row at a time, and members,
+# member_status, renewals, inventory, stock_ledger, sales_rollups and
+# idempotency_keys, which change a row at a time; their writes go to an
+# append-only journal instead of rewriting the workbook.
+JOURNALED_TABLES = ('attendance', 'trainer_attendance', 'sales', 'sale_items', 'payments',
+                    'members', 'member_status', 'renewals', 'inventory', 'stock_ledger',
+                    'sales_rollups', 'idempotency_keys')
+
+
+class ExcelStorage(Storage):
+    """One ``<table>.xlsx`` workbook per table under ``data_dir``.
+
+    Writes rewrite the whole workbook, which is how the app has always
+    worked; it is kept as the default backend so the files in ``data/`` stay
+    the system of record.  Parsed workbooks are typed with
+    :func:`~storage.schema.apply_schema` and kept in a :class:`TableCache`
+    so repeated reads of an unchanged file cost a ``stat()``.
+
+    Tables in ``journaled_tables``, and their partitions ``<table>/<key>``,
+    are the exception: appends, updates and deletes are recorded in
+    ``data/journal/<table>.jsonl`` and replayed on top of the workbook (the
+    snapshot) when the table is read.  A background thread folds the
+    journal back into the workbook once it grows past ``compact_bytes`` or
+    is older than ``compact_max_age`` seconds.
+
+    Every read-modify-write holds the table's lock in ``data/.locks`` and
+    workbooks are replaced by rename, so several gunicorn workers can share
+    the same ``data/`` directory without lost updates or torn files.
+
+    Mutations are funnelled through one :class:`GroupCommitWriter` per table:
+    everything that arrives within ``commit_window`` seconds is applied in
+    order and persisted with a single workbook rewrite or journal fsync.
+    ``append(..., unique=[...])`` and ``update`` with a ``where`` on the
+    current value are evaluated inside the batch, so check-then-write
+    sequences stay race free without holding the table lock in the route.
+
+    ``find``/``find_all`` on the columns listed in ``indexes`` go through a
+    :class:`HashIndex` instead of scanning the table.  The index follows the
+    journal, so appending a row only indexes that row.
+
+    With ``snapshots`` on (and pyarrow installed) every workbook parsed or
+    written also gets a memory-mapped Arrow snapshot, so a cold load in a
+    fresh worker skips openpyxl; see :mod:`storage.snapshots`.
+    """
+
+    def __init__(self, data_dir='data', cache_max_bytes=None,
+                 journaled_tables=JOURNALED_TABLES, compact_bytes=256 * 1024,
+                 compact_max_age=600, compact_interval=30, commit_window=0.005,
+                 indexes=INDEXES, id_block_size=1, snapshots=True):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.cache = TableCache() if cache_max_bytes is None else TableCache(cache_max_bytes)
+        self.locks = TableLocks(os.path.join(data_dir, '.locks'))
+        self.sequences = Sequences(
+            reserve_file(os.path.join(data_dir, 'sequences'), self.locks), id_block_size)
+        self.journaled_tables = set(journaled_tables)
+        self.compact_bytes = compact_bytes
+        self.compact_max_age = compact_max_age
+        self.compact_interval = compact_interval
+        self.commit_window = commit_window
+        self.compactions = 0
+        self._journals = {}
+        self._writers = {}
+        self._views = {}
+        self._lineage = {}
+        self.index_columns = indexes
+        self._indexes = {}
+        self._index_lock = threading.Lock()
+        self._last_compaction = {}
+        self._compactor_pid = None
+        self._lock = threading.Lock()
+        self.snapshots = snapshots and snapshots_available()
+        self.snapshot_loads = 0
+        self.snapshot_writes = 0
+
+    def path(self, table):
+        return os.path.join(self.data_dir, f'{table}.xlsx')
+
+    def snapshot_path(self, table):
+        return snapshot_path(self.data_dir, table)
+
+    def journal(self, table):
+        with self._lock:
+            journal = self._journals.get(table)
+            if journal is None:
+                journal = Journal(os.path.join(self.data_dir, 'journal', f'{table}.jsonl'))
+                self._journals[table] = journal
+            return journal
+
+    def init_table(self, table, columns):
+        if self.exists(table):
+            return
+        with self.locked(table):
+            if not self.exists(table):
+                write_excel(pd.DataFrame(columns=list(columns)), self.path(table))
+
+    def exists(self, table):
+        return os.path.exists(self.path(table))
+
+    def journaled(self, table):
+        return base_table(table) in self.journaled_tables
+
+    def version(self, table):
+        # The workbook's stamp, and the journal's for tables that have one:
+        # every write replaces the one or appends to the other.  An empty
+        # journal counts as missing, since the first read creates it.
+        stamps = [file_stamp(self.path(table))]
+        if self.journaled(table):
+            stamp = file_stamp(self.journal(table).path)
+            stamps.append(stamp if stamp is not None and stamp[1] else None)
+        return ' '.join('-' if stamp is None else '.'.join(map(str, stamp)) for stamp in stamps)
+
+    def journaled_on_disk(self):
+        """Journaled tables with a journal file, including other workers' ones."""
+        root = os.path.join(self.data_dir, 'journal')
+        tables = set()
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if name.endswith('.jsonl'):
+                    path = os.path.relpath(os.path.join(directory, name[:-len('.jsonl')]), root)
+                    tables.add(path.replace(os.sep, '/'))
+        return sorted(table for table in tables if self.journaled(table))
+
+    def _parse(self, table, path):
+        """Typed frame of the workbook at ``path``, from its snapshot if current."""
+        stamp = file_stamp(path)
+        if self.snapshots:
+            frame = read_snapshot(self.snapshot_path(table), stamp)
+            if frame is not None:
+                self.snapshot_loads += 1
+                return frame
+        frame = apply_schema(read_workbook(path), table)
+        self._save_snapshot(table, frame, stamp)
+        return frame
+
+    def _save_snapshot(self, table, frame, stamp):
+        if not self.snapshots:
+            return
+        try:
+            if write_snapshot(frame, self.snapshot_path(table), stamp):
+                self.snapshot_writes += 1
+        except OSError:
+            # Only a speed-up; the workbook is already safe on disk.
+            pass
+
+    def _load(self, table, columns=None):
+        path = self.path(table)
+        loader = lambda path: self._parse(table, path)
+        if columns is None:
+            return self.cache.get(path, loader)
+        key = (path, tuple(columns))
+        for cached_key in (path, key):
+            frame = self.cache.peek(path, cached_key)
+            if frame is not None:
+                return frame if cached_key == key else project(frame, columns)
+        # openpyxl parses every cell whatever usecols says, so parse once and
+        # keep the whole frame; only when that is too big for the cache is
+        # the narrow projection kept instead.
+        stamp = file_stamp(path)
+        frame = project(self.cache.get(path, loader), columns)
+        if self.cache.peek(path) is None:
+            self.cache.put(path, stamp, frame, key)
+        return frame
+
+    def _frame(self, table):
+        # Shared cached frame; callers must not mutate it.
+        if self.journaled(table):
+            return self._view(table)
+        return self._load(table)
+
+    def _view(self, table):
+        """Snapshot plus journal, replaying only records not yet applied."""
+        journal = self.journal(table)
+        path = self.path(table)
+        with journal.locked():
+            snapshot = self._load(table)
+            stamp = file_stamp(path)
+            view = self._views.get(table)
+            if view is None or view[0] != stamp or view[1] > journal.size():
+                base, offset = snapshot, 0
+            else:
+                _, offset, base = view
+            records, offset = journal.read_from(offset)
+            frame = apply_records(base, records) if records else base
+            self._views[table] = (stamp, offset, frame)
+            if records:
+                # Lets the indexes catch up from ``base`` instead of rebuilding.
+                self._lineage[table] = (frame, base, records)
+            return frame
+
+    def _write_file(self, table, df):
+        path = self.path(table)
+        try:
+            write_excel(df, path)
+            if self.snapshots:
+                # Typed the way a fresh parse of the new workbook would be,
+                # categories included.
+                parsed = df.astype({column: object for column in df.select_dtypes('category')})
+                self._save_snapshot(table, apply_schema(parsed, table), file_stamp(path))
+        finally:
+            self.cache.invalidate(path)
+            self._views.pop(table, None)
+
+    def read(self, table, columns=None):
+        if columns is None:
+            return self._frame(table).copy()
+        if self.journaled(table):
+            return project(self._frame(table), columns)
+        return self._load(table, columns).copy()
+
+    def read_chunks(self, table, columns=None, chunk_rows=10000):
+        """Stream the table ``chunk_rows`` rows at a time.
+
+        A table that is cached already is sliced.  Otherwise the workbook's
+        snapshot is sliced if it is current, or the workbook is streamed
+        by openpyxl.  For a journaled table the journal is read, and the
+        snapshot or workbook opened, under the journal lock, so a compaction
+        meanwhile changes neither; updates and deletes are replayed on each
+        chunk and the appended rows follow the stored ones.
+        """
+        if self.cache.peek(self.path(table)) is not None:
+            frame = self._frame(table)
+            for start in range(0, len(frame), chunk_rows):
+                chunk = frame.iloc[start:start + chunk_rows]
+                yield (chunk if columns is None else project(chunk, columns)).copy()
+            return
+        records = []
+        with ExitStack() as stack:
+            if self.journaled(table):
+                stack.enter_context(self.journal(table).locked())
+                records, _ = self.journal(table).read_from(0)
+            header, chunks = self._stored_chunks(table, chunk_rows)
+        changes = [record for record in records if record.get('op') != 'append']
+        for chunk in chunks:
+            if changes:
+                chunk = apply_records(chunk, changes)
+            yield chunk if columns is None else project(chunk, columns)
+        if any(record.get('op') == 'append' for record in records):
+            # Replayed on an empty table, the records leave just the rows
+            # they appended, as later records changed them.
+            appended = apply_schema(apply_records(pd.DataFrame(columns=header), records), table)
+            for start in range(0, len(appended), chunk_rows):
+                chunk = appended.iloc[start:start + chunk_rows]
+                yield chunk if columns is None else project(chunk, columns)
+
+    def _stored_chunks(self, table, chunk_rows):
+        """The header and typed chunks of the workbook, opened before returning."""
+        path = self.path(table)
+        if self.snapshots:
+            snapshot = open_snapshot(self.snapshot_path(table), file_stamp(path))
+            if snapshot is not None:
+                self.snapshot_loads += 1
+                return snapshot.column_names, (
+                    snapshot.slice(start, chunk_rows).to_pandas()
+                    for start in range(0, snapshot.num_rows, chunk_rows))
+        rows = iter_workbook(path)
+        header = next(rows)
+
+        def chunks():
+            width = len(header)
+            batch = []
+            try:
+                for _, values in rows:
+                    batch.append(tuple(values[:width]) + (None,) * (width - len(values)))
+                    if len(batch) >= chunk_rows:
+                        yield apply_schema(pd.DataFrame(batch, columns=header), table)
+                        batch = []
+            finally:
+                rows.close()
+            if batch:
+                yield apply_schema(pd.DataFrame(batch, columns=header), table)
+
+        return header, chunks()
+
+    def _rows(self, table, frame, where):
+        """Rows of ``frame`` (the current frame of ``table``) matching ``where``."""
+        indexes = self._indexes.get(table)
+        if indexes is None:
+            indexes = self._indexes.setdefault(table, [
+                HashIndex(columns) for columns in self.index_columns.get(base_table(table), ())])
+        for index in indexes:
+            if index.covers(frame, where):
+                parent, records = None, ()
+                lineage = self._lineage.get(table)
+                if lineage is not None and lineage[0] is frame:
+                    _, parent, records = lineage
+                with self._index_lock:
+                    index.sync(frame, parent, records)
+                    return index.rows(frame, where)
+        return frame[match_mask(frame, where)]
+
+    def write(self, table, df):
+        df = apply_schema(df, table)
+        with self.locked(table):
+            if not self.journaled(table):
+                self._write_file(table, df)
+                return
+            journal = self.journal(table)
+            with journal.locked(exclusive=True):
+                self._write_file(table, df)
+                journal.truncate()
+
+    def append(self, table, row, unique=None):
+        return self._submit(table, ('append', coerce_row(table, row), unique))
+
+    def append_many(self, table, rows):
+        operations = [('append', coerce_row(table, row), None) for row in rows]
+        if not operations:
+            return 0
+        if self.journaled(table):
+            self._start_compactor()
+        # One batch: a single journal write or workbook rewrite.
+        for result in self._commit(table, operations):
+            if isinstance(result, BaseException):
+                raise result
+        return len(operations)
+
+    def find(self, table, where):
+        matches = self._rows(table, self._frame(table), where)
+        return None if matches.empty else matches.iloc[0].to_dict()
+
+    def find_all(self, table, where):
+        return self._rows(table, self._frame(table), where).copy()
+
+    def update(self, table, where, fields):
+        return self._submit(table, ('update', where, coerce_row(table, fields)))
+
+    def delete(self, table, where):
+        return self._submit(table, ('delete', where))
+
+    def drop(self, table):
+        with self.locked(table):
+            if self.journaled(table):
+                journal = self.journal(table)
+                with journal.locked(exclusive=True):
+                    journal.truncate()
+            if self.exists(table):
+                os.remove(self.path(table))
+            remove_snapshot(self.snapshot_path(table))
+            self.cache.invalidate(self.path(table))
+            self._views.pop(table, None)
+            self._indexes.pop(table, None)
+
+    # Group commit ----------------------------------------------------------
+
+    def writer(self, table):
+        with self._lock:
+            writer = self._writers.get(table)
+            if writer is None:
+                writer = GroupCommitWriter(
+                    table, lambda operations: self._commit(table, operations),
+                    window=self.commit_window)
+                self._writers[table] = writer
+            return writer
+
+    def _submit(self, table, operation):
+        if self.journaled(table):
+            self._start_compactor()
+        if self.locks.holds(table):
+            # The caller already holds the table lock, so the writer thread
+            # could never take it; commit in this thread instead.
+            result = self._commit(table, [operation])[0]
+            if isinstance(result, BaseException):
+                raise result
+            return result
+        return self.writer(table).submit(operation)
+
+    def _commit(self, table, operations):
+        """Apply a batch of mutations in order and persist them once."""
+        journaled = self.journaled(table)
+        with ExitStack() as stack:
+            stack.enter_context(self.locked(table))
+            if journaled:
+                stack.enter_context(self.journal(table).locked())
+            if not self.exists(table):
+                first = operations[0]
+                self.init_table(table, list(first[1]) if first[0] == 'append' else [])
+            current = frame = self._frame(table)
+            records, results, applied = [], [], 0
+            for operation in operations:
+                if operation[0] != 'append' or operation[2]:
+                    # Conditional operation: bring the frame up to date first.
+                    frame = apply_records(frame, records[applied:])
+                    applied = len(records)
+                # The indexes describe the stored frame, not the batch's
+                # intermediate ones.
+                rows = None
+                if frame is current:
+                    rows = lambda where: self._rows(table, current, where)
+                try:
+                    record, result = prepare_record(frame, operation, rows)
+                except Exception as e:
+                    record, result = None, e
+                if record is not None:
+                    records.append(record)
+                results.append(result)
+            if records:
+                if journaled:
+                    self.journal(table).append_many(records)
+                else:
+                    self._write_file(table, apply_records(frame, records[applied:]))
+        return results
+
+    # Compaction ------------------------------------------------------------
+
+    def compact(self, table):
+        """Fold the journal of ``table`` into its workbook."""
+        journal = self.journal(table)
+        with self.locked(table), journal.locked(exclusive=True):
+            if journal.size() == 0:
+                return False
+            frame = self._view(table)
+            self._write_file(table, frame)
+            journal.truncate()
+        self._last_compaction[table] = time.time()
+        self.compactions += 1
+        return True
+
+    def _due_for_compaction(self, table):
+        size = self.journal(table).size()
+        if size == 0:
+            return False
+        age = time.time() - self._last_compaction.setdefault(table, time.time())
+        return size >= self.compact_bytes or age >= self.compact_max_age
+
+    def _start_compactor(self):
+        if self._compactor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._compactor_pid == os.getpid():
+                return
+            self._compactor_pid = os.getpid()
+        threading.Thread(target=self._compact_loop, name='excel-compactor', daemon=True).start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            for table in self.journaled_on_disk():
+                try:
+                    if self._due_for_compaction(table):
+                        self.compact(table)
+                except Exception:
+                    # Leave the journal in place; the next pass retries.
+                    continue
+
+    def stats(self):
+        return {
+            'backend': 'excel',
+            'cache': self.cache.stats(),
+            'locks': self.locks.stats(),
+            'sequences': self.sequences.stats(),
+            'writers': {table: writer.stats() for table, writer in sorted(self._writers.items())},
+            'indexes': {f"{table}({', '.join(index.columns)})": index.stats()
+                        for table, indexes in sorted(self._indexes.items()) for index in indexes},
+            'compactions': self.compactions,
+            'snapshots': {'enabled': self.snapshots, 'loads': self.snapshot_loads,
+                          'writes': self.snapshot_writes},
+            'journals': {table: self.journal(table).stats() for table in self.journaled_on_disk()},
+        }
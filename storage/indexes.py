@@ -0,0 +1,101 @@
+import pandas as pd
+
+from storage.base import key_text, match_mask
+
+
+# Lookups the routes make on every request: a member by id, today's
+# attendance row for a member or staff member, a sale and its lines for a
+# receipt, an inventory item, a member's payment for a given date or by id, a
+# member's payment status, the members whose membership expires on a given
+# day, a day's sales totals and a request's idempotency key.
+INDEXES = {
+    'members': [('member_id',)],
+    'attendance': [('date', 'member_id')],
+    'trainer_attendance': [('date', 'trainer_id')],
+    'payments': [('member_id', 'date'), ('id',)],
+    'sales': [('id',)],
+    'sale_items': [('sale_id',)],
+    'sales_rollups': [('day',)],
+    'idempotency_keys': [('key',)],
+    'inventory': [('id',)],
+    'custom_products': [('product_id',)],
+    'member_status': [('member_id',)],
+    'renewals': [('expiry_date',)],
+}
+
+
+def lookup_key(frame, columns, where):
+    """Index key for the ``where`` values, normalised like :func:`match_mask`."""
+    key = []
+    for column in columns:
+        value = where[column]
+        if value is None:
+            return None
+        series = frame[column]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None
+        key.append(key_text(value))
+    return tuple(key)
+
+
+class HashIndex:
+    """Map of ``columns`` values -> row positions for one table frame.
+
+    The index remembers which frame it describes.  When the journal replays
+    appends (or updates that leave the indexed columns alone) on top of that
+    frame, :meth:`sync` only indexes the new rows; anything else rebuilds.
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.frame = None
+        self.positions = {}
+        self.builds = 0
+        self.extends = 0
+
+    def _add(self, frame, start):
+        if any(column not in frame.columns for column in self.columns):
+            return
+        keys = zip(*(frame[column].iloc[start:].map(key_text) for column in self.columns))
+        for position, key in enumerate(keys, start):
+            self.positions.setdefault(key, []).append(position)
+
+    def sync(self, frame, parent=None, records=()):
+        """Point the index at ``frame``, derived from ``parent`` by ``records``."""
+        if frame is self.frame:
+            return
+        if parent is not None and parent is self.frame and self._only_grows(records):
+            self._add(frame, len(parent))
+            self.extends += 1
+        else:
+            self.positions = {}
+            self._add(frame, 0)
+            self.builds += 1
+        self.frame = frame
+
+    def _only_grows(self, records):
+        for record in records:
+            if record.get('op') == 'append':
+                continue
+            if record.get('op') == 'update' and not set(record['fields']) & set(self.columns):
+                continue
+            return False
+        return True
+
+    def covers(self, frame, where):
+        return all(column in where for column in self.columns) and \
+            all(column in frame.columns for column in self.columns)
+
+    def rows(self, frame, where):
+        """Rows of ``frame`` matching ``where``, using the index for a shortlist."""
+        key = lookup_key(frame, self.columns, where)
+        if key is None:
+            return frame[match_mask(frame, where)]
+        candidates = frame.iloc[self.positions.get(key, [])]
+        return candidates[match_mask(candidates, where)]
+
+    def stats(self):
+        return {'keys': len(self.positions), 'builds': self.builds, 'extends': self.extends}
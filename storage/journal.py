@@ -0,0 +1,219 @@
+import fcntl
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+
+from storage.base import match_mask
+
+
+def jsonable(value):
+    """Convert a pandas/numpy cell into a JSON-serialisable value."""
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        try:
+            value = value.item()
+        except (ValueError, AttributeError):
+            pass
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        return None if math.isnan(value) else value
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    try:
+        if value != value:  # NaT and friends
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+
+class Journal:
+    """Append-only file of JSON-line records for one table.
+
+    Appends are a single ``O_APPEND`` write each.  ``fsync`` is batched: a
+    thread that finds its record already covered by another thread's fsync
+    returns straight away, so a burst of concurrent appends costs one disk
+    flush.  Readers and appenders take a shared ``flock``; compaction takes
+    it exclusively so nobody sees the snapshot and journal out of step.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._fd = None
+        self._pid = None
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self.records = 0
+        self.fsyncs = 0
+
+    def _file(self):
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._written = self._synced = 0
+        return self._fd
+
+    @contextmanager
+    def locked(self, exclusive=False):
+        """Hold the journal lock (re-entrant within a thread)."""
+        with self._lock:
+            fd = self._file()
+            if self._depth == 0:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def append(self, record, sync=True):
+        self.append_many([record], sync=sync)
+
+    def append_many(self, records, sync=True):
+        """Write ``records`` with a single ``write()`` and at most one fsync."""
+        data = b''.join(
+            (json.dumps(record, default=jsonable) + '\n').encode('utf-8') for record in records)
+        with self.locked():
+            os.write(self._file(), data)
+            self._written += 1
+            self.records += len(records)
+            sequence = self._written
+        if sync:
+            self.sync(sequence)
+
+    def sync(self, sequence=None):
+        """fsync until at least ``sequence`` appends are durable."""
+        with self._sync_lock:
+            with self._lock:
+                target = self._written
+                fd = self._file()
+            if sequence is not None and self._synced >= sequence:
+                return
+            os.fsync(fd)
+            self._synced = target
+            self.fsyncs += 1
+
+    def read_from(self, offset=0):
+        """Return ``(records, new_offset)`` for complete lines past ``offset``."""
+        try:
+            with open(self.path, 'rb') as handle:
+                handle.seek(offset)
+                data = handle.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b'\n') + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return records, offset + end
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self):
+        """Empty the journal; caller must hold the exclusive lock."""
+        fd = self._file()
+        os.ftruncate(fd, 0)
+        os.fsync(fd)
+
+    def stats(self):
+        return {'records': self.records, 'fsyncs': self.fsyncs, 'bytes': self.size()}
+
+
+def concat_rows(frame, rows):
+    """``pd.concat`` that keeps the frame's integer and categorical dtypes."""
+    frame = frame.copy(deep=False)
+    for column in frame.columns:
+        dtype = frame[column].dtype
+        if column not in rows:
+            rows[column] = None
+        if isinstance(dtype, pd.CategoricalDtype):
+            new = pd.Index(rows[column].dropna().unique()).difference(dtype.categories)
+            if len(new):
+                frame[column] = frame[column].cat.add_categories(new)
+            rows[column] = pd.Categorical(rows[column], categories=frame[column].cat.categories)
+        elif pd.api.types.is_integer_dtype(dtype):
+            try:
+                values = rows[column].astype('Int64')
+            except (TypeError, ValueError):
+                continue
+            if values.isna().any() and dtype == 'int64':
+                frame[column] = frame[column].astype('Int64')
+            rows[column] = values.astype(frame[column].dtype)
+        elif rows[column].isna().all():
+            # A column the rows leave blank takes the frame's type, as
+            # pandas is deprecating doing so itself in concat
+            rows[column] = rows[column].astype(dtype)
+    return pd.concat([frame, rows], ignore_index=True)
+
+
+def keeps_dtype(series, value):
+    """Whether ``value`` can be stored in ``series`` without going to object."""
+    if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+        return True
+    if isinstance(value, bool):
+        return pd.api.types.is_bool_dtype(series)
+    if pd.api.types.is_float_dtype(series):
+        return value is None or isinstance(value, (int, float))
+    if pd.api.types.is_integer_dtype(series):
+        return isinstance(value, int) or (value is None and series.dtype == 'Int64')
+    return False
+
+
+def apply_records(df, records):
+    """Replay journal ``records`` on top of ``df`` and return a new frame.
+
+    ``df`` itself is never modified, so it can be a shared cached frame.
+    """
+    if any(record.get('op') != 'append' for record in records):
+        df = df.copy()
+    pending = []
+
+    def flush(frame):
+        if not pending:
+            return frame
+        rows = pd.DataFrame(pending)
+        pending.clear()
+        if frame.empty:
+            columns = list(frame.columns) + [c for c in rows.columns if c not in frame.columns]
+            return rows.reindex(columns=columns)
+        return concat_rows(frame, rows)
+
+    for record in records:
+        op = record.get('op')
+        if op == 'append':
+            pending.append(record['row'])
+            continue
+        df = flush(df)
+        mask = match_mask(df, record['where'])
+        if op == 'update':
+            for column, value in record['fields'].items():
+                if column not in df.columns:
+                    df[column] = None
+                if mask.any():
+                    series = df[column]
+                    if not keeps_dtype(series, value):
+                        df[column] = series.astype(object)
+                    elif isinstance(series.dtype, pd.CategoricalDtype) and value is not None \
+                            and value not in series.cat.categories:
+                        df[column] = series.cat.add_categories([value])
+                    df.loc[mask, column] = value
+        elif op == 'delete':
+            df = df[~mask].reset_index(drop=True)
+    return flush(df)
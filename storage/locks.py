@@ -0,0 +1,124 @@
+import errno
+import fcntl
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a table lock cannot be taken within the timeout."""
+
+
+def retry(func, attempts=5, base_delay=0.05, max_delay=1.0, exceptions=(OSError,)):
+    """Call ``func`` until it succeeds, backing off exponentially with jitter."""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except exceptions as e:
+            if isinstance(e, FileNotFoundError) or attempt == attempts - 1:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+class TableLocks:
+    """Advisory per-table locks shared by every process using ``lock_dir``.
+
+    Each table has a ``<lock_dir>/<table>.lock`` file locked with
+    ``fcntl.flock``.  Locks are re-entrant within a thread, so a route can
+    hold a table lock around a read-check-write sequence while the storage
+    calls inside it take the same lock again.  Waiting uses non-blocking
+    attempts with exponential backoff and gives up with :class:`LockTimeout`.
+    """
+
+    def __init__(self, lock_dir, timeout=30.0, base_delay=0.005, max_delay=0.25):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._local = threading.local()
+        self._thread_locks = {}
+        self._fds = {}
+        self._pid = os.getpid()
+        self._guard = threading.Lock()
+        self.acquired = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+
+    def _thread_lock(self, table):
+        with self._guard:
+            if self._pid != os.getpid():
+                self._thread_locks, self._fds, self._pid = {}, {}, os.getpid()
+            lock = self._thread_locks.get(table)
+            if lock is None:
+                lock = self._thread_locks[table] = threading.Lock()
+                path = os.path.join(self.lock_dir, f'{table}.lock')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._fds[table] = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            return lock, self._fds[table]
+
+    def _held(self):
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    @contextmanager
+    def locked(self, table):
+        held = self._held()
+        if held.get(table):
+            held[table] += 1
+            try:
+                yield
+            finally:
+                held[table] -= 1
+            return
+
+        lock, fd = self._thread_lock(table)
+        started = time.monotonic()
+        deadline = started + self.timeout
+        if not lock.acquire(timeout=self.timeout):
+            raise LockTimeout(f"Timed out waiting for the {table} lock")
+        try:
+            delay = self.base_delay
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError as e:
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out waiting for the {table} lock")
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(self.max_delay, delay * 2)
+        except BaseException:
+            lock.release()
+            raise
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        if waited > self.base_delay:
+            self.contended += 1
+        self.wait_seconds += waited
+        held[table] = 1
+        try:
+            yield
+        finally:
+            held.pop(table, None)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            lock.release()
+
+    def holds(self, table):
+        """Whether the current thread holds the lock on ``table``."""
+        return bool(self._held().get(table))
+
+    def stats(self):
+        return {
+            'acquired': self.acquired,
+            'contended': self.contended,
+            'wait_seconds': round(self.wait_seconds, 4),
+        }
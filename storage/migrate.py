@@ -0,0 +1,208 @@
+"""Copy the workbooks in ``data/`` into another storage backend.
+
+    python -m storage.migrate [--replace] [--batch-rows N] [data_dir] [target_uri]
+
+Each workbook is streamed with openpyxl in read-only mode, a batch of rows
+at a time, so memory stays flat however big the file is.  Rows are typed
+with the schema registry, date columns are rewritten in the format the
+routes use (workbooks edited by hand mix ``dd-mm-YYYY`` with ISO dates and
+real Excel dates), and every batch goes to the target with a single
+``append_many``.  Attendance partitions and a not yet split attendance
+workbook are migrated together as one table.
+
+Afterwards the target is read back in chunks and a row count and an
+order-independent checksum are compared with the source; the command
+exits non-zero if any table differs or had rows that could not be typed.
+The target defaults to ``sqlite:///<data_dir>/gym.db``; tables that
+already hold rows there are skipped unless ``--replace`` is given.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime
+
+from storage import open_storage
+from storage.base import base_table, key_text
+from storage.excel import ExcelStorage, iter_workbook
+from storage.schema import SCHEMAS, SchemaError, coerce_row
+
+
+# Date columns -> the format the routes write them in
+DATE_FORMATS = {
+    'members': {'join_date': '%d-%m-%Y', 'expiry_date': '%d-%m-%Y'},
+    'payments': {'date': '%d-%m-%Y'},
+    'attendance': {'date': '%d-%m-%Y'},
+    'trainer_attendance': {'date': '%d-%m-%Y'},
+    'sales': {'date': '%d-%m-%Y %H:%M:%S'},
+    'sale_items': {'date': '%d-%m-%Y %H:%M:%S'},
+    'sales_rollups': {'day': '%d-%m-%Y'},
+    'inventory': {'date_added': '%d-%m-%Y'},
+    'custom_products': {'creation_date': '%d-%m-%Y %H:%M:%S'},
+}
+
+# Formats found in the workbooks, tried in order
+INPUT_DATE_FORMATS = (
+    '%d-%m-%Y %H:%M:%S', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y',
+)
+
+CHECKSUM_MODULUS = 2 ** 64
+
+
+def normalize_date(value, date_format):
+    """``value`` rewritten in ``date_format``, or None if it is not a date."""
+    if isinstance(value, datetime):
+        return value.strftime(date_format)
+    text = key_text(value).strip()
+    for input_format in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, input_format).strftime(date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def row_checksum(row, columns):
+    text = '\x1f'.join(key_text(row.get(column)) for column in columns)
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+
+
+def source_tables(data_dir):
+    """Table -> workbooks holding its rows, attendance partitions included."""
+    tables = {}
+    for name in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, name)
+        if name.endswith('.xlsx') and not name.startswith(('.', '~$')):
+            table = name[:-len('.xlsx')]
+            if table in SCHEMAS:
+                tables.setdefault(table, []).append(path)
+        elif os.path.isdir(path) and name in SCHEMAS:
+            # Month partitions: data/attendance/2026-10.xlsx
+            partitions = sorted(entry for entry in os.listdir(path) if entry.endswith('.xlsx'))
+            tables.setdefault(name, []).extend(os.path.join(path, entry) for entry in partitions)
+    return {table: paths for table, paths in tables.items() if paths}
+
+
+class TableReport:
+    def __init__(self, table):
+        self.table = table
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = []
+        self.dates_normalized = 0
+        self.dates_unparsed = 0
+        self.checksum = 0
+        self.target_rows = None
+        self.target_checksum = None
+        self.seconds = 0.0
+        self.skipped = None
+
+    @property
+    def ok(self):
+        return self.skipped is not None or (
+            not self.rejected and self.target_rows == self.inserted
+            and self.target_checksum == self.checksum)
+
+
+def migrate_table(table, paths, target, batch_rows=5000, replace=False):
+    """Stream ``paths`` into ``table`` of ``target`` and verify the copy."""
+    report = TableReport(table)
+    started = time.perf_counter()
+    if target.exists(table):
+        chunks = target.read_chunks(table, chunk_rows=1)
+        if not replace and next((chunk for chunk in chunks if len(chunk)), None) is not None:
+            report.skipped = 'target table is not empty (use --replace)'
+            return report
+        target.drop(table)
+    date_formats = DATE_FORMATS.get(base_table(table), {})
+    columns = []
+    for path in paths:
+        rows = iter_workbook(path)
+        header = next(rows)
+        for name in header:
+            if name is not None and name not in columns:
+                columns.append(name)
+        target.init_table(table, columns)
+        batch = []
+        for number, values in rows:
+            report.rows += 1
+            row = {name: value for name, value in zip(header, values) if name is not None}
+            for column, date_format in date_formats.items():
+                if row.get(column) in (None, ''):
+                    continue
+                normalized = normalize_date(row[column], date_format)
+                if normalized is None:
+                    report.dates_unparsed += 1
+                elif normalized != row[column]:
+                    row[column] = normalized
+                    report.dates_normalized += 1
+            try:
+                row = coerce_row(table, row)
+            except SchemaError as e:
+                report.rejected.append(f'{os.path.relpath(path)} row {number}: {e}')
+                continue
+            report.checksum = (report.checksum + row_checksum(row, columns)) % CHECKSUM_MODULUS
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                report.inserted += target.append_many(table, batch)
+                batch = []
+        if batch:
+            report.inserted += target.append_many(table, batch)
+    report.target_rows, report.target_checksum = 0, 0
+    for chunk in target.read_chunks(table, columns, chunk_rows=batch_rows):
+        for row in chunk.to_dict('records'):
+            report.target_rows += 1
+            report.target_checksum = (report.target_checksum + row_checksum(row, columns)) \
+                % CHECKSUM_MODULUS
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def compact_journals(data_dir):
+    """Fold pending journal records into the workbooks so they are migrated too."""
+    source = ExcelStorage(data_dir, snapshots=False)
+    for table in source.journaled_on_disk():
+        source.compact(table)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m storage.migrate',
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('target_uri', nargs='?')
+    parser.add_argument('--replace', action='store_true', help='overwrite tables that have rows')
+    parser.add_argument('--batch-rows', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    target_uri = args.target_uri or f"sqlite:///{os.path.join(args.data_dir, 'gym.db')}"
+    target = open_storage(target_uri, data_dir=args.data_dir, seed=False)
+    compact_journals(args.data_dir)
+
+    print(f"{'table':<20}{'rows':>10}{'inserted':>10}{'rejected':>10}{'dates':>8}"
+          f"{'bad dates':>10}{'checksum':>18}{'target':>18}{'s':>8}  status")
+    failed = False
+    for table, paths in source_tables(args.data_dir).items():
+        report = migrate_table(table, paths, target, args.batch_rows, args.replace)
+        if report.skipped:
+            print(f'{table:<20}skipped: {report.skipped}')
+            continue
+        if report.ok:
+            status = 'ok'
+        elif report.rejected:
+            status = 'rows rejected'
+        else:
+            status = 'MISMATCH'
+        print(f"{table:<20}{report.rows:>10}{report.inserted:>10}{len(report.rejected):>10}"
+              f"{report.dates_normalized:>8}{report.dates_unparsed:>10}"
+              f"{report.checksum:>18x}{report.target_checksum:>18x}"
+              f"{report.seconds:>8.1f}  {status}")
+        for problem in report.rejected[:10]:
+            print(f'    {problem}')
+        failed = failed or not report.ok
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
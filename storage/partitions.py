@@ -0,0 +1,352 @@
+"""Month partitions for the history tables.
+
+``attendance``, ``trainer_attendance``, ``sales``, ``sale_items`` and
+``payments`` only ever grow (``sales_rollups`` by a few rows a day), but
+the routes that use them want today's rows, one month's (the reports) or
+a single row.  They are stored as one table per month,
+``attendance/2026-10``, ``attendance/2026-11``, ... and the ``partitions``
+table is the manifest listing which months exist.  Lookups that include the
+date column touch a single partition; anything else scans all of them,
+oldest first (``find`` and ``tail`` go newest first, since a receipt being
+looked up is most likely recent).  Rows without a usable date are kept in
+an ``undated`` partition that counts as the oldest.
+
+A table written before partitioning existed keeps working: it is read as
+one more partition until ``python -m storage.partitions [uri]`` splits it
+into months and drops it.
+"""
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+from storage.base import Storage, key_text, project
+
+
+# Partitioned table -> (date column, format of the dates the routes write)
+PARTITIONED_TABLES = {
+    'attendance': ('date', '%d-%m-%Y'),
+    'trainer_attendance': ('date', '%d-%m-%Y'),
+    'sales': ('date', '%d-%m-%Y %H:%M:%S'),
+    'sale_items': ('date', '%d-%m-%Y %H:%M:%S'),
+    'sales_rollups': ('day', '%d-%m-%Y'),
+    'payments': ('date', '%d-%m-%Y'),
+}
+
+MANIFEST = 'partitions'
+MANIFEST_COLUMNS = ['table', 'partition']
+
+# Partition for rows whose date cannot be parsed
+UNDATED = 'undated'
+
+
+def partition_key(value, date_format):
+    """``'YYYY-MM'`` for a date cell, or None if it is not a date."""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m')
+    text = key_text(value)
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text, date_format).strftime('%Y-%m')
+    except ValueError:
+        parsed = pd.to_datetime(text, dayfirst=True, errors='coerce')
+        return None if pd.isna(parsed) else parsed.strftime('%Y-%m')
+
+
+class PartitionedStorage(Storage):
+    """Wraps a backend and spreads ``tables`` over one table per month.
+
+    Every other table, and everything else about the backend (locks, ID
+    sequences, stats), is passed straight through to ``store``.
+    """
+
+    def __init__(self, store, tables=PARTITIONED_TABLES):
+        self.store = store
+        self.tables = tables
+        self._columns = {}
+
+    def __getattr__(self, name):
+        if name == 'store':
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    # Partitions ------------------------------------------------------------
+
+    def partitions(self, table):
+        """Partition keys of ``table`` from the manifest, oldest first."""
+        if not self.store.exists(MANIFEST):
+            return []
+        rows = self.store.find_all(MANIFEST, {'table': table})
+        if 'partition' not in rows:
+            return []
+        # Undated rows come before every month, so newest-first walks end with them
+        return sorted(rows['partition'].map(key_text), key=lambda key: (key != UNDATED, key))
+
+    def partition_table(self, table, key):
+        return f'{table}/{key}'
+
+    def stored_tables(self, table):
+        if table not in self.tables:
+            return self.store.stored_tables(table)
+        return self._sources(table)
+
+    def _ensure_partition(self, table, key, columns):
+        name = self.partition_table(table, key)
+        if key in self.partitions(table):
+            return name
+        with self.store.locked(table):
+            if not self.store.exists(name):
+                self.store.init_table(name, self._columns.get(table) or columns)
+            self.store.init_table(MANIFEST, MANIFEST_COLUMNS)
+            self.store.append(MANIFEST, {'table': table, 'partition': key},
+                              unique=MANIFEST_COLUMNS)
+        return name
+
+    def _key(self, table, value):
+        column, date_format = self.tables[table]
+        return partition_key(value, date_format)
+
+    def _sources(self, table, where=None):
+        """Tables holding the rows of ``table`` that can match ``where``."""
+        sources = [table] if self.store.exists(table) else []
+        partitions = self.partitions(table)
+        column, _ = self.tables[table]
+        if where and column in where:
+            key = self._key(table, where[column])
+            if key is not None:
+                partitions = [key] if key in partitions else []
+        return sources + [self.partition_table(table, key) for key in partitions]
+
+    def _empty(self, table, columns=None):
+        empty = pd.DataFrame(columns=self._columns.get(table, []))
+        return empty if columns is None else project(empty, columns)
+
+    def _concat(self, table, frames, columns=None):
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return self._empty(table, columns)
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    def read_partition(self, table, key, columns=None):
+        """Rows of ``table`` for one month (``'YYYY-MM'``), not yet split rows included."""
+        if table not in self.tables:
+            raise ValueError(f"{table} is not partitioned")
+        frames = []
+        if self.store.exists(table):
+            column, _ = self.tables[table]
+            legacy = self.store.read(table)
+            if column in legacy.columns:
+                keys = legacy[column].map(lambda value: self._key(table, value) or UNDATED)
+                legacy = legacy[(keys == key).to_numpy()]
+                frames.append(legacy if columns is None else project(legacy, columns))
+        if key in self.partitions(table):
+            frames.append(self.store.read(self.partition_table(table, key), columns))
+        return self._concat(table, frames, columns)
+
+    def tail(self, table, rows, columns=None):
+        """The last ``rows`` rows of :meth:`read`, reading the newest partitions only."""
+        if table not in self.tables:
+            return self.store.read(table, columns).tail(rows)
+        frames, found = [], 0
+        for name in reversed(self._sources(table)):
+            if found >= rows:
+                break
+            frame = self.store.read(name, columns)
+            frames.insert(0, frame)
+            found += len(frame)
+        return self._concat(table, frames, columns).tail(rows).reset_index(drop=True)
+
+    def partition_chunks(self, table, key, columns=None, chunk_rows=10000):
+        """:meth:`read_partition` as DataFrames of up to ``chunk_rows`` rows.
+
+        Yields at least one (possibly empty) frame, so callers always get
+        the columns.
+        """
+        if table not in self.tables:
+            raise ValueError(f"{table} is not partitioned")
+        empty = True
+        if self.store.exists(table):
+            column, _ = self.tables[table]
+            for chunk in self.store.read_chunks(table, chunk_rows=chunk_rows):
+                if column not in chunk.columns:
+                    break
+                keys = chunk[column].map(lambda value: self._key(table, value) or UNDATED)
+                chunk = chunk[(keys == key).to_numpy()]
+                if len(chunk):
+                    empty = False
+                    yield chunk if columns is None else project(chunk, columns)
+        if key in self.partitions(table):
+            for chunk in self.store.read_chunks(self.partition_table(table, key), columns,
+                                                chunk_rows):
+                empty = False
+                yield chunk
+        if empty:
+            yield self._empty(table, columns)
+
+    # Storage API -----------------------------------------------------------
+
+    def init_table(self, table, columns):
+        if table not in self.tables:
+            return self.store.init_table(table, columns)
+        # Partitions are created by the first row written to each month.
+        self._columns[table] = list(columns)
+        if self.store.seed_file(table) and not self.store.exists(table) \
+                and not self.partitions(table):
+            # Seeded from an unsplit workbook: read as one more partition.
+            self.store.init_table(table, columns)
+
+    def exists(self, table):
+        if table not in self.tables:
+            return self.store.exists(table)
+        return table in self._columns or bool(self._sources(table))
+
+    def read(self, table, columns=None):
+        if table not in self.tables:
+            return self.store.read(table, columns)
+        return self._concat(table, [self.store.read(name, columns)
+                                    for name in self._sources(table)], columns)
+
+    def write(self, table, df):
+        if table not in self.tables:
+            return self.store.write(table, df)
+        column, _ = self.tables[table]
+        with self.store.locked(table):
+            keys = df[column].map(lambda value: self._key(table, value) or UNDATED)
+            for key in self.partitions(table):
+                if key not in set(keys):
+                    self.store.write(self.partition_table(table, key), df.iloc[0:0])
+            for key, rows in df.groupby(keys, sort=True):
+                name = self._ensure_partition(table, key, list(df.columns))
+                self.store.write(name, rows.reset_index(drop=True))
+            if self.store.exists(table):
+                self.store.drop(table)
+
+    def append(self, table, row, unique=None):
+        if table not in self.tables:
+            return self.store.append(table, row, unique)
+        column, _ = self.tables[table]
+        if unique and self.store.exists(table) and \
+                self.store.find(table, {c: row.get(c) for c in unique}) is not None:
+            # Already present in the unsplit table.
+            return False
+        key = self._key(table, row.get(column)) or UNDATED
+        return self.store.append(self._ensure_partition(table, key, list(row)), row, unique)
+
+    def append_many(self, table, rows):
+        if table not in self.tables:
+            return self.store.append_many(table, rows)
+        column, _ = self.tables[table]
+        months = {}
+        for row in rows:
+            months.setdefault(self._key(table, row.get(column)) or UNDATED, []).append(row)
+        return sum(self.store.append_many(self._ensure_partition(table, key, list(batch[0])), batch)
+                   for key, batch in months.items())
+
+    def read_chunks(self, table, columns=None, chunk_rows=10000):
+        if table not in self.tables:
+            yield from self.store.read_chunks(table, columns, chunk_rows)
+            return
+        for name in self._sources(table):
+            yield from self.store.read_chunks(name, columns, chunk_rows)
+
+    def find(self, table, where):
+        if table not in self.tables:
+            return self.store.find(table, where)
+        for name in reversed(self._sources(table, where)):
+            row = self.store.find(name, where)
+            if row is not None:
+                return row
+        return None
+
+    def find_all(self, table, where):
+        if table not in self.tables:
+            return self.store.find_all(table, where)
+        return self._concat(table, [self.store.find_all(name, where)
+                                    for name in self._sources(table, where)])
+
+    def update(self, table, where, fields):
+        if table not in self.tables:
+            return self.store.update(table, where, fields)
+        return sum(self.store.update(name, where, fields) for name in self._sources(table, where))
+
+    def delete(self, table, where):
+        if table not in self.tables:
+            return self.store.delete(table, where)
+        return sum(self.store.delete(name, where) for name in self._sources(table, where))
+
+    def drop(self, table):
+        if table not in self.tables:
+            return self.store.drop(table)
+        for name in self._sources(table):
+            self.store.drop(name)
+        if self.store.exists(MANIFEST):
+            self.store.delete(MANIFEST, {'table': table})
+
+    def next_id(self, table, column, start=1):
+        if table not in self.tables:
+            return self.store.next_id(table, column, start)
+        # Seed from the partitions too, not only the unsplit table.
+        return self.store.sequences.next(table, lambda: self.seed_id(table, column, start))
+
+    def locked(self, table):
+        return self.store.locked(table)
+
+    def version(self, table):
+        if table not in self.tables:
+            return self.store.version(table)
+        versions = {name: self.store.version(name) for name in self._sources(table)}
+        if None in versions.values():
+            return None
+        return ' '.join(f'{name}@{version}' for name, version in versions.items())
+
+    def partition_version(self, table, key):
+        """:meth:`version` of the rows :meth:`read_partition` returns for ``key``."""
+        if table not in self.tables:
+            raise ValueError(f"{table} is not partitioned")
+        sources = [table] if self.store.exists(table) else []
+        if key in self.partitions(table):
+            sources.append(self.partition_table(table, key))
+        versions = {name: self.store.version(name) for name in sources}
+        if None in versions.values():
+            return None
+        return ' '.join(f'{name}@{version}' for name, version in versions.items())
+
+    def stats(self):
+        stats = dict(self.store.stats())
+        stats['partitions'] = {table: self.partitions(table) for table in sorted(self.tables)}
+        return stats
+
+    # Migration -------------------------------------------------------------
+
+    def split(self, table):
+        """Move the rows of an unsplit ``table`` into month partitions."""
+        with self.store.locked(table):
+            if not self.store.exists(table):
+                return {}
+            legacy = self.store.read(table)
+            column, _ = self.tables[table]
+            counts = {}
+            if column in legacy.columns and len(legacy):
+                keys = legacy[column].map(lambda value: self._key(table, value) or UNDATED)
+                for key, rows in legacy.groupby(keys, sort=True):
+                    name = self._ensure_partition(table, key, list(legacy.columns))
+                    existing = self.store.read(name)
+                    self.store.write(name, self._concat(table, [rows, existing]))
+                    counts[key] = len(rows)
+            self.store.drop(table)
+        return counts
+
+
+if __name__ == '__main__':
+    from storage import open_storage
+
+    uri = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DATABASE_URL') or 'excel:///data'
+    store = open_storage(uri)
+    for table in store.tables:
+        counts = store.split(table)
+        moved = sum(counts.values())
+        print(f"{table}: moved {moved} rows into {len(counts)} partitions")
+        for key, count in counts.items():
+            print(f"  {table}/{key}: {count}")
@@ -0,0 +1,307 @@
+"""Declared column types for the gym's tables.
+
+Workbooks come back from ``pd.read_excel`` with whatever types openpyxl
+guessed: ids that are ints in one file and strings in the next, phone
+numbers as floats, package names as one Python string per row.  The
+registry below is applied once when a table is loaded (so the cached frame
+is already typed and compact) and again to every row written, so the
+journal and the SQLite tables only ever see values of the declared type.
+
+Run ``python -m storage.schema [data_dir]`` for a per-table memory report.
+"""
+import math
+import os
+import sys
+from collections import namedtuple
+
+import pandas as pd
+
+from storage.base import base_table, key_text
+
+
+Column = namedtuple('Column', 'name dtype nullable', defaults=(True,))
+Column.__doc__ = """A declared column: ``dtype`` is 'str', 'int', 'float' or 'category'."""
+
+
+class SchemaError(ValueError):
+    """Raised when a written value cannot be converted to its column type."""
+
+
+# Table -> (ID column, first ID) of the tables whose IDs come from
+# ``Storage.next_id``
+ID_COLUMNS = {
+    'members': ('member_id', 1001),
+    'custom_products': ('product_id', 1001),
+    'inventory': ('id', 1),
+    'payments': ('id', 1),
+    'sales': ('id', 1),
+}
+
+# Every column the routes write, including the ones added after the
+# original init_excel_files lists (sales.items_details, payments.*_discount).
+# History tables repeat the same day and name on many rows, so those are
+# categoricals as well.
+SCHEMAS = {
+    'admin': [
+        Column('username', 'str', False), Column('password', 'str'), Column('name', 'str'),
+    ],
+    'members': [
+        Column('member_id', 'int', False),
+        Column('name', 'str'),
+        Column('phone', 'str'),
+        Column('address', 'str'),
+        Column('dob', 'str'),
+        Column('gender', 'category'),
+        Column('next_of_kin_name', 'str'),
+        Column('next_of_kin_phone', 'str'),
+        Column('package', 'category'),
+        Column('join_date', 'str'),
+        Column('expiry_date', 'str'),
+        Column('status', 'category'),
+        Column('payment_status', 'category'),
+        Column('medical_conditions', 'str'),
+        # Free text on the form ("70 kg"), so not forced to a number.
+        Column('weight', 'str'),
+        Column('height', 'str'),
+    ],
+    'packages': [
+        Column('name', 'str', False),
+        Column('price', 'float'),
+        Column('duration', 'int'),
+        Column('trainers', 'str'),
+        Column('cardio_access', 'category'),
+        Column('sauna_access', 'category'),
+        Column('steam_room', 'category'),
+        Column('timings', 'str'),
+    ],
+    'trainers': [
+        Column('id', 'str'), Column('name', 'str'), Column('specialization', 'str'),
+        Column('schedule', 'str'),
+    ],
+    'trainer_attendance': [
+        Column('date', 'category', False),
+        Column('trainer_id', 'str', False),
+        Column('trainer_name', 'category'),
+        Column('check_in', 'str'),
+        Column('check_out', 'str'),
+        Column('staff_type', 'category'),
+    ],
+    'payments': [
+        Column('id', 'int'),
+        Column('date', 'category', False),
+        Column('member_id', 'int', False),
+        Column('member_name', 'category'),
+        Column('package', 'category'),
+        Column('amount', 'float'),
+        Column('additional_cost', 'float'),
+        Column('comments', 'str'),
+        Column('status', 'category'),
+        Column('package_discount', 'float'),
+        Column('additional_discount', 'float'),
+        Column('remaining_days', 'int'),
+    ],
+    'receptionists': [
+        Column('username', 'str', False),
+        Column('password', 'str'),
+        Column('name', 'str'),
+        Column('phone', 'str'),
+        Column('address', 'str'),
+        Column('dob', 'str'),
+        Column('age', 'int'),
+        Column('gender', 'category'),
+        Column('salary', 'float'),
+        Column('next_of_kin_name', 'str'),
+        Column('next_of_kin_phone', 'str'),
+        Column('privileges', 'str'),
+        Column('staff_type', 'category'),
+    ],
+    'attendance': [
+        Column('date', 'category', False),
+        Column('member_id', 'int', False),
+        Column('member_name', 'category'),
+        Column('check_in', 'str'),
+        Column('check_out', 'str'),
+    ],
+    'custom_products': [
+        Column('product_id', 'int', False),
+        Column('product_name', 'str'),
+        Column('ingredients', 'str'),
+        Column('price', 'float'),
+        Column('created_by', 'str'),
+        Column('creation_date', 'str'),
+        Column('can_be_sold', 'str'),
+        Column('final_price', 'float'),
+        Column('inventory_status', 'str'),
+        Column('total_cost', 'float'),
+        Column('profit', 'float'),
+    ],
+    'inventory': [
+        Column('id', 'int', False),
+        Column('stock_type', 'str'),
+        Column('servings', 'float'),
+        Column('cost_per_serving', 'float'),
+        Column('profit_per_serving', 'float'),
+        Column('other_charges', 'float'),
+        Column('date_added', 'str'),
+    ],
+    'member_status': [
+        Column('member_id', 'int', False),
+        Column('member_name', 'str'),
+        Column('package', 'category'),
+        Column('date', 'str'),
+        Column('amount', 'float'),
+        Column('additional_cost', 'float'),
+        Column('comments', 'str'),
+        Column('expiry_date', 'str'),
+        Column('remaining_days', 'int'),
+        Column('status', 'category'),
+        Column('as_of', 'str'),
+    ],
+    'renewals': [
+        Column('member_id', 'int', False),
+        Column('member_name', 'str'),
+        Column('package', 'category'),
+        Column('expiry_date', 'str'),
+        Column('as_of', 'str'),
+    ],
+    'renewals_as_of': [
+        Column('as_of', 'str'),
+    ],
+    'stock_ledger': [
+        Column('sale_id', 'int', False),
+        Column('created_at', 'str'),
+        Column('levels', 'str'),
+        Column('sale', 'str'),
+    ],
+    'sales': [
+        Column('id', 'int', False),
+        Column('date', 'str', False),
+        Column('member_id', 'int'),
+        Column('member_name', 'str'),
+        Column('inventory_id', 'int'),
+        Column('item_name', 'str'),
+        Column('quantity', 'float'),
+        Column('total_amount', 'float'),
+        Column('payment_method', 'category'),
+        Column('staff_name', 'str'),
+        Column('items_details', 'str'),
+    ],
+    'sale_items': [
+        Column('sale_id', 'int', False),
+        Column('date', 'str', False),
+        Column('item_kind', 'category'),
+        Column('item_id', 'int'),
+        Column('name', 'str'),
+        Column('quantity', 'float'),
+        Column('unit_price', 'float'),
+        Column('subtotal', 'float'),
+    ],
+    'sales_rollups': [
+        Column('day', 'str', False),
+        Column('dimension', 'category', False),
+        Column('key', 'str'),
+        Column('sales', 'int'),
+        Column('quantity', 'float'),
+        Column('revenue', 'float'),
+    ],
+    'idempotency_keys': [
+        Column('key', 'str', False),
+        Column('created_at', 'str'),
+        Column('status', 'int'),
+        Column('response', 'str'),
+    ],
+}
+
+
+def _is_blank(value):
+    if value is None or value is pd.NA or value is pd.NaT:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and not value.strip()
+
+
+def convert_value(column, value):
+    """Convert one written value to ``column``'s type or raise SchemaError."""
+    if _is_blank(value) and not (column.dtype == 'str' and isinstance(value, str)):
+        if not column.nullable:
+            raise SchemaError(f"{column.name} is required")
+        return None
+    try:
+        if column.dtype == 'int':
+            number = float(value)
+            if not number.is_integer():
+                raise ValueError(value)
+            return int(number)
+        if column.dtype == 'float':
+            return float(value)
+    except (TypeError, ValueError):
+        raise SchemaError(f"{column.name} must be a number, got {value!r}") from None
+    return key_text(value)
+
+
+def coerce_row(table, row):
+    """Return ``row`` with every declared column converted to its type."""
+    columns = {column.name: column for column in SCHEMAS.get(base_table(table), ())}
+    return {name: convert_value(columns[name], value) if name in columns else value
+            for name, value in row.items()}
+
+
+def convert_series(series, dtype):
+    """Convert a loaded column, or return None if that would lose values."""
+    blank = series.map(_is_blank)
+    if dtype in ('str', 'category'):
+        converted = series.map(key_text).astype(object).where(~blank, None)
+        return converted.astype('category') if dtype == 'category' else converted
+    numbers = pd.to_numeric(series.where(~blank), errors='coerce')
+    if (numbers.isna() & ~blank).any():
+        return None
+    if dtype == 'float':
+        return numbers.astype('float64')
+    if (numbers.dropna() % 1 != 0).any():
+        return None
+    return numbers.astype('Int64' if numbers.isna().any() else 'int64')
+
+
+def apply_schema(df, table):
+    """Return ``df`` with the declared types applied to the columns it has.
+
+    Columns whose stored values do not fit the declared type (a hand-edited
+    workbook, say) are left as they are rather than silently blanked.
+    """
+    columns = [column for column in SCHEMAS.get(base_table(table), ())
+               if column.name in df.columns]
+    if not columns:
+        return df
+    df = df.copy()
+    for column in columns:
+        if df[column.name].dtype == 'category' and column.dtype == 'category':
+            continue
+        converted = convert_series(df[column.name], column.dtype)
+        if converted is not None:
+            df[column.name] = converted
+    return df
+
+
+def memory_report(data_dir='data'):
+    """Bytes used by each table as loaded raw and with the schema applied."""
+    report = {}
+    for table in SCHEMAS:
+        path = os.path.join(data_dir, f'{table}.xlsx')
+        if not os.path.exists(path):
+            continue
+        raw = pd.read_excel(path)
+        typed = apply_schema(raw, table)
+        report[table] = {
+            'rows': len(raw),
+            'raw_bytes': int(raw.memory_usage(deep=True).sum()),
+            'typed_bytes': int(typed.memory_usage(deep=True).sum()),
+        }
+    return report
+
+
+if __name__ == '__main__':
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    print(f"{'table':<20}{'rows':>8}{'raw':>14}{'typed':>14}")
+    for table, usage in memory_report(data_dir).items():
+        print(f"{table:<20}{usage['rows']:>8}{usage['raw_bytes']:>14,}{usage['typed_bytes']:>14,}")
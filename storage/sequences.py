@@ -0,0 +1,83 @@
+import os
+import threading
+
+from storage.atomic import atomic_path
+
+
+class Sequences:
+    """Hands out IDs from ranges reserved through ``reserve``.
+
+    ``reserve(name, count, seed)`` must atomically claim ``count`` IDs of
+    sequence ``name`` for this process and return the first one; ``seed()``
+    gives the first ID of a sequence that has never been used.  With
+    ``block_size`` above 1 each worker claims a block at a time and serves
+    the rest from memory, so IDs stay unique across workers but are only
+    increasing within one worker (and a restart leaves a gap).
+    """
+
+    def __init__(self, reserve, block_size=1):
+        self.reserve = reserve
+        self.block_size = max(1, int(block_size))
+        self._blocks = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reservations = 0
+
+    def next(self, name, seed):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse its parent's block.
+                self._blocks, self._pid = {}, os.getpid()
+            next_id, end = self._blocks.get(name, (0, 0))
+            if next_id >= end:
+                next_id = self.reserve(name, self.block_size, seed)
+                end = next_id + self.block_size
+                self.reservations += 1
+            self._blocks[name] = (next_id + 1, end)
+            self.allocated += 1
+            return next_id
+
+    def advance(self, name, first, seed):
+        """Make sequence ``name`` hand out no ID below ``first`` from now on.
+
+        Only this process's block is dropped: with ``block_size`` above 1
+        other workers serve the rest of theirs first.
+        """
+        with self._lock:
+            self._blocks.pop(name, None)
+            current = self.reserve(name, 0, seed)
+            if current < first:
+                self.reserve(name, first - current, seed)
+                self.reservations += 1
+
+    def stats(self):
+        return {
+            'block_size': self.block_size,
+            'allocated': self.allocated,
+            'reservations': self.reservations,
+        }
+
+
+def reserve_file(directory, locks):
+    """``reserve`` for :class:`Sequences` backed by ``<directory>/<name>.seq``.
+
+    Each file holds the next unclaimed ID and is rewritten by rename under
+    the ``sequence-<name>`` lock from ``locks``.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def reserve(name, count, seed):
+        path = os.path.join(directory, f'{name}.seq')
+        with locks.locked(f'sequence-{name}'):
+            try:
+                with open(path) as handle:
+                    first = int(handle.read().strip())
+            except FileNotFoundError:
+                first = seed()
+            with atomic_path(path) as tmp_path:
+                with open(tmp_path, 'w') as handle:
+                    handle.write(f'{first + count}\n')
+            return first
+
+    return reserve
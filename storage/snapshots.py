@@ -0,0 +1,130 @@
+"""Columnar snapshots of the workbooks in ``data/``.
+
+Parsing a workbook with openpyxl reads every cell through the XML, which
+takes seconds for a history table of a few hundred thousand rows.  Each
+time the Excel backend parses or writes a workbook it also saves the typed
+frame as an uncompressed Arrow IPC file, ``data/.snapshots/<table>.arrow``,
+tagged with the :func:`~storage.cache.file_stamp` of the workbook it came
+from.  The next cold load (a new worker, or after another worker rewrote
+the table) memory-maps that file instead of parsing the workbook, and the
+page cache holding it is shared by every worker.
+
+The workbooks stay the system of record: a snapshot whose tag does not
+match the workbook on disk (someone saved it from Excel) is ignored and
+rebuilt.  Snapshots need ``pyarrow``; without it the backend parses the
+workbooks as before.
+
+Run ``python -m storage.snapshots [data_dir]`` to build them all up front.
+"""
+import json
+import os
+import sys
+import time
+
+from storage.atomic import atomic_path
+from storage.cache import file_stamp
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+
+STAMP_KEY = b'gym.source_stamp'
+
+
+def available():
+    return pa is not None
+
+
+def snapshot_path(data_dir, table):
+    return os.path.join(data_dir, '.snapshots', f'{table}.arrow')
+
+
+def read_snapshot(path, stamp):
+    """The frame saved at ``path`` if it was taken from a workbook at ``stamp``."""
+    if pa is None or stamp is None:
+        return None
+    try:
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            metadata = reader.schema.metadata or {}
+            if json.loads(metadata.get(STAMP_KEY, b'null')) != list(stamp):
+                return None
+            return reader.read_all().to_pandas()
+    except (OSError, ValueError, pa.ArrowException):
+        # Missing, half-copied or from an incompatible pyarrow: rebuild it.
+        return None
+
+
+def open_snapshot(path, stamp):
+    """The snapshot at ``path`` as a memory-mapped Arrow table, if taken at ``stamp``.
+
+    Nothing is copied out of the file until a slice of the table is
+    converted, so it can be read a chunk at a time.
+    """
+    if pa is None or stamp is None:
+        return None
+    try:
+        reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+        metadata = reader.schema.metadata or {}
+        if json.loads(metadata.get(STAMP_KEY, b'null')) != list(stamp):
+            return None
+        return reader.read_all()
+    except (OSError, ValueError, pa.ArrowException):
+        return None
+
+
+def write_snapshot(df, path, stamp):
+    """Save ``df`` as the snapshot of the workbook at ``stamp``; False if it can't be."""
+    if pa is None or stamp is None:
+        return False
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (TypeError, ValueError, pa.ArrowException):
+        # A column mixing numbers and text (a hand-edited workbook that the
+        # schema left as is) has no Arrow type; keep parsing that workbook.
+        return False
+    metadata = dict(table.schema.metadata or {})
+    metadata[STAMP_KEY] = json.dumps(list(stamp)).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    with atomic_path(path) as tmp_path:
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    return True
+
+
+def remove_snapshot(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == '__main__':
+    from storage.excel import read_workbook
+    from storage.schema import apply_schema
+
+    if not available():
+        sys.exit('pyarrow is not installed')
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    print(f"{'table':<32}{'rows':>8}{'xlsx s':>10}{'arrow s':>10}")
+    for directory, directories, files in os.walk(data_dir):
+        # Partitions live in sub-directories; skip .snapshots, .locks and backups.
+        directories[:] = sorted(d for d in directories if not d.startswith('.') and d != 'backups')
+        for name in sorted(files):
+            if not name.endswith('.xlsx') or name.startswith(('.', '~$')):
+                continue
+            path = os.path.join(directory, name)
+            table = os.path.relpath(path, data_dir)[:-len('.xlsx')].replace(os.sep, '/')
+            stamp = file_stamp(path)
+            started = time.perf_counter()
+            df = apply_schema(read_workbook(path), table)
+            parsed = time.perf_counter() - started
+            if not write_snapshot(df, snapshot_path(data_dir, table), stamp):
+                print(f"{table:<32}{len(df):>8}{parsed:>10.2f}{'-':>10}")
+                continue
+            started = time.perf_counter()
+            read_snapshot(snapshot_path(data_dir, table), stamp)
+            print(f"{table:<32}{len(df):>8}{parsed:>10.2f}{time.perf_counter() - started:>10.3f}")
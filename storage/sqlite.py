@@ -0,0 +1,335 @@
+import math
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pandas as pd
+
+from storage.base import Storage
+from storage.locks import TableLocks
+from storage.schema import apply_schema, coerce_row
+from storage.sequences import Sequences
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_value(value):
+    """Convert a pandas/numpy cell into something sqlite3 can bind."""
+    if value is None or value is pd.NA:
+        return None
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        try:
+            value = value.item()
+        except (ValueError, AttributeError):
+            pass
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (str, int, float, bytes)):
+        return value
+    return str(value)
+
+
+def key_candidates(value):
+    """Bind values that match a key stored either as text or as a number."""
+    value = sql_value(value)
+    if value is None:
+        return [None]
+    text = str(value)
+    candidates = [text]
+    try:
+        number = float(text)
+    except ValueError:
+        return candidates
+    if math.isfinite(number):
+        candidates.append(int(number) if number.is_integer() else number)
+    return candidates
+
+
+class SQLiteStorage(Storage):
+    """Tables stored in a single SQLite database running in WAL mode.
+
+    Columns are declared without a type so rows keep whatever the routes put
+    in them, and an index is created on first use for every ``where`` column
+    combination, so point reads and single-row writes are B-tree lookups
+    instead of whole-file round trips.  Each write is its own transaction;
+    :meth:`locked` is only needed around read-check-write sequences.  Tables
+    that do not exist yet are seeded from ``<seed_dir>/<table>.xlsx`` when it
+    is present.  ID sequences live in the ``_sequences`` table, and a
+    counter per table bumped by every write in ``_versions``.
+    """
+
+    def __init__(self, path, seed_dir='data', id_block_size=1):
+        self.path = path
+        self.seed_dir = seed_dir
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.locks = TableLocks(f'{path}.locks')
+        self.sequences = Sequences(self._reserve_ids, id_block_size)
+        self._local = threading.local()
+        self._indexes = set()
+        self._schema_version = None
+        self._indexes_lock = threading.Lock()
+
+    # Connections -----------------------------------------------------------
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # Schema helpers --------------------------------------------------------
+
+    def columns(self, table, conn=None):
+        conn = conn or self.connection()
+        rows = conn.execute(f'PRAGMA table_info({quote(table)})').fetchall()
+        return [row[1] for row in rows]
+
+    def _create(self, conn, table, columns):
+        column_sql = ', '.join(quote(column) for column in columns) or '"_empty"'
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {quote(table)} ({column_sql})')
+
+    def _add_columns(self, conn, table, columns):
+        existing = self.columns(table, conn)
+        for column in columns:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)}')
+                existing.append(column)
+        return existing
+
+    def _ensure_index(self, table, columns):
+        name = f'ix_{table}__' + '__'.join(columns)
+        conn = self.connection()
+        # Any DROP or CREATE, by any worker, changes the schema version: a
+        # write() elsewhere drops the table's indexes with it.
+        schema = conn.execute('PRAGMA schema_version').fetchone()[0]
+        with self._indexes_lock:
+            if schema != self._schema_version:
+                self._indexes = set()
+                self._schema_version = schema
+            if name in self._indexes:
+                return
+        column_sql = ', '.join(quote(column) for column in columns)
+        try:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(table)} ({column_sql})')
+        except sqlite3.OperationalError:
+            # Unknown column: the lookup will simply match nothing.
+            return
+        with self._indexes_lock:
+            self._indexes.add(name)
+
+    def _where_sql(self, table, where, conn):
+        existing = set(self.columns(table, conn))
+        clauses, params = [], []
+        for column, value in where.items():
+            if column not in existing:
+                return None, None
+            candidates = key_candidates(value)
+            if candidates == [None]:
+                clauses.append(f'{quote(column)} IS NULL')
+                continue
+            clauses.append(f'{quote(column)} IN ({", ".join("?" for _ in candidates)})')
+            params.extend(candidates)
+        self._ensure_index(table, list(where))
+        return ' AND '.join(clauses) or '1', params
+
+    def _insert(self, conn, table, columns, rows):
+        column_sql = ', '.join(quote(column) for column in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        conn.executemany(
+            f'INSERT INTO {quote(table)} ({column_sql}) VALUES ({placeholders})',
+            ([sql_value(value) for value in row] for row in rows))
+
+    def _reserve_ids(self, name, count, seed):
+        with self.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS _sequences '
+                         '(name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)')
+            row = conn.execute('SELECT next_id FROM _sequences WHERE name = ?', (name,)).fetchone()
+            first = row[0] if row else seed()
+            conn.execute('INSERT OR REPLACE INTO _sequences (name, next_id) VALUES (?, ?)',
+                         (name, first + count))
+            return first
+
+    def _bump(self, conn, table):
+        conn.execute('CREATE TABLE IF NOT EXISTS _versions '
+                     '(name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        conn.execute('INSERT INTO _versions (name, version) VALUES (?, 1) '
+                     'ON CONFLICT (name) DO UPDATE SET version = version + 1', (table,))
+
+    # Storage API -----------------------------------------------------------
+
+    def seed_file(self, table):
+        seed_file = os.path.join(self.seed_dir, f'{table}.xlsx') if self.seed_dir else None
+        return seed_file if seed_file and os.path.exists(seed_file) else None
+
+    def init_table(self, table, columns):
+        if self.exists(table):
+            return
+        seed_file = self.seed_file(table)
+        if seed_file:
+            self.write(table, apply_schema(pd.read_excel(seed_file), table))
+        else:
+            with self.transaction() as conn:
+                self._create(conn, table, columns)
+
+    def exists(self, table):
+        row = self.connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        return row is not None
+
+    def read(self, table, columns=None):
+        conn = self.connection()
+        if columns is None:
+            column_sql = '*'
+        else:
+            existing = set(self.columns(table, conn))
+            columns = [column for column in columns if column in existing]
+            column_sql = ', '.join(quote(column) for column in columns) or 'rowid'
+        df = pd.read_sql_query(f'SELECT {column_sql} FROM {quote(table)} ORDER BY rowid', conn)
+        if columns is not None:
+            df = df[columns]
+        return apply_schema(df, table)
+
+    def write(self, table, df):
+        df = apply_schema(df, table)
+        columns = [str(column) for column in df.columns]
+        with self.transaction() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS {quote(table)}')
+            self._create(conn, table, columns)
+            if columns and len(df):
+                self._insert(conn, table, columns, df.itertuples(index=False, name=None))
+            self._bump(conn, table)
+
+    def append(self, table, row, unique=None):
+        row = coerce_row(table, row)
+        columns = [str(column) for column in row]
+        with self.transaction() as conn:
+            self._create(conn, table, columns)
+            self._add_columns(conn, table, columns)
+            if unique:
+                clause, params = self._where_sql(
+                    table, {column: row.get(column) for column in unique}, conn)
+                exists = conn.execute(
+                    f'SELECT 1 FROM {quote(table)} WHERE {clause} LIMIT 1', params).fetchone()
+                if exists:
+                    return False
+            self._insert(conn, table, columns, [list(row.values())])
+            self._bump(conn, table)
+        return True
+
+    def append_many(self, table, rows):
+        rows = [coerce_row(table, row) for row in rows]
+        if not rows:
+            return 0
+        columns = [str(column) for column in dict.fromkeys(c for row in rows for c in row)]
+        with self.transaction() as conn:
+            self._create(conn, table, columns)
+            self._add_columns(conn, table, columns)
+            self._insert(conn, table, columns, ([row.get(c) for c in columns] for row in rows))
+            self._bump(conn, table)
+        return len(rows)
+
+    def read_chunks(self, table, columns=None, chunk_rows=10000):
+        conn = self.connection()
+        existing = self.columns(table, conn)
+        if columns is not None:
+            existing = [column for column in columns if column in existing]
+        if not existing:
+            return
+        column_sql = ', '.join(quote(column) for column in existing)
+        for chunk in pd.read_sql_query(f'SELECT {column_sql} FROM {quote(table)} ORDER BY rowid',
+                                       conn, chunksize=chunk_rows):
+            yield apply_schema(chunk, table)
+
+    def find(self, table, where):
+        conn = self.connection()
+        if not self.exists(table):
+            return None
+        clause, params = self._where_sql(table, where, conn)
+        if clause is None:
+            return None
+        cursor = conn.execute(
+            f'SELECT * FROM {quote(table)} WHERE {clause} ORDER BY rowid LIMIT 1', params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([d[0] for d in cursor.description], row))
+
+    def find_all(self, table, where):
+        conn = self.connection()
+        clause, params = self._where_sql(table, where, conn)
+        if clause is None:
+            return pd.DataFrame(columns=self.columns(table, conn))
+        df = pd.read_sql_query(
+            f'SELECT * FROM {quote(table)} WHERE {clause} ORDER BY rowid', conn, params=params)
+        return apply_schema(df, table)
+
+    def update(self, table, where, fields):
+        fields = coerce_row(table, fields)
+        with self.transaction() as conn:
+            clause, params = self._where_sql(table, where, conn)
+            if clause is None:
+                return 0
+            self._add_columns(conn, table, list(fields))
+            set_sql = ', '.join(f'{quote(column)} = ?' for column in fields)
+            values = [sql_value(value) for value in fields.values()]
+            cursor = conn.execute(
+                f'UPDATE {quote(table)} SET {set_sql} WHERE {clause}', values + params)
+            if cursor.rowcount:
+                self._bump(conn, table)
+            return cursor.rowcount
+
+    def delete(self, table, where):
+        with self.transaction() as conn:
+            clause, params = self._where_sql(table, where, conn)
+            if clause is None:
+                return 0
+            cursor = conn.execute(f'DELETE FROM {quote(table)} WHERE {clause}', params)
+            if cursor.rowcount:
+                self._bump(conn, table)
+            return cursor.rowcount
+
+    def drop(self, table):
+        with self.transaction() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS {quote(table)}')
+            self._bump(conn, table)
+
+    def version(self, table):
+        try:
+            row = self.connection().execute(
+                'SELECT version FROM _versions WHERE name = ?', (table,)).fetchone()
+        except sqlite3.OperationalError:
+            # No table has been written yet.
+            row = None
+        return str(row[0]) if row else '0'
+
+    def stats(self):
+        return {'backend': 'sqlite', 'path': self.path, 'locks': self.locks.stats(),
+                'sequences': self.sequences.stats()}
@@ -0,0 +1,97 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitWriter:
+    """Single writer thread that coalesces mutations of one table.
+
+    :meth:`submit` queues an operation and blocks until the batch containing
+    it has been persisted.  The writer thread takes the first queued
+    operation, keeps collecting for ``window`` seconds (or ``max_batch``
+    operations) and hands the whole batch to ``commit``, which applies them
+    in order and persists once.  ``commit`` returns one result per operation;
+    an exception instance in that list is raised to that caller only.
+    """
+
+    def __init__(self, name, commit, window=0.005, max_batch=500):
+        self.name = name
+        self.commit = commit
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker inherits the queue but not the thread.
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, name=f'writer-{self.name}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, operation):
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((operation, future, time.monotonic()))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            try:
+                results = self.commit([operation for operation, _, _ in batch])
+            except BaseException as e:
+                results = [e] * len(batch)
+            finished = time.monotonic()
+            for (_, future, queued), result in zip(batch, results):
+                self.wait_seconds += started - queued
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            elapsed = finished - started
+            self.batches += 1
+            self.operations += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.commit_seconds += elapsed
+            self.max_commit_seconds = max(self.max_commit_seconds, elapsed)
+
+    def stats(self):
+        batches = self.batches or 1
+        operations = self.operations or 1
+        return {
+            'batches': self.batches,
+            'operations': self.operations,
+            'avg_batch_size': round(self.operations / batches, 2),
+            'largest_batch': self.largest_batch,
+            'avg_commit_ms': round(1000 * self.commit_seconds / batches, 3),
+            'max_commit_ms': round(1000 * self.max_commit_seconds, 3),
+            'avg_queue_wait_ms': round(1000 * self.wait_seconds / operations, 3),
+        }
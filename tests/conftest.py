@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ['excel:///data', 'sqlite:///data/gym.db']
+
+
+@pytest.fixture(params=BACKENDS, ids=['excel', 'sqlite'])
+def uri(request, tmp_path, monkeypatch):
+    """Each backend's URI, with a fresh working directory for its ``data/``."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_URL', request.param)
+    return request.param
@@ -0,0 +1,71 @@
+"""Run the app in worker processes, the way gunicorn does.
+
+The app opens its store under ``data/`` in the working directory when it is
+imported, so each worker is a fresh (spawned) process that changes to the
+test's directory, imports the app there and calls the test's function with
+a logged-in test client.
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import traceback
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(workdir, uri):
+    """Import the app with its data in ``workdir``, stored at ``uri``."""
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = uri
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)
+    import app
+    return app
+
+
+def client(app):
+    """A test client with an admin session."""
+    test_client = app.app.test_client()
+    with test_client.session_transaction() as session:
+        session['user_type'] = 'admin'
+        session['username'] = 'admin'
+    return test_client
+
+
+def _worker(workdir, uri, target, args, barrier, results, number):
+    try:
+        app = load_app(workdir, uri)
+        barrier.wait()
+        results.put((number, True, target(app, *args)))
+    except BaseException:
+        barrier.abort()
+        results.put((number, False, traceback.format_exc()))
+
+
+def run_workers(workdir, uri, target, args_list, timeout=600):
+    """``target(app, *args)`` for each ``args`` in ``args_list``, each in its
+    own worker process, started together once every worker has imported the
+    app; returns their results in order."""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(args_list))
+    results = context.Queue()
+    processes = [context.Process(target=_worker,
+                                 args=(workdir, uri, target, args, barrier, results, number))
+                 for number, args in enumerate(args_list)]
+    for process in processes:
+        process.start()
+    try:
+        outcomes = dict((number, (ok, value)) for number, ok, value in
+                        (results.get(timeout=timeout) for _ in processes))
+    finally:
+        for process in processes:
+            process.join(timeout=60)
+            if process.is_alive():
+                process.kill()
+    failures = [value for ok, value in outcomes.values() if not ok]
+    if failures:
+        raise AssertionError('worker failed:\n' + '\n'.join(failures))
+    return [outcomes[number][1] for number in range(len(processes))]
@@ -0,0 +1,93 @@
+"""Backups save what changed and restore a consistent store."""
+from datetime import datetime
+
+import pandas as pd
+
+from services import member_status
+from services.backups import BackupEngine
+from storage import open_storage
+from storage.schema import ID_COLUMNS
+
+
+TABLES = ['members', 'packages', 'payments', 'sales', 'stock_ledger', 'idempotency_keys']
+
+
+def _store(uri):
+    store = open_storage(uri)
+    store.write('packages', pd.DataFrame({'name': ['Gold'], 'price': [3000.0], 'duration': [1]}))
+    store.init_table('members', ['member_id', 'name', 'package', 'expiry_date',
+                                 'payment_status'])
+    store.init_table('payments', ['id', 'member_id', 'member_name', 'package', 'date', 'amount'])
+    store.init_table('sales', ['id', 'date', 'total_amount'])
+    store.init_table('stock_ledger', ['sale_id', 'created_at', 'levels', 'sale'])
+    store.init_table('idempotency_keys', ['key', 'created_at', 'status', 'response'])
+    return store
+
+
+def _member(store, name):
+    member_id = store.next_id('members', 'member_id', start=1001)
+    store.append('members', {'member_id': member_id, 'name': name, 'package': 'Gold'})
+    return member_id
+
+
+def _pay(store, member_id, date):
+    payment = {'id': store.next_id('payments', 'id'), 'member_id': member_id,
+               'member_name': 'x', 'package': 'Gold', 'date': date, 'amount': 3000.0}
+    store.append('payments', payment)
+    member_status.record_payment(store, payment)
+    return payment
+
+
+def _engine(store, path):
+    return BackupEngine(store, path, TABLES, id_columns=ID_COLUMNS,
+                        on_restore=member_status.rebuild)
+
+
+def test_delta_saves_changed_tables_and_restores(uri, tmp_path):
+    store = _store(uri)
+    first = _member(store, 'A')
+    member_status.rebuild(store)
+    _pay(store, first, datetime.now().strftime('%d-%m-%Y'))
+    store.append('idempotency_keys', {'key': 'k', 'status': 200, 'response': '{}'})
+    engine = _engine(store, str(tmp_path / 'backups'))
+    full = engine.backup(full=True, now=datetime(2026, 10, 18, 10))
+    assert 'idempotency_keys' in full['tables'] and 'stock_ledger' in full['tables']
+
+    second = _member(store, 'B')
+    delta = engine.backup(now=datetime(2026, 10, 18, 11))
+    assert delta['kind'] == 'delta' and delta['saved'] == 1
+    assert delta['tables']['members']['backup'] == delta['name']
+    assert delta['tables']['packages']['backup'] == full['name']
+    assert engine.backup(now=datetime(2026, 10, 18, 12)) is None
+
+    # Lose everything after the full backup, then go back to the delta
+    _member(store, 'C')
+    store.delete('idempotency_keys', {'key': 'k'})
+    engine.restore(full['name'])
+    assert list(store.read('members')['member_id']) == [first]
+    engine.restore(delta['name'])
+    assert list(store.read('members')['member_id']) == [first, second]
+    assert store.find('idempotency_keys', {'key': 'k'}) is not None
+
+    # member_status and renewals are rebuilt from the restored tables
+    status = store.read(member_status.TABLE).set_index('member_id')['status']
+    assert status.to_dict() == {first: 'Paid', second: 'Pending'}
+    assert list(store.read(member_status.RENEWALS)['member_id']) == [first]
+
+
+def test_restore_moves_sequences_past_restored_ids(uri, tmp_path):
+    source = _store(uri)
+    for name in 'ABC':
+        _member(source, name)
+    source_engine = _engine(source, str(tmp_path / 'backups'))
+    name = source_engine.backup(full=True)['name']
+
+    # A fresh store that already handed out IDs of its own
+    target_dir = tmp_path / 'other'
+    target_dir.mkdir()
+    target = _store(uri.replace('data', str(target_dir / 'data')))
+    assert _member(target, 'Z') == 1001
+    _engine(target, source_engine.backup_dir).restore(name)
+
+    assert list(target.read('members')['member_id']) == [1001, 1002, 1003]
+    assert _member(target, 'D') == 1004
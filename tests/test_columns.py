@@ -0,0 +1,48 @@
+"""Reads of a few columns return, and keep, only those columns."""
+import pandas as pd
+
+from storage import open_storage
+from storage.excel import ExcelStorage
+
+
+PACKAGES = pd.DataFrame({
+    'name': [f'P{number}' for number in range(2000)],
+    'price': [3000.0] * 2000,
+    'duration': [1] * 2000,
+    'timings': ['06:00 - 23:00, every day of the week but public holidays ' * 4] * 2000,
+})
+
+
+def test_read_returns_only_the_columns_asked_for(uri):
+    store = open_storage(uri)
+    store.write('packages', PACKAGES.head(3))
+
+    packages = store.read('packages', ['duration', 'name', 'missing'])
+    assert list(packages.columns) == ['duration', 'name']
+    assert list(packages['name']) == ['P0', 'P1', 'P2']
+
+    packages['name'] = 'changed'
+    assert list(store.read('packages', ['name'])['name']) == ['P0', 'P1', 'P2']
+
+
+def test_projection_is_cached_when_the_table_is_not(tmp_path, monkeypatch):
+    ExcelStorage(str(tmp_path)).write('packages', PACKAGES)
+    full = int(PACKAGES.memory_usage(deep=True).sum())
+    narrow = int(PACKAGES[['name']].memory_usage(deep=True).sum())
+    assert narrow * 2 < full
+    store = ExcelStorage(str(tmp_path), cache_max_bytes=(narrow + full) // 2, snapshots=False)
+    parsed = []
+    parse = store._parse
+
+    def logged_parse(table, path):
+        parsed.append(table)
+        return parse(table, path)
+
+    monkeypatch.setattr(store, '_parse', logged_parse)
+    for _ in range(3):
+        assert len(store.read('packages', ['name'])) == 2000
+
+    # The full frame was parsed once and did not fit; the projection did
+    assert parsed == ['packages']
+    cache = store.stats()['cache']
+    assert cache['entries'] == 1 and cache['bytes'] < full
@@ -0,0 +1,89 @@
+"""Attendance and sales written by several workers at once lose and
+duplicate nothing."""
+import json
+import threading
+
+from helpers import client, run_workers
+from services import sales_rollups
+from storage import open_storage
+
+
+WORKERS = 4
+THREADS = 2
+MEMBERS = 12
+SALES = 10
+CART = json.dumps([['R_1', {'name': 'Whey', 'quantity': 2, 'price': 15, 'subtotal': 30}]])
+
+
+def _setup(app):
+    c = client(app)
+    c.post('/inventory/add', data={'stock_type': 'Whey', 'servings': '1000',
+                                   'cost_per_serving': '10', 'profit_per_serving': '5',
+                                   'other_charges': '0'})
+    c.post('/packages/add', data={'name': 'Gold', 'price': '3000', 'duration': '1', 'trainers': 'y',
+                                  'cardio_access': 'y', 'sauna_access': 'n', 'steam_room': 'n',
+                                  'timings': 'all'})
+    for number in range(MEMBERS):
+        c.post('/members/add', data={'name': f'M{number}', 'phone': '1', 'address': 'a',
+                                     'dob': '2000-01-01', 'join_date': '2025-01-01',
+                                     'package': 'Gold'})
+
+
+def _mark(c, member_id, action):
+    c.post('/attendance/mark', data={'member_id': str(member_id), 'action': action})
+    with c.session_transaction() as session:
+        return [message for _, message in session.pop('_flashes', [])]
+
+
+def _hammer(app):
+    """Every member checked in and out, and SALES sales, from each thread."""
+    messages = []
+    statuses = []
+    start = threading.Barrier(THREADS)
+
+    def work():
+        c = client(app)
+        start.wait()
+        for number in range(MEMBERS):
+            messages.extend(_mark(c, 1001 + number, 'check_in'))
+            if number < SALES:
+                statuses.append(c.post('/sales/add', data={'payment_method': 'Cash',
+                                                           'total_amount': 'Rs. 30',
+                                                           'items': CART}).status_code)
+        for member_id in range(1001, 1001 + MEMBERS):
+            messages.extend(_mark(c, member_id, 'check_out'))
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return messages, statuses
+
+
+def test_no_lost_or_duplicated_rows(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    results = run_workers(str(tmp_path), uri, _hammer, [()] * WORKERS)
+    messages = [message for result in results for message in result[0]]
+    statuses = [status for result in results for status in result[1]]
+
+    # Each member checked in and out exactly once, however many tried
+    assert sum(message.startswith('Check-in recorded') for message in messages) == MEMBERS
+    assert sum(message.startswith('Check-out recorded') for message in messages) == MEMBERS
+    assert not [message for message in messages if message.startswith('Error')]
+    store = open_storage(uri)
+    attendance = store.read('attendance')
+    assert len(attendance) == MEMBERS
+    assert not attendance.duplicated(['member_id', 'date']).any()
+    assert attendance['check_out'].notna().all()
+
+    # Every sale recorded once, with its stock, line items and totals
+    assert len(statuses) == WORKERS * THREADS * SALES and set(statuses) == {200}
+    sales = store.read('sales')
+    assert len(sales) == len(statuses)
+    assert sales['id'].is_unique
+    assert len(store.read('sale_items')) == len(sales)
+    assert store.find('inventory', {'id': 1})['servings'] == 1000 - 2 * len(sales)
+    assert len(store.read('stock_ledger')) == 0
+    rollups = store.find_all(sales_rollups.TABLE, {'dimension': 'day'})
+    assert rollups['sales'].astype(float).sum() == len(sales)
@@ -0,0 +1,131 @@
+"""Exports stream a table a chunk at a time."""
+import multiprocessing
+import resource
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from services.exports import iter_csv
+from storage.excel import ExcelStorage
+from storage.sqlite import SQLiteStorage
+
+
+ROWS = 20000
+CHUNK_ROWS = 1000
+# Peak traced memory of streaming a ROWS row export, about 1.3 MB when measured
+STREAM_PEAK_BYTES = 8 * 1024 * 1024
+# The export the request sized: a million rows, from SQLite, whose peak
+# resident size may not grow by more than this once the first chunks are out
+MILLION = 1000000
+MILLION_GROWTH_BYTES = 16 * 1024 * 1024
+
+
+def _sales(rows):
+    return pd.DataFrame({
+        'id': range(1, rows + 1),
+        'date': ['18-10-2026 10:00:00'] * rows,
+        'staff_name': ['bob'] * rows,
+        'total_amount': [10.0] * rows,
+        'payment_method': ['Cash'] * rows,
+        'items_details': ['[["R_1", {"name": "Whey", "quantity": 1}]]'] * rows,
+    })
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    """A journaled sales table: a large workbook plus appends, updates and deletes."""
+    data_dir = str(tmp_path_factory.mktemp('data'))
+    store = ExcelStorage(data_dir)
+    store.write('sales', _sales(ROWS))
+    store.append('sales', {'id': ROWS + 1, 'date': '18-10-2026 11:00:00', 'total_amount': 5.0})
+    store.update('sales', {'id': 3}, {'total_amount': 99.0})
+    store.delete('sales', {'id': 4})
+    store.update('sales', {'id': ROWS + 1}, {'staff_name': 'al'})
+    return data_dir
+
+
+def _peak(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _stream(store):
+    rows = 0
+    for piece in iter_csv(store.read_chunks('sales', chunk_rows=CHUNK_ROWS)):
+        rows += piece.count('\n')
+    return rows
+
+
+def _stream_rss(path):
+    """Stream the export in a fresh process; its rows and how far its peak
+    resident size grew after the first chunks (ru_maxrss is in KiB)."""
+    chunks = SQLiteStorage(path, seed_dir=None).read_chunks('sales', chunk_rows=CHUNK_ROWS)
+    rows, start = 0, None
+    for number, piece in enumerate(iter_csv(chunks)):
+        rows += piece.count('\n')
+        if number == 10:
+            start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rows, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start) * 1024
+
+
+@pytest.mark.parametrize('snapshots', [True, False], ids=['snapshot', 'workbook'])
+def test_chunks_match_read(data_dir, snapshots):
+    expected = ExcelStorage(data_dir, snapshots=snapshots).read('sales')
+    store = ExcelStorage(data_dir, snapshots=snapshots)
+    chunks = [chunk for chunk in store.read_chunks('sales', chunk_rows=CHUNK_ROWS) if len(chunk)]
+
+    assert max(len(chunk) for chunk in chunks) <= CHUNK_ROWS
+    # Chunk by chunk: the appended row's chunk has all-NA columns, which
+    # pandas no longer wants to see in a concat
+    start = 0
+    for chunk in chunks:
+        rows = expected.iloc[start:start + len(chunk)].reset_index(drop=True)
+        assert chunk.reset_index(drop=True).astype(str).equals(rows.astype(str))
+        start += len(chunk)
+    assert start == len(expected) == ROWS
+    assert expected.loc[expected['id'] == 3, 'total_amount'].item() == 99.0
+    assert chunks[-1].iloc[-1]['staff_name'] == 'al'
+
+
+@pytest.mark.parametrize('snapshots', [True, False], ids=['snapshot', 'workbook'])
+def test_export_memory_is_bounded(data_dir, snapshots):
+    def stream():
+        _stream(ExcelStorage(data_dir, snapshots=snapshots))
+
+    def whole():
+        store = ExcelStorage(data_dir, snapshots=snapshots)
+        for _ in iter_csv([store.read('sales')]):
+            pass
+
+    streamed = _peak(stream)
+    assert streamed < STREAM_PEAK_BYTES
+    assert streamed < _peak(whole) / 3
+
+
+def test_workbook_export_memory_does_not_grow_with_rows(tmp_path):
+    peaks = []
+    for rows in (ROWS // 2, ROWS * 2):
+        ExcelStorage(str(tmp_path / str(rows))).write('sales', _sales(rows))
+        store = ExcelStorage(str(tmp_path / str(rows)), snapshots=False)
+        peaks.append(_peak(lambda: _stream(store)))
+
+    # Four times the rows, about the same peak
+    assert peaks[1] < peaks[0] * 1.25
+    assert peaks[1] < STREAM_PEAK_BYTES
+
+
+def test_million_row_export_memory_is_bounded(tmp_path):
+    path = str(tmp_path / 'gym.db')
+    SQLiteStorage(path, seed_dir=None).write('sales', _sales(MILLION))
+
+    # Measured in a process of its own: building the table above already
+    # took this one's resident size far past what the export needs
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        rows, growth = pool.apply(_stream_rss, (path,))
+    assert rows == MILLION + 1
+    assert growth < MILLION_GROWTH_BYTES
@@ -0,0 +1,251 @@
+"""One sale or payment per idempotency key, however many workers send it."""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from helpers import client, run_workers
+from services.idempotency import TABLE, IdempotencyKeys, InProgress, KeyReused
+from storage import open_storage
+
+
+WORKERS = 4
+THREADS = 3
+CART = json.dumps([['R_1', {'name': 'Whey', 'quantity': 2, 'price': 15, 'subtotal': 30}]])
+SALE = {'payment_method': 'Cash', 'total_amount': 'Rs. 30', 'items': CART}
+PAYMENT = {'member_id': '1001', 'package_amount': '3000'}
+
+
+def _setup(app):
+    c = client(app)
+    c.post('/inventory/add', data={'stock_type': 'Whey', 'servings': '50', 'cost_per_serving': '10',
+                                   'profit_per_serving': '5', 'other_charges': '0'})
+    c.post('/packages/add', data={'name': 'Gold', 'price': '3000', 'duration': '1', 'trainers': 'y',
+                                  'cardio_access': 'y', 'sauna_access': 'n', 'steam_room': 'n',
+                                  'timings': 'all'})
+    c.post('/members/add', data={'name': 'M', 'phone': '1', 'address': 'a', 'dob': '2000-01-01',
+                                 'join_date': '2025-01-01', 'package': 'Gold'})
+
+
+def _send(app, path, data):
+    """POST ``data`` to ``path`` from several threads at once."""
+    responses = []
+    start = threading.Barrier(THREADS)
+
+    def send():
+        c = client(app)
+        start.wait()
+        response = c.post(path, data=data)
+        responses.append((response.status_code, response.headers.get('Location'),
+                          response.get_data(as_text=True),
+                          response.headers.get('Idempotent-Replayed')))
+
+    threads = [threading.Thread(target=send) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+def _claim(store, key, pid, claimed_at=None, ref=None):
+    store.append(TABLE, {'key': key, 'created_at': '18-10-2026 10:00:00', 'status': None,
+                         'response': None, 'pid': pid,
+                         'claimed_at': time.time() if claimed_at is None else claimed_at,
+                         'ref': ref})
+
+
+def _replayed_once(responses):
+    assert len(responses) == WORKERS * THREADS
+    assert len({response[:3] for response in responses}) == 1
+    assert sum(1 for response in responses if response[3] is None) == 1
+
+
+def test_sale_recorded_once_per_key(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    data = dict(SALE, idempotency_key='sale-1')
+    results = run_workers(str(tmp_path), uri, _send, [('/sales/add', data)] * WORKERS)
+
+    responses = [response for result in results for response in result]
+    _replayed_once(responses)
+    assert responses[0][0] == 200 and json.loads(responses[0][2])['success']
+
+    store = open_storage(uri)
+    sales = store.read('sales')
+    assert len(sales) == 1
+    lines = store.read('sale_items')
+    assert len(lines) == 1 and str(lines['sale_id'].iloc[0]) == str(sales['id'].iloc[0])
+    assert store.find('inventory', {'id': 1})['servings'] == 48
+    assert len(store.read('stock_ledger')) == 0
+    totals = store.find_all('sales_rollups', {'dimension': 'day'})
+    assert totals['sales'].astype(float).sum() == 1
+
+
+def test_payment_recorded_once_per_key(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    data = dict(PAYMENT, idempotency_key='pay-1')
+    results = run_workers(str(tmp_path), uri, _send, [('/mark_payment_as_paid', data)] * WORKERS)
+
+    responses = [response for result in results for response in result]
+    _replayed_once(responses)
+    assert responses[0][0] == 302 and responses[0][1].endswith('/payments')
+    assert len(open_storage(uri).find_all('payments', {'member_id': 1001})) == 1
+
+
+def _retry_dead_sale(app, pid):
+    # A worker that died after committing sale 1, and one that died before
+    # committing sale 99
+    store = app.store
+    _claim(store, 'add_sale:done', pid, ref='1')
+    _claim(store, 'add_sale:lost', pid, ref='99')
+    c = client(app)
+    done = c.post('/sales/add', data=dict(SALE, idempotency_key='done'))
+    lost = c.post('/sales/add', data=dict(SALE, idempotency_key='lost'))
+    return (done.status_code, done.get_json(), done.headers.get('Idempotent-Replayed'),
+            lost.status_code, lost.headers.get('Idempotent-Replayed'))
+
+
+def test_dead_claim_resolved_against_sales(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    run_workers(str(tmp_path), uri, _send, [('/sales/add', dict(SALE, idempotency_key='first'))])
+    done, body, replayed, lost, lost_replayed = run_workers(
+        str(tmp_path), uri, _retry_dead_sale, [(_dead_pid(),)])[0]
+
+    assert (done, body['success'], replayed) == (200, True, 'true')
+    assert (lost, lost_replayed) == (200, None)
+    store = open_storage(uri)
+    assert len(store.read('sales')) == 2
+    assert store.find('inventory', {'id': 1})['servings'] == 46
+
+
+@pytest.fixture
+def keys(uri):
+    keys = IdempotencyKeys(open_storage(uri), wait=0.3, stale=60)
+    keys.ensure()
+    return keys
+
+
+def test_claim_of_dead_worker_is_taken_over(keys):
+    _claim(keys.store, 'a', _dead_pid(), ref='7')
+    _claim(keys.store, 'b', _dead_pid())
+
+    assert keys.run('a', lambda: {'status': 500}, lambda ref: {'status': 200, 'ref': ref}) == \
+        ({'status': 200, 'ref': '7'}, True)
+    assert keys.run('b', lambda: {'status': 201}) == ({'status': 201}, False)
+    assert keys.run('b', lambda: {'status': 500}) == ({'status': 201}, True)
+    assert keys.stats()['takeovers'] == 2
+
+
+def test_claim_of_live_worker_is_in_progress(keys):
+    _claim(keys.store, 'a', os.getpid())
+    with pytest.raises(InProgress):
+        keys.run('a', lambda: {'status': 200})
+
+    # Older than any request may run: its worker is stuck, not running it
+    _claim(keys.store, 'b', os.getpid(), claimed_at=time.time() - 120)
+    assert keys.run('b', lambda: {'status': 200}) == ({'status': 200}, False)
+
+
+def test_mark_records_the_work_of_the_running_key(keys):
+    def handler():
+        keys.mark(42)
+        return {'status': 200}
+
+    keys.run('a', handler)
+    keys.mark(43)
+    assert str(keys.store.find(TABLE, {'key': 'a'})['ref']) == '42'
+
+
+def test_only_committed_work_is_kept(keys):
+    committed = set()
+
+    def resolve(ref):
+        return {'status': 200, 'ref': ref} if ref in committed else None
+
+    def fails_before_commit():
+        keys.mark(1)
+        return {'status': 500}
+
+    def fails_after_commit():
+        keys.mark(2)
+        committed.add('2')
+        return {'status': 500}
+
+    # Not committed: the key is given up and the retry runs
+    assert keys.run('a', fails_before_commit, resolve) == ({'status': 500}, False)
+    assert keys.store.find(TABLE, {'key': 'a'}) is None
+    assert keys.run('a', lambda: {'status': 400}, resolve) == ({'status': 400}, False)
+    # Committed, then failed: answered as committed from then on
+    assert keys.run('b', fails_after_commit, resolve) == ({'status': 200, 'ref': '2'}, False)
+    assert keys.run('b', fails_before_commit, resolve) == ({'status': 200, 'ref': '2'}, True)
+
+
+def test_key_reused_for_another_request(keys):
+    assert keys.run('a', lambda: {'status': 200}, fingerprint='cart-1') == ({'status': 200}, False)
+    assert keys.run('a', lambda: {'status': 500}, fingerprint='cart-1') == ({'status': 200}, True)
+    with pytest.raises(KeyReused):
+        keys.run('a', lambda: {'status': 200}, fingerprint='cart-2')
+    # Another worker, without the response in memory
+    other = IdempotencyKeys(keys.store)
+    with pytest.raises(KeyReused):
+        other.run('a', lambda: {'status': 200}, fingerprint='cart-2')
+
+
+def _sale_then_other_cart(app):
+    c = client(app)
+    first = c.post('/sales/add', data=dict(SALE, idempotency_key='k'))
+    other_cart = json.dumps([['R_1', {'name': 'Whey', 'quantity': 1, 'price': 15,
+                                      'subtotal': 15}]])
+    second = c.post('/sales/add', data=dict(SALE, items=other_cart, idempotency_key='k'))
+    # Out of stock is rejected before the commit, so the same key may run again
+    too_many = json.dumps([['R_1', {'name': 'Whey', 'quantity': 999, 'price': 15,
+                                    'subtotal': 15}]])
+    rejected = c.post('/sales/add', data=dict(SALE, items=too_many, idempotency_key='r'))
+    retried = c.post('/sales/add', data=dict(SALE, items=too_many, idempotency_key='r'))
+    return (first.status_code, second.status_code, rejected.status_code,
+            retried.status_code, retried.headers.get('Idempotent-Replayed'))
+
+
+def test_sale_key_with_other_cart_is_refused(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    result = run_workers(str(tmp_path), uri, _sale_then_other_cart, [()])[0]
+
+    assert result == (200, 422, 400, 400, None)
+    store = open_storage(uri)
+    assert len(store.read('sales')) == 1
+    assert store.find('inventory', {'id': 1})['servings'] == 48
+
+
+def _retry_dead_payment(app, pid):
+    # A worker that died after recording payment 1, and one that died before
+    # recording payment 99
+    _claim(app.store, 'mark_payment_as_paid:done', pid, ref='1')
+    _claim(app.store, 'mark_payment_as_paid:lost', pid, ref='99')
+    c = client(app)
+    done = c.post('/mark_payment_as_paid', data=dict(PAYMENT, idempotency_key='done'))
+    lost = c.post('/mark_payment_as_paid', data=dict(PAYMENT, idempotency_key='lost'))
+    return (done.headers.get('Idempotent-Replayed'), lost.headers.get('Idempotent-Replayed'))
+
+
+def test_dead_payment_claim_resolved_by_payment_id(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    run_workers(str(tmp_path), uri, _send, [('/mark_payment_as_paid',
+                                             dict(PAYMENT, idempotency_key='first'))])
+    # Another payment for the member in between does not confuse the check
+    run_workers(str(tmp_path), uri, _send, [('/mark_payment_as_paid',
+                                             dict(PAYMENT, idempotency_key='second'))])
+    replayed = run_workers(str(tmp_path), uri, _retry_dead_payment, [(_dead_pid(),)])[0]
+
+    assert replayed == ('true', None)
+    payments = open_storage(uri).find_all('payments', {'member_id': 1001})
+    assert sorted(payments['id'].astype(int)) == [1, 2, 3]
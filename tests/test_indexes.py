@@ -0,0 +1,44 @@
+"""Workbook lookups go through hash indexes that follow the journal."""
+import pandas as pd
+
+from storage.base import match_mask
+from storage.excel import ExcelStorage
+
+
+def _index_stats(store, name):
+    return store.stats()['indexes'][name]
+
+
+def test_lookups_match_a_scan_and_follow_the_journal(tmp_path):
+    store = ExcelStorage(str(tmp_path), snapshots=False)
+    store.write('attendance', pd.DataFrame({
+        'date': ['17-10-2026'] * 3 + ['18-10-2026'] * 3,
+        'member_id': [1001, 1002, 1003] * 2,
+        'check_in': ['09:00:00'] * 6,
+    }))
+    name = 'attendance(date, member_id)'
+
+    row = store.find('attendance', {'date': '18-10-2026', 'member_id': '1002'})
+    assert (row['date'], row['member_id']) == ('18-10-2026', 1002)
+    assert store.find('attendance', {'date': '18-10-2026', 'member_id': 1004}) is None
+    assert _index_stats(store, name) == {'keys': 6, 'builds': 1, 'extends': 0}
+
+    # Appends and updates of other columns only index the new rows
+    store.append('attendance', {'date': '18-10-2026', 'member_id': 1004, 'check_in': '10:00:00'})
+    store.update('attendance', {'date': '18-10-2026', 'member_id': 1001},
+                 {'check_out': '11:00:00'})
+    assert store.find('attendance', {'date': '18-10-2026', 'member_id': 1004}) is not None
+    assert store.find('attendance', {'date': '18-10-2026',
+                                     'member_id': 1001})['check_out'] == '11:00:00'
+    assert _index_stats(store, name)['builds'] == 1
+
+    # An update of an indexed column rebuilds
+    store.update('attendance', {'date': '17-10-2026', 'member_id': 1003}, {'member_id': 1005})
+    assert store.find('attendance', {'date': '17-10-2026', 'member_id': 1003}) is None
+    assert store.find('attendance', {'date': '17-10-2026', 'member_id': 1005}) is not None
+    assert _index_stats(store, name)['builds'] == 2
+
+    frame = store.read('attendance')
+    where = {'date': '18-10-2026', 'member_id': 1002}
+    pd.testing.assert_frame_equal(store.find_all('attendance', where),
+                                  frame[match_mask(frame, where)])
@@ -0,0 +1,91 @@
+"""Background jobs run once, hand back their files and survive dead workers."""
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from services.jobs import JobQueue
+
+
+def _queue(tmp_path, **kwargs):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), str(tmp_path / 'results'), poll_interval=0.05,
+                     **kwargs)
+    queue.register('echo', _echo)
+    queue.register('broken', _broken)
+    return queue
+
+
+def _echo(args, path):
+    with open(path, 'w') as handle:
+        handle.write(args['text'])
+    return f"{args['text']}.txt", 'text/plain'
+
+
+def _broken(args, path):
+    raise ValueError('no such month')
+
+
+def _wait(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} did not finish: {queue.status(job_id)}')
+
+
+def test_job_runs_and_hands_back_its_file(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.submit('echo', {'text': 'hello'})
+
+    assert _wait(queue, job_id)['has_result']
+    path, download_name, mimetype = queue.result(job_id)
+    assert open(path).read() == 'hello'
+    assert (download_name, mimetype) == ('hello.txt', 'text/plain')
+
+    failed = _wait(queue, queue.submit('broken'))
+    assert (failed['status'], failed['error']) == ('failed', 'no such month')
+    assert queue.result(failed['id']) is None
+    assert queue.status('missing') is None
+
+
+def test_unique_job_is_queued_once(tmp_path, monkeypatch):
+    queue = _queue(tmp_path)
+    # Without worker threads the jobs stay queued
+    monkeypatch.setattr(queue, 'start', lambda: None)
+    first = queue.submit('echo', {'text': 'a'}, unique=True)
+    assert queue.submit('echo', {'text': 'a'}, unique=True) == first
+    assert queue.submit('echo', {'text': 'b'}, unique=True) != first
+    assert queue.submit('echo', {'text': 'a'}) != first
+
+
+def test_job_of_a_dead_worker_runs_again(tmp_path):
+    dead = multiprocessing.get_context('spawn').Process(target=time.sleep, args=(0,))
+    dead.start()
+    dead.join()
+    queue = _queue(tmp_path)
+    conn = sqlite3.connect(queue.path)
+    conn.execute("INSERT INTO jobs (id, kind, args, status, submitted_at, started_at, pid) "
+                 "VALUES ('left', 'echo', '{\"text\": \"again\"}', 'running', ?, ?, ?)",
+                 (time.time(), time.time(), dead.pid))
+    conn.commit()
+    conn.close()
+
+    queue.start()
+    assert _wait(queue, 'left')['status'] == 'done'
+    assert open(queue.result('left')[0]).read() == 'again'
+
+
+def test_prune_removes_old_results(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, result_max_age=0)
+    # Run the job here: the worker threads would prune it themselves
+    monkeypatch.setattr(queue, 'start', lambda: None)
+    job_id = queue.submit('echo', {'text': 'old'})
+    queue._run(queue._claim())
+    path = queue.result(job_id)[0]
+
+    assert queue.prune() == 1
+    assert queue.status(job_id) is None
+    assert queue.result(job_id) is None
+    assert not os.path.exists(path)
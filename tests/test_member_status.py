@@ -0,0 +1,101 @@
+"""Renewal lookups cost what they return once the day is rolled forward."""
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from services import member_status
+from storage import open_storage
+
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+
+def test_expiring_with_nobody_due_does_not_scan_members(uri, monkeypatch):
+    store = open_storage(uri)
+    store.write('packages', pd.DataFrame({'name': ['Gold'], 'price': [3000.0], 'duration': [1]}))
+    store.init_table('members', ['member_id', 'name', 'package', 'expiry_date',
+                                 'payment_status'])
+    store.init_table('payments', ['member_id', 'member_name', 'package', 'date', 'amount'])
+    for number in range(3):
+        store.append('members', {'member_id': 1001 + number, 'name': f'M{number}',
+                                 'package': 'Gold'})
+        # Paid months ago: expired, so nobody is due for renewal
+        store.append('payments', {'member_id': 1001 + number, 'member_name': f'M{number}',
+                                  'package': 'Gold', 'date': '01-01-2026', 'amount': 3000.0})
+    member_status.rebuild(store, datetime(2026, 10, 17))
+
+    assert member_status.expiring(store, 7, NOW) == ([], [])
+    assert len(store.read(member_status.RENEWALS)) == 0
+
+    read = []
+    inner_read = store.read
+
+    def logged_read(table, columns=None):
+        read.append(table)
+        return inner_read(table, columns)
+
+    monkeypatch.setattr(store, 'read', logged_read)
+    assert member_status.expiring(store, 7, NOW) == ([], [])
+    assert member_status.TABLE not in read and 'members' not in read
+
+    # A payment today puts the member in the window, without a roll-forward
+    store.append('payments', {'member_id': 1001, 'member_name': 'M0', 'package': 'Gold',
+                              'date': '20-09-2026', 'amount': 3000.0})
+    member_status.record_payment(store, {'member_id': 1001, 'member_name': 'M0',
+                                         'package': 'Gold', 'date': '20-09-2026',
+                                         'amount': 3000.0}, NOW)
+    expired, expiring = member_status.expiring(store, 7, NOW)
+    assert expired == [] and [row['member_id'] for row in expiring] == [1001]
+    assert member_status.TABLE not in read
+
+
+def test_payment_updates_member_without_rewriting_members(tmp_path):
+    store = open_storage(f'excel:///{tmp_path}/data')
+    store.write('packages', pd.DataFrame({'name': ['Gold'], 'price': [3000.0], 'duration': [1]}))
+    store.write('members', pd.DataFrame({'member_id': range(1001, 1021),
+                                         'name': ['A'] + [f'M{n}' for n in range(19)],
+                                         'package': 'Gold', 'expiry_date': None,
+                                         'payment_status': 'Pending'}))
+    store.init_table('payments', ['member_id', 'member_name', 'package', 'date', 'amount'])
+    member_status.rebuild(store, NOW)
+    workbook = store.store.path('members')
+    stamp = os.stat(workbook).st_mtime_ns, os.stat(workbook).st_ino
+
+    member_status.record_payment(store, {'member_id': 1001, 'member_name': 'A', 'package': 'Gold',
+                                         'date': '10-10-2026', 'amount': 3000.0}, NOW)
+
+    assert (os.stat(workbook).st_mtime_ns, os.stat(workbook).st_ino) == stamp
+    member = store.find('members', {'member_id': 1001})
+    assert (member['expiry_date'], member['payment_status']) == ('10-11-2026', 'Paid')
+    # A day's roll-forward changes one member's row, not the whole table
+    member_status.roll_forward(store, datetime(2026, 11, 10, 9, 0))
+    assert (os.stat(workbook).st_mtime_ns, os.stat(workbook).st_ino) == stamp
+    assert store.find('members', {'member_id': 1001})['payment_status'] == 'Pending'
+
+
+def test_payments_page_lists_each_members_latest_payment(uri):
+    store = open_storage(uri)
+    store.write('packages', pd.DataFrame({'name': ['Gold', 'Silver'], 'price': [3000.0, 2000.0],
+                                          'duration': [1, 3]}))
+    store.write('members', pd.DataFrame({'member_id': range(1001, 1006),
+                                         'name': ['A', 'B', 'C', 'D', 'E'],
+                                         'package': ['Gold', 'Gold', 'Gold', 'Silver', 'Silver'],
+                                         'expiry_date': None, 'payment_status': 'Pending'}))
+    store.write('payments', pd.DataFrame({
+        'member_id': [1001, 1005, 1002, 1003, 1001],
+        'member_name': ['A', 'E', 'B', 'C', 'A'],
+        'package': ['Gold', 'Silver', 'Platinum', 'Gold', 'Gold'],
+        'date': ['01-08-2026', '01-09-2026', '10-10-2026', None, '01-10-2026'],
+        'amount': [3000.0, 2000.0, 5000.0, 3000.0, 3000.0],
+    }))
+    member_status.rebuild(store, NOW)
+
+    rows = {row['member_id']: row for row in member_status.payment_rows(store, NOW)}
+    # An unknown package or a missing date leaves the member out
+    assert list(rows) == [1001, 1004, 1005]
+    assert (rows[1001]['date'], rows[1001]['remaining_days'], rows[1001]['status']) == (
+        '01-10-2026', 13, 'Paid')
+    assert (rows[1004]['date'], rows[1004]['amount'], rows[1004]['status']) == (
+        '18-10-2026', 2000.0, 'Pending')
+    assert (rows[1005]['remaining_days'], rows[1005]['status']) == (43, 'Paid')
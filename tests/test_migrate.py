@@ -0,0 +1,75 @@
+"""Migrated tables are verified by row count and checksum."""
+from datetime import datetime
+
+import pandas as pd
+
+from storage import migrate, open_storage
+from storage.excel import ExcelStorage
+
+
+def _source(path):
+    source = ExcelStorage(str(path), snapshots=False)
+    source.write('members', pd.DataFrame({
+        'member_id': [1001, 1002, 1003, 'x'],
+        'name': ['A', 'B', 'C', 'Bad'],
+        'join_date': ['01-09-2026', '2026-09-02', datetime(2026, 9, 3), '04-09-2026'],
+    }))
+    source.write('sales', pd.DataFrame({
+        'id': range(1, 8),
+        'date': ['18-10-2026 10:00:00'] * 7,
+        'total_amount': [10.0] * 7,
+    }))
+    # Pending journal records are folded in before the copy
+    source.append('sales', {'id': 8, 'date': '2026-10-18 11:00:00', 'total_amount': 5.0})
+    return str(path)
+
+
+def test_copy_is_counted_and_checksummed(uri, tmp_path):
+    data_dir = _source(tmp_path / 'source')
+    migrate.compact_journals(data_dir)
+    target = open_storage(uri, seed=False)
+    tables = migrate.source_tables(data_dir)
+
+    sales = migrate.migrate_table('sales', tables['sales'], target, batch_rows=3)
+    assert sales.ok and (sales.rows, sales.inserted, sales.target_rows) == (8, 8, 8)
+    assert sales.target_checksum == sales.checksum
+    assert target.find('sales', {'id': 8})['date'] == '18-10-2026 11:00:00'
+
+    members = migrate.migrate_table('members', tables['members'], target)
+    assert not members.ok and members.target_checksum == members.checksum
+    assert (members.rows, members.inserted, len(members.rejected)) == (4, 3, 1)
+    assert 'member_id must be a number' in members.rejected[0]
+    assert members.dates_normalized == 2
+    assert list(target.read('members')['join_date']) == ['01-09-2026', '02-09-2026',
+                                                          '03-09-2026']
+
+    # A table that already has rows is left alone unless replaced
+    assert migrate.migrate_table('sales', tables['sales'], target).skipped
+    assert migrate.migrate_table('sales', tables['sales'], target, replace=True).ok
+
+
+def test_altered_copy_is_a_mismatch(uri, tmp_path, monkeypatch):
+    data_dir = _source(tmp_path / 'source')
+    target = open_storage(uri, seed=False)
+    append_many = target.append_many
+
+    def altering_append_many(table, rows):
+        rows[0] = dict(rows[0], total_amount=11.0)
+        return append_many(table, rows)
+
+    monkeypatch.setattr(target, 'append_many', altering_append_many)
+    report = migrate.migrate_table('sales', migrate.source_tables(data_dir)['sales'], target)
+    assert report.target_rows == report.inserted
+    assert report.target_checksum != report.checksum and not report.ok
+
+
+def test_command_fails_on_rejected_rows(tmp_path, capsys):
+    data_dir = _source(tmp_path / 'source')
+    target_uri = f"sqlite:///{tmp_path / 'gym.db'}"
+
+    assert migrate.main([data_dir, target_uri]) == 1
+    output = capsys.readouterr().out
+    assert 'rows rejected' in output and 'row 5: member_id must be a number' in output
+
+    ExcelStorage(data_dir, snapshots=False).delete('members', {'name': 'Bad'})
+    assert migrate.main(['--replace', data_dir, target_uri]) == 0
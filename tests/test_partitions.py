@@ -0,0 +1,44 @@
+"""Month partitions read only what a request needs."""
+import pandas as pd
+
+from storage import open_storage
+
+
+def test_tail_reads_newest_partitions(uri, monkeypatch):
+    store = open_storage(uri)
+    store.init_table('sales', ['id', 'date', 'total_amount'])
+    store.append_many('sales', [{'id': number, 'date': f'{day:02d}-{month:02d}-2026 10:00:00',
+                                 'total_amount': 10.0}
+                                for number, (month, day) in enumerate(
+                                    [(month, day) for month in (7, 8, 9, 10)
+                                     for day in range(1, 7)], 1)])
+    expected = store.read('sales').tail(10).reset_index(drop=True)
+
+    read = []
+    inner_read = store.store.read
+
+    def logged_read(table, columns=None):
+        read.append(table)
+        return inner_read(table, columns)
+
+    monkeypatch.setattr(store.store, 'read', logged_read)
+    recent = store.tail('sales', 10)
+
+    pd.testing.assert_frame_equal(recent, expected)
+    assert list(recent['id']) == list(range(15, 25))
+    assert read == ['sales/2026-10', 'sales/2026-09']
+
+
+def test_undated_rows_are_oldest(uri):
+    store = open_storage(uri)
+    store.init_table('sales', ['id', 'date', 'total_amount'])
+    store.append_many('sales', [{'id': 1, 'date': '01-09-2026 10:00:00', 'total_amount': 1.0},
+                                {'id': 2, 'date': 'unknown', 'total_amount': 2.0},
+                                {'id': 3, 'date': '01-10-2026 10:00:00', 'total_amount': 3.0},
+                                {'id': 4, 'date': '', 'total_amount': 4.0}])
+
+    assert store.partitions('sales') == ['undated', '2026-09', '2026-10']
+    assert list(store.read('sales')['id']) == [2, 4, 1, 3]
+    assert list(store.tail('sales', 1)['id']) == [3]
+    assert list(store.tail('sales', 2)['id']) == [1, 3]
+    assert store.find('sales', {'total_amount': 3.0})['id'] == 3
@@ -0,0 +1,71 @@
+"""Closed months keep only their totals, and are recomputed after a restore."""
+import json
+from datetime import datetime
+
+import pytest
+
+from services import reports
+from services.backups import BackupEngine
+from services.reports import ReportCache
+from storage import open_storage
+
+
+NOW = datetime(2026, 10, 18)
+
+
+def _payment(store, payment_id, date, amount):
+    store.append('payments', {'id': payment_id, 'member_id': 1001, 'amount': amount,
+                              'date': date})
+
+
+@pytest.fixture
+def store(uri):
+    store = open_storage(uri)
+    store.init_table('payments', ['id', 'member_id', 'amount', 'date'])
+    for number in range(5):
+        _payment(store, number + 1, f'0{number + 1}-09-2026', 100)
+    _payment(store, 6, '01-08-2026', 50)
+    return store
+
+
+def test_closed_month_caches_totals_not_rows(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(reports, 'PAGE_ROWS', 2)
+    cache = ReportCache(store, str(tmp_path / 'reports'))
+    report = cache.month('2026-09', now=NOW)
+
+    assert report.totals['monthly_revenue'] == 500
+    assert report.counts['Payments'] == 5 and report.pages('Payments') == 3
+    assert [row['id'] for row in report.records('Payments', 3)] == [5]
+    with open(cache.path('2026-09'), encoding='utf-8') as handle:
+        saved = json.load(handle)
+    assert 'sheets' not in saved and saved['counts']['Payments'] == 5
+
+    # Served from memory, then from the file by another worker
+    assert cache.month('2026-09', now=NOW).totals == report.totals
+    other = ReportCache(store, cache.cache_dir)
+    assert other.month('2026-09', now=NOW).totals == report.totals
+    assert (cache.hits, cache.builds, other.loads, other.builds) == (1, 1, 1, 0)
+
+
+def test_cache_keeps_recent_months(store, tmp_path):
+    cache = ReportCache(store, str(tmp_path / 'reports'), max_months=2)
+    for month in ['2026-06', '2026-07', '2026-08', '2026-09']:
+        cache.month(month, now=NOW)
+    assert cache.stats()['months'] == ['2026-08', '2026-09']
+
+
+def test_restore_invalidates_closed_months(store, tmp_path):
+    engine = BackupEngine(store, str(tmp_path / 'backups'), ['payments'])
+    name = engine.backup(full=True)['name']
+    cache = ReportCache(store, str(tmp_path / 'reports'))
+    other = ReportCache(store, cache.cache_dir)
+    assert cache.month('2026-09', now=NOW).totals['monthly_revenue'] == 500
+
+    _payment(store, 7, '20-09-2026', 25)
+    assert cache.month('2026-09', now=NOW).totals['monthly_revenue'] == 525
+    assert other.month('2026-09', now=NOW).totals['monthly_revenue'] == 525
+
+    engine.restore(name)
+    assert cache.month('2026-09', now=NOW).totals['monthly_revenue'] == 500
+    assert other.month('2026-09', now=NOW).totals['monthly_revenue'] == 500
+    assert cache.month('2026-08', now=NOW).totals['monthly_revenue'] == 50
@@ -0,0 +1,74 @@
+"""Sale lines live in their own month-partitioned table."""
+import json
+from datetime import date
+
+import pandas as pd
+
+from services import sale_items
+from storage import open_storage
+
+
+WHEY = {'name': 'Whey', 'quantity': 2, 'price': 15, 'total': 30}
+SHAKE = {'name': 'Shake', 'quantity': 1, 'price': 50, 'total': 50}
+
+
+def _legacy_sale(sale_id, when, items):
+    return {'id': sale_id, 'date': when, 'total_amount': sum(item['total'] for item in items),
+            'items_details': json.dumps(items)}
+
+
+def _store(uri):
+    store = open_storage(uri)
+    store.write('inventory', pd.DataFrame({'id': [7], 'stock_type': ['Whey'], 'servings': [10.0]}))
+    store.write('custom_products', pd.DataFrame({'product_id': [1001], 'product_name': ['Shake'],
+                                                 'ingredients': ['[]']}))
+    store.init_table('sales', ['id', 'date', 'total_amount', 'items_details'])
+    return store
+
+
+def test_backfill_copies_legacy_lines_once(uri):
+    store = _store(uri)
+    store.append_many('sales', [_legacy_sale(1, '30-09-2026 18:00:00', [WHEY, SHAKE]),
+                                _legacy_sale(2, '01-10-2026 09:00:00', [WHEY])])
+
+    assert sale_items.ensure(store) == 3
+    assert sale_items.backfill(store) == 0
+    assert store.partitions(sale_items.TABLE) == ['2026-09', '2026-10']
+    lines = store.find_all(sale_items.TABLE, {'sale_id': 1})
+    assert list(zip(lines['item_kind'], lines['item_id'], lines['subtotal'])) == [
+        ('R', 7, 30.0), ('C', 1001, 50.0)]
+
+    # A sale added before the next backfill is read from its JSON
+    store.append('sales', _legacy_sale(3, '02-10-2026 09:00:00', [SHAKE]))
+    sale = store.find('sales', {'id': 3})
+    assert sale_items.receipt_items(store, sale) == [SHAKE]
+    assert sale_items.backfill(store) == 1
+    assert sale_items.receipt_items(store, sale) == [
+        {'name': 'Shake', 'quantity': 1.0, 'price': 50.0, 'total': 50.0}]
+
+
+def test_new_sale_lines_and_reading_a_date_range(uri, monkeypatch):
+    store = _store(uri)
+    sale_items.ensure(store)
+    cart = [['R_7', {'name': 'Whey', 'quantity': 2, 'price': 15, 'subtotal': 30}],
+            ['C_1001', {'name': 'Shake', 'quantity': 1, 'price': 50, 'subtotal': 50}]]
+    for sale_id, when in enumerate(['15-08-2026 10:00:00', '30-09-2026 10:00:00',
+                                    '01-10-2026 10:00:00'], 1):
+        lines = sale_items.line_items({'id': sale_id, 'date': when}, cart)
+        store.append_many(sale_items.TABLE, lines)
+    assert lines[1] == {'sale_id': 3, 'date': '01-10-2026 10:00:00', 'item_kind': 'C',
+                        'item_id': 1001, 'name': 'Shake', 'quantity': 1.0, 'unit_price': 50.0,
+                        'subtotal': 50.0}
+
+    read = []
+    inner_read = store.read_partition
+
+    def logged_read(table, key, columns=None):
+        read.append(key)
+        return inner_read(table, key, columns)
+
+    monkeypatch.setattr(store, 'read_partition', logged_read)
+    lines = sale_items.items_between(store, date(2026, 9, 30), date(2026, 10, 31))
+    assert read == ['2026-09', '2026-10']
+    assert list(lines['sale_id']) == [2, 2, 3, 3]
+    assert lines.groupby('name')['subtotal'].sum().to_dict() == {'Shake': 100.0, 'Whey': 60.0}
@@ -0,0 +1,25 @@
+"""Written rows are converted to their declared column types."""
+import pytest
+
+from storage import open_storage
+from storage.schema import SchemaError
+
+
+def test_bad_receptionist_age_is_refused(uri):
+    store = open_storage(uri)
+    store.init_table('receptionists', ['username', 'name', 'age', 'salary'])
+    store.append('receptionists', {'username': 'ali', 'name': 'Ali', 'age': '31',
+                                   'salary': '25000'})
+
+    with pytest.raises(SchemaError, match='age must be a number'):
+        store.append('receptionists', {'username': 'sara', 'name': 'Sara', 'age': 'thirty'})
+    with pytest.raises(SchemaError, match='age must be a number'):
+        store.update('receptionists', {'username': 'ali'}, {'age': '31.5'})
+    with pytest.raises(SchemaError, match='username is required'):
+        store.append('receptionists', {'username': None, 'name': 'Nobody', 'age': 20})
+
+    receptionists = store.read('receptionists')
+    assert list(receptionists['username']) == ['ali']
+    assert str(receptionists['age'].dtype) == 'int64'
+    assert store.find('receptionists', {'username': 'ali'})['age'] == 31
+    assert receptionists['salary'].tolist() == [25000.0]
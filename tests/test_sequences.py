@@ -0,0 +1,52 @@
+"""IDs come from sequences shared by every worker, not from reading the table."""
+import pandas as pd
+
+from helpers import client, run_workers
+from storage import open_storage
+
+
+WORKERS = 4
+MEMBERS = 10
+
+
+def _setup(app):
+    client(app).post('/packages/add', data={'name': 'Gold', 'price': '3000', 'duration': '1',
+                                            'trainers': 'y', 'cardio_access': 'y',
+                                            'sauna_access': 'n', 'steam_room': 'n',
+                                            'timings': 'all'})
+
+
+def _add_members(app, worker):
+    c = client(app)
+    for number in range(MEMBERS):
+        c.post('/members/add', data={'name': f'W{worker}M{number}', 'phone': '1',
+                                     'address': 'a', 'dob': '2000-01-01',
+                                     'join_date': '2025-01-01', 'package': 'Gold'})
+
+
+def test_workers_never_hand_out_the_same_id(uri, tmp_path):
+    run_workers(str(tmp_path), uri, _setup, [()])
+    run_workers(str(tmp_path), uri, _add_members, [(worker,) for worker in range(WORKERS)])
+
+    members = open_storage(uri).read('members')
+    assert len(members) == WORKERS * MEMBERS
+    assert sorted(members['member_id']) == list(range(1001, 1001 + WORKERS * MEMBERS))
+
+
+def test_blocks_stay_unique_and_seed_from_existing_rows(uri, monkeypatch):
+    first = open_storage(uri, id_block_size=5)
+    first.write('members', pd.DataFrame({'member_id': [1001, 1500], 'name': ['A', 'B']}))
+    second = open_storage(uri, id_block_size=5)
+
+    ids = [store.next_id('members', 'member_id', start=1001)
+           for _ in range(4) for store in (first, second)]
+    assert ids == [1501, 1506, 1502, 1507, 1503, 1508, 1504, 1509]
+
+    # Once seeded the sequence is all that is read
+    def no_read(table, columns=None):
+        raise AssertionError(f'{table} was read')
+
+    monkeypatch.setattr(first, 'read', no_read)
+    monkeypatch.setattr(first.store, 'read', no_read)
+    ids = [first.next_id('members', 'member_id', start=1001) for _ in range(3)]
+    assert ids == [1505, 1511, 1512]
@@ -0,0 +1,39 @@
+"""SQLite lookups stay indexed whichever worker rewrites a table."""
+import sqlite3
+
+import pandas as pd
+
+from storage.sqlite import SQLiteStorage, quote
+
+
+MEMBERS = pd.DataFrame({'member_id': range(1001, 1201), 'name': [f'M{n}' for n in range(200)]})
+
+
+def _plan(store, table, column):
+    # A new connection each time: a cached EXPLAIN would not see other
+    # connections' schema changes
+    conn = sqlite3.connect(store.path)
+    try:
+        rows = conn.execute(
+            f'EXPLAIN QUERY PLAN SELECT * FROM {quote(table)} WHERE {quote(column)} IN (?, ?)',
+            ('1100', 1100)).fetchall()
+    finally:
+        conn.close()
+    return ' '.join(row[-1] for row in rows)
+
+
+def test_lookup_indexed_after_other_worker_rewrites(tmp_path):
+    path = str(tmp_path / 'gym.db')
+    writer = SQLiteStorage(path, seed_dir=None)
+    reader = SQLiteStorage(path, seed_dir=None)
+    writer.write('members', MEMBERS)
+    assert reader.find('members', {'member_id': 1100})['name'] == 'M99'
+    assert 'ix_members__member_id' in _plan(reader, 'members', 'member_id')
+
+    # The rewrite drops the index the reader created
+    writer.write('members', MEMBERS.assign(name='x'))
+    assert 'ix_members__member_id' not in _plan(reader, 'members', 'member_id')
+
+    assert reader.find('members', {'member_id': 1100})['name'] == 'x'
+    assert 'ix_members__member_id' in _plan(reader, 'members', 'member_id')
+    assert len(reader.find_all('members', {'name': 'x'})) == 200
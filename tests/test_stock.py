@@ -0,0 +1,116 @@
+"""Carts expand through the compiled bills of materials into stock taken."""
+import json
+
+import pandas as pd
+import pytest
+
+from services import sale_items, sales_rollups
+from services.bom import BillsOfMaterials
+from services.stock import OutOfStock, StockLedger
+from storage import open_storage
+
+
+SHAKE = json.dumps([{'id': 1, 'name': 'Whey', 'quantity': 2, 'price': 15},
+                    {'id': 2, 'name': 'Oats', 'quantity': 0.5, 'price': 4}])
+
+
+def _ledger(uri):
+    store = open_storage(uri)
+    store.write('inventory', pd.DataFrame({'id': [1, 2], 'stock_type': ['Whey', 'Oats'],
+                                           'servings': [100.0, 10.0]}))
+    store.write('custom_products', pd.DataFrame({'product_id': [1001], 'product_name': ['Shake'],
+                                                 'ingredients': [SHAKE]}))
+    store.init_table('sales', ['id', 'date', 'total_amount', 'items_details'])
+    sale_items.ensure(store)
+    sales_rollups.ensure(store)
+    ledger = StockLedger(store, BillsOfMaterials(store))
+    ledger.ensure()
+    return store, ledger
+
+
+def _sell(ledger, sale_id, items):
+    sale = {'id': sale_id, 'date': '18-10-2026 10:00:00', 'total_amount': 0.0,
+            'items_details': json.dumps(items)}
+    return ledger.sell(sale, items, [])
+
+
+def test_cart_expands_into_servings_per_item(uri):
+    store, ledger = _ledger(uri)
+    boms = ledger.boms
+    cart = [['R_1', {'name': 'Whey', 'quantity': 1}],
+            ['C_1001', {'name': 'Shake', 'quantity': 3}]]
+
+    assert boms.expand(cart) == {'1': (7.0, 'Whey'), '2': (1.5, 'ingredient in Shake')}
+    assert boms.expand([]) == {}
+    with pytest.raises(KeyError):
+        boms.expand([['C_1002', {'name': 'Gone', 'quantity': 1}]])
+    assert boms.compiles == 1
+
+    # An edited product is compiled again, once
+    store.update('custom_products', {'product_id': 1001},
+                 {'ingredients': json.dumps([{'id': 2, 'name': 'Oats', 'quantity': 1}])})
+    for _ in range(2):
+        assert boms.expand(cart) == {'1': (1.0, 'Whey'), '2': (3.0, 'ingredient in Shake')}
+    assert boms.compiles == 2
+
+
+def test_sale_takes_stock_all_or_nothing(uri):
+    store, ledger = _ledger(uri)
+    shakes = [['C_1001', {'name': 'Shake', 'quantity': 4}]]
+
+    assert _sell(ledger, 1, shakes) == {'1': 92.0, '2': 8.0}
+    assert store.find('inventory', {'id': 1})['servings'] == 92.0
+    assert store.find('inventory', {'id': 2})['servings'] == 8.0
+    assert list(store.read('sales')['id']) == [1]
+    assert len(store.read('stock_ledger')) == 0
+
+    # Whey would last, oats would not: nothing is taken
+    with pytest.raises(OutOfStock, match='Insufficient stock for ingredient in Shake'):
+        _sell(ledger, 2, [['R_1', {'name': 'Whey', 'quantity': 1}],
+                          ['C_1001', {'name': 'Shake', 'quantity': 20}]])
+    with pytest.raises(OutOfStock, match='Custom product 1002 not found'):
+        _sell(ledger, 3, [['C_1002', {'name': 'Gone', 'quantity': 1}]])
+    assert store.find('inventory', {'id': 1})['servings'] == 92.0
+    assert store.find('inventory', {'id': 2})['servings'] == 8.0
+    assert list(store.read('sales')['id']) == [1]
+
+
+def _crash_after_commit(ledger, monkeypatch):
+    def crash(entry, fresh=False):
+        raise SystemExit('worker killed')
+
+    monkeypatch.setattr(ledger, '_apply', crash)
+
+
+def test_committed_sale_is_applied_after_a_crash(uri, monkeypatch):
+    store, ledger = _ledger(uri)
+    _crash_after_commit(ledger, monkeypatch)
+    with pytest.raises(SystemExit):
+        _sell(ledger, 1, [['R_1', {'name': 'Whey', 'quantity': 10}]])
+
+    # The ledger row is the commit: the sale happened, but is not applied
+    assert ledger.committed(1)
+    assert store.find('inventory', {'id': 1})['servings'] == 100.0
+    assert len(store.read('sales')) == 0
+
+    restarted = StockLedger(store, BillsOfMaterials(store))
+    assert restarted.recover() == 1
+    assert restarted.recover() == 0
+    assert store.find('inventory', {'id': 1})['servings'] == 90.0
+    assert list(store.read('sales')['id']) == [1]
+    assert len(store.read('stock_ledger')) == 0
+
+
+def test_next_sale_of_an_item_applies_its_pending_sale(uri, monkeypatch):
+    store, ledger = _ledger(uri)
+    _crash_after_commit(ledger, monkeypatch)
+    with pytest.raises(SystemExit):
+        _sell(ledger, 1, [['C_1001', {'name': 'Shake', 'quantity': 2}]])
+
+    other = StockLedger(store, BillsOfMaterials(store))
+    # Oats only: the pending shake sale took oats too, so it goes first
+    assert _sell(other, 2, [['R_2', {'name': 'Oats', 'quantity': 1}]]) == {'2': 8.0}
+    assert other.recovered == 1
+    assert store.find('inventory', {'id': 1})['servings'] == 96.0
+    assert sorted(store.read('sales')['id']) == [1, 2]
+    assert len(store.read('stock_ledger')) == 0